@@ -0,0 +1,83 @@
+'''
+Benchmark of the format in which point clouds are handed over to PoissonRecon: ASCII vs. binary (little endian) PLY.
+For every sample model both files are written with Open3D and reconstructed with PoissonRecon at a low depth, so that
+reading the input is a large part of the reconstruction. Reported are the time to write the file, its size, the time
+PoissonRecon needs to read the points into the tree and its total wall time.
+    python benchmarks/ply_format.py [point clouds or meshes] [--depth 6] [--repeat 3]
+Without files, all .ply files in models/ are used.
+'''
+
+import argparse
+import glob
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import open3d as o3d
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.PoissonReconstruction import get_poisson_executable
+from src.Settings import Settings
+
+
+def time_poisson(executable, input_file, output_file, depth):
+    '''
+    :return: tuple (wall time, time to read the input as reported by PoissonRecon --verbose or None)
+    '''
+    command = [executable, "--in", input_file, "--out", output_file, "--depth", str(depth), "--color", "16",
+               "--verbose"]
+    start = time.time()
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    wall_time = time.time() - start
+    match = re.search(r"# Read input into tree:\s*([\d.]+) \(s\)", result.stdout)
+    return wall_time, float(match.group(1)) if match else None
+
+
+def benchmark(executable, model, depth, repeat, tmp_dir):
+    cloud = o3d.io.read_point_cloud(model)
+    if not cloud.has_normals():
+        cloud.estimate_normals()
+    if not cloud.has_colors():
+        cloud.paint_uniform_color([1.0, 0, 0])
+    print("{}: {} points".format(os.path.basename(model), len(cloud.points)))
+
+    for name, write_ascii in (("ascii", True), ("binary", False)):
+        path = os.path.join(tmp_dir, "input_{}.ply".format(name))
+        write_times, read_times, wall_times = [], [], []
+        for _ in range(repeat):
+            start = time.time()
+            o3d.io.write_point_cloud(path, cloud, write_ascii=write_ascii, compressed=False)
+            write_times.append(time.time() - start)
+            wall_time, read_time = time_poisson(executable, path, os.path.join(tmp_dir, "mesh"), depth)
+            wall_times.append(wall_time)
+            if read_time is not None:
+                read_times.append(read_time)
+        read = "{:.2f} s".format(min(read_times)) if read_times else "?"
+        print("   {:6}  write {:.2f} s  size {:8.1f} MB  PoissonRecon read {}  total {:.2f} s".format(
+            name, min(write_times), os.path.getsize(path) / (1 << 20), read, min(wall_times)))
+
+
+def main():
+    main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Compare ASCII and binary PLY as input of PoissonRecon.")
+    parser.add_argument("models", nargs="*", help="point clouds or meshes (default: all .ply files in models/)")
+    parser.add_argument("--depth", type=int, default=6, help="reconstruction depth (default: 6)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per format, the fastest is reported (default: 3)")
+    args = parser.parse_args()
+
+    executable = get_poisson_executable(Settings(main_dir, platform.system()))
+    if executable is None:
+        return 1
+    models = args.models or sorted(glob.glob(os.path.join(main_dir, "models", "**", "*.ply"), recursive=True))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for model in models:
+            benchmark(executable, model, args.depth, args.repeat, tmp_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
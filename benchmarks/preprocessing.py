@@ -0,0 +1,92 @@
+'''
+Benchmark of the preprocessing (outlier removal and voxel downsampling, see src/Preprocessing.py). Every point cloud is
+reconstructed with PoissonRecon from the raw points and from the preprocessed points. Reported are the number of points,
+the wall time and peak memory of PoissonRecon and the distance between both meshes (mean and maximum distance of points
+sampled on the mesh of the preprocessed points to the mesh of the raw points, relative to the size of the model). The
+time PoissonRecon saves per removed point is the constant SECONDS_PER_SAMPLE of src/AdaptiveDepth.py, from which the
+preprocessing predicts the time it saves.
+    python benchmarks/preprocessing.py point_clouds [--depth 8] [--factor 2] [--outliers statistical] [--repeat 3]
+'''
+
+import argparse
+import os
+import platform
+import sys
+import tempfile
+
+import numpy as np
+import open3d as o3d
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.AdaptiveDepth import SECONDS_PER_SAMPLE
+from src.PointCloudInput import prepare_point_cloud
+from src.PoissonReconstruction import get_poisson_command, get_poisson_executable, run_command
+from src.ReconstructionConfig import ReconstructionConfig
+from src.Settings import Settings
+
+
+def mesh_distance(mesh, reference, samples: int = 100000):
+    '''
+    :return: tuple (mean, maximum) distance of points sampled on mesh to reference
+    '''
+    scene = o3d.t.geometry.RaycastingScene()
+    scene.add_triangles(o3d.t.geometry.TriangleMesh.from_legacy(reference))
+    points = mesh.sample_points_uniformly(samples).points
+    distances = scene.compute_distance(o3d.core.Tensor(np.asarray(points), dtype=o3d.core.Dtype.Float32)).numpy()
+    return float(distances.mean()), float(distances.max())
+
+
+def benchmark(executable, path, config, tmp_dir, repeat: int = 1):
+    meshes = []
+    times = []
+    counts = []
+    for name, preprocess in (("raw", False), ("preprocessed", True)):
+        run_config = ReconstructionConfig(**config.to_dict())
+        if not preprocess:
+            run_config.downsample_selected = False
+            run_config.outlier_removal = "none"
+        cloud, input_file = prepare_point_cloud(path, os.path.join(tmp_dir, name + "_input.ply"), config=run_config)
+        output_file = os.path.join(tmp_dir, name)
+        # the fastest of the runs, the others were disturbed by the system
+        run = min((run_command(get_poisson_command(executable, run_config, input_file, output_file))
+                   for _ in range(max(repeat, 1))), key=lambda run: run.wall_time)
+        memory = "?" if run.peak_memory is None else "{:.1f} MB".format(run.peak_memory)
+        print("   {:12}  {:9} points  PoissonRecon {:6.2f} s  peak memory {}".format(
+            name, len(cloud.points), run.wall_time, memory))
+        meshes.append(o3d.io.read_triangle_mesh(output_file + ".ply"))
+        times.append(run.wall_time)
+        counts.append(len(cloud.points))
+
+    if counts[0] > counts[1]:
+        print("   saved {:.2f} s, {:.2e} s per removed point (SECONDS_PER_SAMPLE {:.2e})".format(
+            times[0] - times[1], (times[0] - times[1]) / (counts[0] - counts[1]), SECONDS_PER_SAMPLE))
+
+    size = np.max(meshes[0].get_max_bound() - meshes[0].get_min_bound())
+    mean, maximum = mesh_distance(meshes[1], meshes[0])
+    print("   distance of the meshes: mean {:.3%}, max {:.3%} of the model size".format(mean / size, maximum / size))
+
+
+def main():
+    main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Compare PoissonRecon on raw and preprocessed point clouds.")
+    parser.add_argument("point_clouds", nargs="+")
+    parser.add_argument("--depth", type=int, default=8, help="reconstruction depth (default: 8)")
+    parser.add_argument("--factor", type=float, default=2.0, help="voxels per finest octree cell (default: 2)")
+    parser.add_argument("--outliers", default="none", help="outlier removal: none, statistical or radius")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of PoissonRecon of which the fastest is reported")
+    args = parser.parse_args()
+
+    executable = get_poisson_executable(Settings(main_dir, platform.system()))
+    if executable is None:
+        return 1
+    config = ReconstructionConfig(depth_selected=True, depth_value=args.depth, downsample_selected=True,
+                                  downsample_factor=args.factor, outlier_removal=args.outliers, normals_cache=False)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in args.point_clouds:
+            print(os.path.basename(path))
+            benchmark(executable, path, config, tmp_dir, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
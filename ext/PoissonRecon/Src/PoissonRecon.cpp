@@ -112,6 +112,93 @@ void DumpOutput2( std::vector< char* >& comments  , const char* format , ... )
 }
 
 
+#ifdef POISSON_RECON_LIBRARY
+#include <string>
+// When compiled as library (make library), the points are passed from memory and the mesh is returned in memory
+// instead of reading and writing PLY files, see PoissonReconFromPoints below.
+#if defined( _WIN32 ) || defined( _WIN64 )
+#define POISSON_RECON_EXPORT extern "C" __declspec( dllexport )
+#else // !_WIN32 && !_WIN64
+#define POISSON_RECON_EXPORT extern "C" __attribute__ (( visibility( "default" ) ))
+#endif // _WIN32 || _WIN64
+
+struct LibraryInput
+{
+	size_t count;
+	const double *points , *normals , *colors;
+};
+
+// The mesh as returned to the caller, the pointers point into the vectors of LibraryMesh
+struct PoissonReconMesh
+{
+	long long vertexCount , polygonCount , indexCount;
+	float* points;
+	unsigned char* colors;
+	float* values;
+	int* polygonSizes;
+	int* indices;
+	const char* comments;
+};
+
+struct LibraryMesh
+{
+	PoissonReconMesh mesh;
+	std::vector< float > points , values;
+	std::vector< unsigned char > colors;
+	std::vector< int > polygonSizes , indices;
+	std::string comments;
+};
+
+const LibraryInput* libraryInput = NULL;
+LibraryMesh* libraryMesh = NULL;
+
+template< class Real > void CopyVertex( const PlyVertex< Real >& v , LibraryMesh& m )
+{
+	for( int c=0 ; c<3 ; c++ ) m.points.push_back( (float)v.point[c] );
+}
+template< class Real > void CopyVertex( const PlyValueVertex< Real >& v , LibraryMesh& m )
+{
+	for( int c=0 ; c<3 ; c++ ) m.points.push_back( (float)v.point[c] );
+	m.values.push_back( (float)v.value );
+}
+template< class Real > void CopyVertex( const PlyColorVertex< Real >& v , LibraryMesh& m )
+{
+	for( int c=0 ; c<3 ; c++ ) m.points.push_back( (float)v.point[c] ) , m.colors.push_back( v.color[c] );
+}
+template< class Real > void CopyVertex( const PlyColorAndValueVertex< Real >& v , LibraryMesh& m )
+{
+	for( int c=0 ; c<3 ; c++ ) m.points.push_back( (float)v.point[c] ) , m.colors.push_back( v.color[c] );
+	m.values.push_back( (float)v.value );
+}
+
+// Same traversal as PlyWritePolygons, but into memory
+template< class Vertex , class Real >
+void CopyMesh( CoredMeshData< Vertex >* mesh , XForm4x4< Real > xForm , LibraryMesh& m )
+{
+	mesh->resetIterator();
+	size_t vertexCount = mesh->inCorePoints.size() + mesh->outOfCorePointCount();
+	m.points.reserve( 3*vertexCount );
+	m.polygonSizes.reserve( mesh->polygonCount() ) , m.indices.reserve( 3*mesh->polygonCount() );
+	for( int i=0 ; i<int( mesh->inCorePoints.size() ) ; i++ ) CopyVertex( xForm * mesh->inCorePoints[i] , m );
+	for( int i=0 ; i<mesh->outOfCorePointCount() ; i++ )
+	{
+		Vertex vertex;
+		mesh->nextOutOfCorePoint( vertex );
+		CopyVertex( xForm * vertex , m );
+	}
+	std::vector< CoredVertexIndex > polygon;
+	int polygonCount = mesh->polygonCount();
+	for( int i=0 ; i<polygonCount ; i++ )
+	{
+		mesh->nextPolygon( polygon );
+		m.polygonSizes.push_back( int( polygon.size() ) );
+		for( int j=0 ; j<int(polygon.size()) ; j++ )
+			if( polygon[j].inCore ) m.indices.push_back( polygon[j].idx );
+			else                    m.indices.push_back( polygon[j].idx + int( mesh->inCorePoints.size() ) );
+	}
+}
+#endif // POISSON_RECON_LIBRARY
+
 cmdLineString
 	In( "in" ) ,
 	Out( "out" ) ,
@@ -439,7 +526,11 @@ int _Execute( int argc , char* argv[] )
 	Octree< Real > tree;
 	OctreeProfiler< Real > profiler( tree );
 	tree.threads = Threads.value;
+#ifdef POISSON_RECON_LIBRARY
+	if( !In.set && !libraryInput )
+#else // !POISSON_RECON_LIBRARY
 	if( !In.set )
+#endif // POISSON_RECON_LIBRARY
 	{
 		ShowUsage( argv[0] );
 		return 0;
@@ -467,6 +558,36 @@ int _Execute( int argc , char* argv[] )
 	{
 		profiler.start();
 		PointStream* pointStream;
+#ifdef POISSON_RECON_LIBRARY
+		std::vector< OrientedPoint3D< Real > > memoryPoints;
+		std::vector< std::pair< OrientedPoint3D< Real > , Point3D< Real > > > memoryPointsWithData;
+		if( libraryInput )
+		{
+			const LibraryInput& input = *libraryInput;
+			if( Color.set && Color.value>0 )
+			{
+				sampleData = new std::vector< ProjectiveData< Point3D< Real > , Real > >();
+				memoryPointsWithData.resize( input.count );
+				for( size_t i=0 ; i<input.count ; i++ ) for( int c=0 ; c<3 ; c++ )
+				{
+					memoryPointsWithData[i].first.p[c] = (Real)input.points[3*i+c];
+					memoryPointsWithData[i].first.n[c] = (Real)input.normals[3*i+c];
+					// colors are passed in [0,1], the streams read from files deliver [0,255]
+					memoryPointsWithData[i].second[c] = input.colors ? (Real)( input.colors[3*i+c] * 255. ) : (Real)0;
+				}
+				pointStream = new MemoryOrientedPointStreamWithData< Real , Point3D< Real > >( input.count , &memoryPointsWithData[0] );
+			}
+			else
+			{
+				memoryPoints.resize( input.count );
+				for( size_t i=0 ; i<input.count ; i++ ) for( int c=0 ; c<3 ; c++ )
+					memoryPoints[i].p[c] = (Real)input.points[3*i+c] , memoryPoints[i].n[c] = (Real)input.normals[3*i+c];
+				pointStream = new MemoryOrientedPointStream< Real >( input.count , &memoryPoints[0] );
+			}
+		}
+		else
+#endif // POISSON_RECON_LIBRARY
+		{
 		char* ext = GetFileExtension( In.value );
 		if( Color.set && Color.value>0 )
 		{
@@ -482,6 +603,7 @@ int _Execute( int argc , char* argv[] )
 			else                                    pointStream = new  ASCIIOrientedPointStream< Real >( In.value );
 		}
 		delete[] ext;
+		}
 		XPointStream _pointStream( xForm , *pointStream );
 		xForm = GetPointXForm( _pointStream , (Real)Scale.value ) * xForm;
 		if( sampleData )
@@ -619,7 +741,11 @@ int _Execute( int argc , char* argv[] )
 		profiler.dumpOutput( "Got voxel grid:" );
 	}
 
+#ifdef POISSON_RECON_LIBRARY
+	if( Out.set || libraryMesh )
+#else // !POISSON_RECON_LIBRARY
 	if( Out.set )
+#endif // POISSON_RECON_LIBRARY
 	{
 		profiler.start();
 		SparseNodeData< ProjectiveData< Point3D< Real > , Real > , DATA_DEGREE >* colorData = NULL;
@@ -641,6 +767,10 @@ int _Execute( int argc , char* argv[] )
 
 		if( colorData ) delete colorData , colorData = NULL;
 
+#ifdef POISSON_RECON_LIBRARY
+		if( libraryMesh ) CopyMesh( &mesh , iXForm , *libraryMesh );
+		else
+#endif // POISSON_RECON_LIBRARY
 		if( NoComments.set )
 		{
 			if( ASCII.set ) PlyWritePolygons( Out.value , &mesh , PLY_ASCII         , NULL , 0 , iXForm );
@@ -655,6 +785,13 @@ int _Execute( int argc , char* argv[] )
 	if( density ) delete density , density = NULL;
 	DumpOutput2( comments , "#          Total Solve: %9.1f (s), %9.1f (MB)\n" , Time()-startTime , tree.maxMemoryUsage() );
 
+#ifdef POISSON_RECON_LIBRARY
+	// the executable ends here, the library has to free everything
+	if( libraryMesh ) for( size_t i=0 ; i<comments.size() ; i++ ) libraryMesh->comments += std::string( comments[i] ) + "\n";
+	for( size_t i=0 ; i<comments.size() ; i++ ) delete[] comments[i];
+	if( samples ) delete samples , samples = NULL;
+	if( sampleData ) delete sampleData , sampleData = NULL;
+#endif // POISSON_RECON_LIBRARY
 	return 1;
 }
 
@@ -710,6 +847,83 @@ int Execute( int argc , char* argv[] )
 	}
 }
 #endif // !FAST_COMPILE
+
+#ifdef POISSON_RECON_LIBRARY
+template< class Real >
+int ExecuteLibrary( void )
+{
+	if( Density.set )
+		if( Color.set && Color.value>0 ) return Execute< Real , PlyColorAndValueVertex< float > >( 0 , NULL );
+		else                             return Execute< Real , PlyValueVertex< float > >( 0 , NULL );
+	else
+		if( Color.set && Color.value>0 ) return Execute< Real , PlyColorVertex< float > >( 0 , NULL );
+		else                             return Execute< Real , PlyVertex< float > >( 0 , NULL );
+}
+
+// Reconstruct the surface of count oriented points (points, normals and, optional, colors in [0,1], each count x 3
+// doubles) with the parameters of the command line in argv (without --in and --out). Returns the mesh, which has to be
+// freed with PoissonReconFreeMesh, or NULL if the reconstruction failed. The parameters are global variables, so only
+// one reconstruction may run at a time.
+POISSON_RECON_EXPORT PoissonReconMesh* PoissonReconFromPoints( int argc , char* argv[] , long long count , const double* points , const double* normals , const double* colors )
+{
+	// restore the defaults of the parameters, which were changed by the previous call
+	static std::vector< std::pair< cmdLineInt* , int > > intDefaults;
+	static std::vector< std::pair< cmdLineFloat* , float > > floatDefaults;
+	static bool defaultsSaved = false;
+	int paramNum = sizeof(params)/sizeof(cmdLineReadable*);
+	if( !defaultsSaved )
+	{
+		for( int i=0 ; i<paramNum ; i++ )
+			if     ( cmdLineInt*   p = dynamic_cast< cmdLineInt*   >( params[i] ) ) intDefaults.push_back( std::make_pair( p , p->value ) );
+			else if( cmdLineFloat* p = dynamic_cast< cmdLineFloat* >( params[i] ) ) floatDefaults.push_back( std::make_pair( p , p->value ) );
+		defaultsSaved = true;
+	}
+	for( int i=0 ; i<paramNum ; i++ ) params[i]->set = false;
+	for( size_t i=0 ; i<intDefaults.size() ; i++ ) intDefaults[i].first->value = intDefaults[i].second;
+	for( size_t i=0 ; i<floatDefaults.size() ; i++ ) floatDefaults[i].first->value = floatDefaults[i].second;
+	echoStdout = 0;
+
+	cmdLineParse( argc , argv , paramNum , params , 1 );
+	if( In.set || Out.set || VoxelGrid.set )
+	{
+		fprintf( stderr , "[ERROR] --%s, --%s and --%s are not supported by the library\n" , In.name , Out.name , VoxelGrid.name );
+		return NULL;
+	}
+	if( count<=0 ) return NULL;
+
+	LibraryInput input;
+	input.count = (size_t)count , input.points = points , input.normals = normals , input.colors = colors;
+	libraryInput = &input;
+	libraryMesh = new LibraryMesh();
+	int result = Double.set ? ExecuteLibrary< double >() : ExecuteLibrary< float >();
+	// free the nodes of the octree and switch the allocator off again, the root of the next octree is created before
+	// _Execute sets up the allocator
+	OctNode< TreeNodeData >::NodeAllocator.reset();
+	OctNode< TreeNodeData >::SetAllocator( 0 );
+	LibraryMesh* m = libraryMesh;
+	libraryInput = NULL , libraryMesh = NULL;
+	fflush( stdout );
+	if( result!=1 ){ delete m ; return NULL; }
+
+	m->mesh.vertexCount = (long long)( m->points.size()/3 );
+	m->mesh.polygonCount = (long long)m->polygonSizes.size();
+	m->mesh.indexCount = (long long)m->indices.size();
+	m->mesh.points = m->points.size() ? &m->points[0] : NULL;
+	m->mesh.colors = m->colors.size() ? &m->colors[0] : NULL;
+	m->mesh.values = m->values.size() ? &m->values[0] : NULL;
+	m->mesh.polygonSizes = m->polygonSizes.size() ? &m->polygonSizes[0] : NULL;
+	m->mesh.indices = m->indices.size() ? &m->indices[0] : NULL;
+	m->mesh.comments = m->comments.c_str();
+	return &m->mesh;
+}
+
+// Free a mesh returned by PoissonReconFromPoints
+POISSON_RECON_EXPORT void PoissonReconFreeMesh( PoissonReconMesh* mesh )
+{
+	// the mesh is the first member of LibraryMesh
+	delete (LibraryMesh*)mesh;
+}
+#else // !POISSON_RECON_LIBRARY
 int main( int argc , char* argv[] )
 {
 #ifdef ARRAY_DEBUG
@@ -778,3 +992,4 @@ int main( int argc , char* argv[] )
 #endif // _WIN32 || _WIN64
 	return EXIT_SUCCESS;
 }
+#endif // POISSON_RECON_LIBRARY
@@ -1,7 +1,6 @@
-import open3d.visualization.gui as gui
-from src.GuiInterface import GUI
 import platform
 import os
+import sys
 
 
 
@@ -9,15 +8,30 @@ import os
 def main():
     '''
     Main method of the Computer Graphics Project Group 'Point cloud to mesh'.
-    Start the application to run by creating an instance of our GUIInterface
+    Start the application to run by creating an instance of our GUIInterface.
+    With the first argument 'batch' the point clouds are processed without GUI instead, see src/Batch.py:
+        python main.py batch <point clouds, directories or manifests> [--config config.json] [--out out_dir] [--jobs N]
+    With the first argument 'isosurface' a surface is extracted from the implicit function, see src/ImplicitGrid.py:
+        python main.py isosurface <grid file> [--points point_cloud.ply] [--iso value] [--step N] [--out mesh.ply]
     :return: None
     '''
-    # initalize the application
-    gui.Application.instance.initialize()
-
     main_dir = os.getcwd() # main directory
     my_os = platform.system() #operation system
 
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        # the batch mode must not import the GUI, so that it runs on machines without display
+        from src.Batch import main as batch_main
+        sys.exit(batch_main(main_dir, my_os, sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "isosurface":
+        from src.ImplicitGrid import main as isosurface_main
+        sys.exit(isosurface_main(sys.argv[2:]))
+
+    import open3d.visualization.gui as gui
+    from src.GuiInterface import GUI
+
+    # initalize the application
+    gui.Application.instance.initialize()
+
     w = GUI(main_dir, my_os)
 
     # Run the event loop.
@@ -25,4 +39,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
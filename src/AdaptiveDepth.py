@@ -0,0 +1,185 @@
+import copy
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from src.PointCloudStream import positions
+
+'''
+Automatic choice of the depth of PoissonRecon from the density of the points. The finest octree cells should be about as
+large as the spacing of the samples: finer levels cost time and memory without adding detail the samples can support,
+coarser levels lose detail. The spacing is estimated from the nearest neighbor distances of a random sample of the
+point cloud. Time and memory of the reconstruction are predicted from the expected number of octree nodes, with
+constants measured on PoissonRecon runs and corrected by the runs recorded in the metrics log.
+'''
+
+MIN_DEPTH = 5
+MAX_DEPTH = 12
+# points from which the spacing is estimated and points whose nearest neighbor is searched among them
+SPACING_SAMPLE = 100000
+SPACING_QUERIES = 10000
+# octree nodes per finest cell filled with samples, seconds (single thread) and MB per node and memory PoissonRecon
+# needs anyway, measured on scans with 200k points at depth 7 to 9
+NODES_PER_CELL = 40.0
+SECONDS_PER_NODE = 12e-6
+# seconds (single thread) per sample for reading, splatting and density estimation: median of the time saved per
+# removed point at depth 5, 6 and 7 (1.6e-6, 2.7e-6, -0.8e-6) on a scan with 200k points, measured with
+#     python benchmarks/preprocessing.py scan.ply --depth <depth> --repeat 3
+# At depth 8 a removed point saved 2.4e-5 s, because the octree shrank as well.
+SECONDS_PER_SAMPLE = 1.6e-6
+MB_PER_NODE = 1e-4
+BASE_MEMORY = 35.0
+
+
+class DepthPlan:
+    '''
+    Class DepthPlan contains the depth and samples per node chosen for a point cloud, the estimated point spacing and
+    the predicted wall time in seconds and peak memory in MB of the reconstruction. raw_time and raw_memory are the
+    predictions before the correction by earlier runs.
+    '''
+    def __init__(self, points, spacing, width, depth, samples_per_node, predicted_time, predicted_memory, raw_time,
+                 raw_memory):
+        self.points = points
+        self.spacing = spacing
+        self.width = width
+        self.depth = depth
+        self.samples_per_node = samples_per_node
+        self.predicted_time = predicted_time
+        self.predicted_memory = predicted_memory
+        self.raw_time = raw_time
+        self.raw_memory = raw_memory
+
+    def apply(self, config):
+        '''
+        :return: copy of the ReconstructionConfig config with the planned depth and samples per node
+        '''
+        config = copy.copy(config)
+        config.depth_selected = True
+        config.depth_value = self.depth
+        config.samplesPerNode_selected = True
+        config.samplesPerNode_value = self.samples_per_node
+        return config
+
+    def to_dict(self):
+        return {"points": self.points, "spacing": self.spacing, "width": self.width, "depth": self.depth,
+                "samples_per_node": self.samples_per_node, "predicted_time": self.predicted_time,
+                "predicted_memory": self.predicted_memory, "raw_time": self.raw_time, "raw_memory": self.raw_memory}
+
+    def __repr__(self):
+        return "DepthPlan(depth {}, samples per node {:.1f}, spacing {:.4g}, predicted {:.1f} s, {:.0f} MB)".format(
+            self.depth, self.samples_per_node, self.spacing, self.predicted_time, self.predicted_memory)
+
+
+def estimate_point_spacing(points, sample_size: int = SPACING_SAMPLE, queries: int = SPACING_QUERIES, seed: int = 0):
+    '''
+    Estimate the median distance between neighboring points. For large clouds the KD-tree is built on a random sample
+    only; the points of a surface are sparser in the sample by the square root of the sampling rate, which is corrected.
+    :param points: array of shape (n, 3) or memory map of PLY vertices (see PlyVertices)
+    :return: estimated spacing, 0 for less than two points
+    '''
+    n = len(points)
+    if n < 2:
+        return 0.0
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(points[np.sort(rng.choice(n, sample_size, replace=False))]) if n > sample_size \
+        else np.asarray(points)
+    if sample.dtype.names:
+        # vertices of a memory-mapped PLY file
+        sample = positions(sample)
+    query = sample[rng.choice(len(sample), min(queries, len(sample)), replace=False)]
+    distances, _ = cKDTree(sample).query(query, k=2)
+    spacing = float(np.median(distances[:, 1]))
+    return spacing * np.sqrt(len(sample) / n)
+
+
+def load_calibration(metrics_log: str):
+    '''
+    Compare the predictions of earlier runs in the metrics log with their measured time and memory.
+    :return: tuple (median ratio of actual to predicted time, of actual to predicted memory), (1, 1) without records
+    '''
+    time_ratios, memory_ratios = [], []
+    if metrics_log and os.path.exists(metrics_log):
+        with open(metrics_log) as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                plan = record.get("depth_plan")
+                if not plan or record.get("cached") or record.get("returncode") != 0:
+                    continue
+                if record.get("wall_time") and plan.get("raw_time"):
+                    time_ratios.append(record["wall_time"] / plan["raw_time"])
+                if record.get("peak_memory") and plan.get("raw_memory"):
+                    memory_ratios.append(record["peak_memory"] / plan["raw_memory"])
+    return (float(np.median(time_ratios)) if time_ratios else 1.0,
+            float(np.median(memory_ratios)) if memory_ratios else 1.0)
+
+
+def count_threads(config):
+    return config.threads_value if config.threads_selected and config.threads_value > 0 else os.cpu_count() or 1
+
+
+def predict_sample_time(samples: int, config):
+    '''
+    :return: predicted seconds the reconstruction spends on the samples alone, corrected by the runs in the metrics log
+    '''
+    time_ratio, _ = load_calibration(config.metrics_log)
+    return samples * SECONDS_PER_SAMPLE / count_threads(config) * time_ratio
+
+
+def plan_depth(points, config, minimum=None, maximum=None, depth: int = None, verbose: bool = True):
+    '''
+    Choose depth and samples per node for the points: the deepest level whose cells are not smaller than the spacing,
+    and as samples per node the number of samples expected in such a cell, so that the octree is not refined where the
+    points are sparser than on average.
+    :param points: array of shape (n, 3) or memory map of PLY vertices, then minimum and maximum must be given
+    :param config: ReconstructionConfig, its scale, threads and metrics log are used
+    :param minimum: minimum of the bounding box, None to compute it from the points (also maximum)
+    :param depth: depth of the reconstruction, None to choose it from the spacing. Given a depth, only the samples per
+           node and the predictions are computed.
+    :param verbose: print the plan
+    :return: DepthPlan
+    '''
+    points_count = len(points)
+    if minimum is None or maximum is None:
+        minimum, maximum = np.min(points, axis=0), np.max(points, axis=0)
+    scale = config.scale_value if config.scale_selected else 1.1
+    width = float(np.max(np.asarray(maximum) - np.asarray(minimum))) * scale
+    spacing = estimate_point_spacing(points)
+    if depth is None and spacing > 0 and width > 0:
+        depth = int(np.clip(np.floor(np.log2(width / spacing)), MIN_DEPTH, MAX_DEPTH))
+    elif depth is None:
+        depth = MIN_DEPTH
+    cell = width / (1 << depth)
+    samples_per_cell = (cell / spacing) ** 2 if spacing > 0 else 1.0
+    samples_per_node = float(np.clip(round(samples_per_cell, 1), 1.0, 20.0))
+
+    cells = points_count / max(samples_per_cell, 1.0)
+    nodes = cells * NODES_PER_CELL
+    raw_time = (nodes * SECONDS_PER_NODE + points_count * SECONDS_PER_SAMPLE) / count_threads(config)
+    raw_memory = BASE_MEMORY + nodes * MB_PER_NODE
+    time_ratio, memory_ratio = load_calibration(config.metrics_log)
+    plan = DepthPlan(points_count, spacing, width, depth, samples_per_node, raw_time * time_ratio,
+                     raw_memory * memory_ratio, raw_time, raw_memory)
+    if verbose:
+        print("[Info]", plan)
+    return plan
+
+
+def report_plan(plan, run, time_saved: float = None):
+    '''
+    Print the predicted next to the measured time and memory of the reconstruction.
+    :param time_saved: time in seconds the preprocessing predicted to save (see Preprocessing), printed next to the
+           error of the prediction of the reconstruction, which shows how far it can be trusted. None if the points
+           were not preprocessed.
+    '''
+    if run is None or run.cached:
+        return
+    memory = "?" if run.peak_memory is None else "{:.0f}".format(run.peak_memory)
+    saved = "" if time_saved is None else ", preprocessing predicted to save {:.1f} s".format(time_saved)
+    print("[Info] Depth {}: predicted {:.1f} s, {:.0f} MB, actual {:.1f} s ({:+.1f} s), {} MB{}".format(
+        plan.depth, plan.predicted_time, plan.predicted_memory, run.wall_time, run.wall_time - plan.predicted_time,
+        memory, saved))
@@ -0,0 +1,85 @@
+import threading
+import traceback
+
+'''
+Background tasks for the GUI: long computations (PoissonRecon, xatlas, rasterization) run in a worker thread, so the
+window stays responsive. The GUI itself may only be changed in its main thread, therefore progress and result are
+handed to functions which are called by the post function of the task (gui.Application.instance.post_to_main_thread).
+This module does not import the GUI.
+'''
+
+
+class TaskCancelled(Exception):
+    '''
+    Raised inside a task which was cancelled, at the next call of BackgroundTask.progress.
+    '''
+    pass
+
+
+class BackgroundTask:
+    '''
+    Class BackgroundTask runs function(task) in a daemon thread. The function reports its progress by
+    task.progress(message), which also raises TaskCancelled if the task was cancelled in the meantime, and can pass
+    task.cancel_event to functions which check it themselves (e.g. run_command kills PoissonRecon as soon as it is set).
+    When the function is done, on_done(result, error) is posted, error being None, the exception or TaskCancelled.
+    '''
+    def __init__(self, function, on_progress=None, on_done=None, post=None):
+        '''
+        :param function: function with the task as only parameter, its return value is passed to on_done.
+        :param on_progress: function called with every progress message.
+        :param on_done: function called with result and error when the task is finished.
+        :param post: function which calls its argument (a function without parameters) in the main thread, None to
+               call on_progress and on_done directly in the worker thread.
+        '''
+        self.function = function
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.post = post or (lambda callback: callback())
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def progress(self, message: str):
+        '''
+        Report the progress of the task. Raises TaskCancelled if the task was cancelled.
+        '''
+        if self.cancelled:
+            raise TaskCancelled()
+        self.report(message)
+
+    def report(self, message: str):
+        '''
+        Report a progress message without checking for cancellation, e.g. from a thread reading the output of a child
+        process.
+        '''
+        if self.on_progress is not None:
+            self.post(lambda: self.on_progress(message))
+
+    def _run(self):
+        result = None
+        error = None
+        try:
+            result = self.function(self)
+            if self.cancelled:
+                error = TaskCancelled()
+        except TaskCancelled as e:
+            error = e
+        except Exception as e:
+            traceback.print_exc()
+            error = e
+        if self.on_done is not None:
+            self.post(lambda: self.on_done(result, error))
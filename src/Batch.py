@@ -0,0 +1,251 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from src.AdaptiveDepth import plan_depth, report_plan
+from src.ColorToTexture import get_texture_from_vertex_color
+from src.DiskCache import DiskCache
+from src.EngineSelection import run_reconstruction
+from src.GeometryStore import read_geometry
+from src.MeshDecimation import decimate_mesh
+from src.PointColorSampler import PointColorSampler
+from src.PointCloudInput import prepare_point_cloud
+from src.PointCloudStream import chunk_size, prepare_point_cloud_streaming, read_ply_vertices, stream_bounds
+from src.PoissonReconLibrary import run_poisson_library
+from src.ReconstructionConfig import ReconstructionConfig
+from src.TiledReconstruction import run_tiled_reconstruction
+from src.Scheduler import run_jobs, split_cores, with_threads
+from src.Settings import Settings
+from src.SolverProfiler import profile_solver, report_profiles
+from src.SurfaceTrimming import trim_surface
+
+'''
+Headless batch mode of the PointCloud2Mesh tool. It runs the same pipeline as the GUI (PoissonRecon followed by the UV
+mapping) for many point clouds, but never imports open3d.visualization.gui, so it also works on machines without display.
+'''
+
+POINT_CLOUD_EXTENSIONS = (".ply", ".pcd", ".xyz", ".pts")
+
+
+def collect_input_files(sources):
+    '''
+    Collect all point cloud files which shall be processed.
+    :param sources: list of point cloud files, directories and manifest files. All point cloud files directly inside a
+           directory are used. A manifest is a text file (.txt) containing one point cloud file per line, empty lines
+           and lines starting with '#' are ignored and relative paths are relative to the manifest.
+    :return: list of absolute paths of the point cloud files in the given order
+    '''
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.lower().endswith(POINT_CLOUD_EXTENSIONS):
+                    files.append(os.path.abspath(os.path.join(source, name)))
+        elif source.lower().endswith(".txt"):
+            manifest_dir = os.path.dirname(os.path.abspath(source))
+            with open(source) as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        files.append(os.path.abspath(os.path.join(manifest_dir, line)))
+        else:
+            files.append(os.path.abspath(source))
+    return files
+
+
+def process_file(settings, config, input_file: str, out_dir: str):
+    '''
+    Run the whole pipeline for one point cloud: complete missing normals and colors, reconstruct the mesh with
+    PoissonRecon and compute texture, normal and position map.
+    :param settings: Settings containing the main directory and the operation system.
+    :param config: ReconstructionConfig used for the reconstruction and the texture.
+    :param input_file: absolute path of the point cloud.
+    :param out_dir: directory to which mesh and maps are written. They are named after the input file, e.g.
+           bunny.ply results in bunny.ply (mesh), bunny_texture.png, bunny_normal.png and bunny_position.png.
+    :return: tuple (path of the reconstructed mesh, ReconstructionRun of PoissonRecon, UnwrapStatistics of xatlas)
+    '''
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    output_file = os.path.join(os.path.abspath(out_dir), name)
+
+    cloud = None
+    poisson_input = None
+    metrics = {}
+    if config.stream_selected:
+        # the point cloud is never loaded completely, PoissonRecon reads it as a stream
+        poisson_input = prepare_point_cloud_streaming(input_file, output_file + "_input.ply", config)
+        if poisson_input is None:
+            print("[WARNING] Streaming needs a binary PLY file, loading", input_file)
+    if poisson_input is None:
+        cloud, poisson_input = prepare_point_cloud(input_file, output_file + "_input.ply", config=config,
+                                                   metrics=metrics)
+        if cloud is None:
+            raise RuntimeError("Failed to read points {}".format(input_file))
+
+    plan = None
+    if config.depth_auto and not config.tiles_selected:
+        # the tiles choose their depth themselves
+        if cloud is not None:
+            plan = plan_depth(np.asarray(cloud.points), config)
+        else:
+            vertices = read_ply_vertices(poisson_input)
+            size = chunk_size(config.stream_memory_budget, vertices.dtype.itemsize * 4)
+            minimum, maximum, _ = stream_bounds(vertices, size)
+            plan = plan_depth(vertices.memmap(), config, minimum, maximum)
+        config = plan.apply(config)
+        metrics["depth_plan"] = plan.to_dict()
+    elif "preprocessing" in metrics and not config.tiles_selected:
+        # the time saved by the preprocessing is predicted with the same model, its error is reported next to it
+        depth = config.depth_value if config.depth_selected else 8
+        plan = plan_depth(np.asarray(cloud.points), config, depth=depth, verbose=False)
+        metrics["depth_plan"] = plan.to_dict()
+
+    mesh_cache = DiskCache(settings.cache_dir + "mesh", config.mesh_cache_size) if config.mesh_cache_size > 0 else None
+    result = None
+    if config.tiles_selected:
+        if cloud is None:
+            # the tiles are cut from the completed point cloud
+            print("[WARNING] Tiles are cut from the whole point cloud, loading", poisson_input)
+            cloud = read_geometry(poisson_input).cloud
+        result = run_tiled_reconstruction(settings, config, cloud, output_file)
+    elif config.use_library and config.engine == "poisson" and not config.grid_selected and not config.density_selected \
+            and cloud is not None:
+        # the points are passed from memory and the mesh is not read again for the texture. The library writes the
+        # mesh without the density values, which the trimming needs.
+        result = run_poisson_library(settings, config, cloud, poisson_input, output_file, mesh_cache, metrics)
+        if result is None:
+            print("[WARNING] PoissonRecon library not found (make library in ext/PoissonRecon), using the executable")
+    if result is not None:
+        geometry, run = result
+    else:
+        geometry = None
+        run = run_reconstruction(settings, config, poisson_input, output_file, mesh_cache=mesh_cache, metrics=metrics,
+                                 points_count=len(cloud.points) if cloud is not None else None)
+    if run is None or not run.succeeded or not os.path.exists(output_file + ".ply"):
+        raise RuntimeError("PoissonRecon did not write {}.ply".format(output_file))
+    if plan is not None:
+        report_plan(plan, run, metrics.get("preprocessing", {}).get("time_saved"))
+
+    trim = None
+    if config.density_selected and config.trim_percentile > 0:
+        trim = trim_surface(settings, config, output_file + ".ply")
+        if trim is not None:
+            print("[Info] Trimmed {}.ply: {}".format(output_file, trim))
+            geometry = None
+
+    source = None
+    if config.decimate_selected:
+        # the maps of the decimated mesh are baked from the full mesh
+        source = geometry if geometry is not None else read_geometry(output_file + ".ply")
+        geometry, decimation = decimate_mesh(source, config.decimate_triangles, config.decimate_max_error,
+                                             output_file + "_decimated.ply")
+        print("[Info] Decimated {}.ply: {}".format(output_file, decimation))
+
+    color_sampler = None
+    if config.texture_from_points:
+        if cloud is None:
+            print("[WARNING] The texture is sampled from the whole point cloud, loading", poisson_input)
+            cloud = read_geometry(poisson_input).cloud
+        color_sampler = PointColorSampler.from_cloud(cloud, config.texture_neighbors)
+        if color_sampler is None:
+            print("[WARNING] The points of", input_file, "have no colors, the texture is taken from the mesh")
+
+    start = time.time()
+    uv_cache = DiskCache(settings.cache_dir + "uv", config.uv_cache_size) if config.uv_cache_size > 0 else None
+    unwrap = get_texture_from_vertex_color(output_file, output_file, config.texture_width, config.texture_padding,
+                                           uv_cache, config.xatlas_chart_options, config.xatlas_pack_options,
+                                           geometry=geometry, source=source, color_sampler=color_sampler)
+    if trim is not None and not unwrap.cached:
+        texture_time = time.time() - start
+        print("[Info] UV mapping and texture took {:.1f} s, about {:.1f} s saved by the trimming".format(
+            texture_time, trim.saved_time(texture_time)))
+    return output_file + ".ply", run, unwrap
+
+
+def run_batch(settings, config, input_files, out_dir: str, workers: int = 1):
+    '''
+    Process all input files. A failing file does not stop the batch.
+    :param workers: number of files processed at the same time. The cores are split between them.
+    :return: list of the input files which could not be processed
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    workers, threads = split_cores(len(input_files), workers)
+    if workers > 1:
+        config = with_threads(config, threads)
+        print("[Info] {} files, {} at a time with {} threads each".format(len(input_files), workers, threads))
+
+    failed = []
+    cached = 0
+    start = time.time()
+    jobs = [(settings, config, input_file, out_dir) for input_file in input_files]
+    for i, ((_, _, input_file, _), result, error) in enumerate(run_jobs(process_file, jobs, workers, threads)):
+        if error is not None:
+            print("[WARNING] Failed to process", input_file, ":", error)
+            failed.append(input_file)
+        else:
+            mesh_file, run, unwrap = result
+            cached += run.cached
+            print("[{}/{}] {}: PoissonRecon {}, xatlas {}".format(i + 1, len(input_files), mesh_file, run, unwrap))
+    print("[Info] Batch done in {:.1f} s, {} of {} meshes taken from the cache".format(
+        time.time() - start, cached, len(input_files) - len(failed)))
+    return failed
+
+
+def run_profile(settings, config, input_files, out_dir: str):
+    '''
+    Profile the solver settings (see SolverProfiler) for every input file instead of processing it.
+    :return: list of the input files which could not be profiled
+    '''
+    failed = []
+    for input_file in input_files:
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        generated_path = os.path.join(os.path.abspath(out_dir), name + "_input.ply")
+        cloud, poisson_input = prepare_point_cloud(input_file, generated_path, config=config)
+        if cloud is None:
+            failed.append(input_file)
+            continue
+        print("[Info] Profiling the solver on", input_file)
+        profiles = profile_solver(settings, config, poisson_input, out_dir)
+        report_profiles(profiles)
+        if not any(profile.run is not None and profile.run.succeeded for profile in profiles):
+            failed.append(input_file)
+    return failed
+
+
+def main(main_dir, my_os, argv=None):
+    '''
+    Entry point of the batch mode, see main.py.
+    :return: exit code, 0 if all files were processed successfully
+    '''
+    parser = argparse.ArgumentParser(prog="main.py batch",
+                                     description="Reconstruct and texture point clouds without GUI.")
+    parser.add_argument("inputs", nargs="+",
+                        help="point cloud files, directories containing point clouds or manifest files (.txt)")
+    parser.add_argument("--config", help="json file with the parameters, see src/ReconstructionConfig.py")
+    parser.add_argument("--out", help="output directory (default: out/)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of point clouds processed at the same time (default: 1)")
+    parser.add_argument("--metrics", help="JSONL file to which a record of every PoissonRecon run is appended")
+    parser.add_argument("--profile", action="store_true",
+                        help="only reconstruct with several solver settings and report time, memory and faces")
+    args = parser.parse_args(argv)
+
+    settings = Settings(main_dir, my_os)
+    config = ReconstructionConfig.from_file(args.config) if args.config else ReconstructionConfig()
+    if args.metrics:
+        config.metrics_log = os.path.abspath(args.metrics)
+    out_dir = args.out if args.out else settings.out_dir
+
+    input_files = collect_input_files(args.inputs)
+    if not input_files:
+        print("[WARNING] No point cloud files found")
+        return 1
+
+    if args.profile:
+        os.makedirs(out_dir, exist_ok=True)
+        failed = run_profile(settings, config, input_files, out_dir)
+    else:
+        failed = run_batch(settings, config, input_files, out_dir, args.jobs)
+    print("{} of {} point clouds processed".format(len(input_files) - len(failed), len(input_files)))
+    return 1 if failed else 0
@@ -1,44 +1,166 @@
 import os.path
-from numba import jit, njit, prange
+import time
+from numba import njit, prange
 import numpy as np
-import trimesh
-from trimesh import visual
+import open3d as o3d
 import xatlas
 from PIL import Image
+from src.DiskCache import content_hash
+from src.GeometryStore import read_geometry
+from src.TexelBuffer import TexelBuffer, texel_key
 
 
-def get_texture_from_vertex_color(input_file: str, image_name:str, textureWidth: int = 1024):
+class UnwrapStatistics:
+    '''
+    Class UnwrapStatistics describes the result of an xatlas unwrap: number of charts, utilization of the atlas (ratio
+    of the atlas covered by charts), size of the atlas in texels, number of atlases and the time in seconds spent on
+    setting up the mesh (add_mesh), on computing and packing the charts (generate, xatlas runs both in one call) and
+    on copying the result (get_mesh). cached is True if the unwrap was taken from the cache.
+    '''
+    def __init__(self, chart_count, utilization, width, height, atlas_count, time_add_mesh=0.0, time_generate=0.0,
+                 time_get_mesh=0.0, cached=False):
+        self.chart_count = int(chart_count)
+        self.utilization = float(utilization)
+        self.width = int(width)
+        self.height = int(height)
+        self.atlas_count = int(atlas_count)
+        self.time_add_mesh = time_add_mesh
+        self.time_generate = time_generate
+        self.time_get_mesh = time_get_mesh
+        self.cached = cached
+
+    def __repr__(self):
+        text = "{} charts, {:.1f}% utilization, {}x{} texels".format(self.chart_count, 100 * self.utilization,
+                                                                     self.width, self.height)
+        if self.cached:
+            return text + " (cached)"
+        return text + ", add mesh {:.2f} s, charts + pack {:.2f} s, get mesh {:.2f} s".format(
+            self.time_add_mesh, self.time_generate, self.time_get_mesh)
+
+
+def make_xatlas_options(options_class, options):
+    '''
+    Create xatlas.ChartOptions or xatlas.PackOptions from a dictionary.
+    :param options_class: xatlas.ChartOptions or xatlas.PackOptions
+    :param options: dictionary of attribute names of options_class and their values, e.g. {"max_iterations": 2} or
+           {"bruteForce": True, "resolution": 4096}. Missing attributes keep the defaults of xatlas.
+    :return: the options object
+    '''
+    result = options_class()
+    for key, value in (options or {}).items():
+        if key.startswith("_") or not hasattr(result, key):
+            raise KeyError("Unknown {} attribute: {}".format(options_class.__name__, key))
+        setattr(result, key, value)
+    return result
+
+
+def parametrize(vertices, faces, uv_cache=None, chart_options: dict = None, pack_options: dict = None):
+    '''
+    Unwrap the mesh with xatlas. If a cache is given, the unwrap of a mesh with exactly the same vertices, faces and
+    options is taken from the cache instead of computing it again, e.g. when only texture size or output name changed.
+    :param uv_cache: DiskCache for the xatlas results or None.
+    :param chart_options: dictionary of xatlas.ChartOptions, e.g. a lower max_iterations for faster unwraps.
+    :param pack_options: dictionary of xatlas.PackOptions, e.g. bruteForce, resolution or texels_per_unit.
+    :return: tuple (vmapping, indices, uvs, statistics), the first three as returned by xatlas.parametrize and
+             UnwrapStatistics
+    '''
+    chart_options = dict(chart_options or {})
+    pack_options = dict(pack_options or {})
+    key = None
+    if uv_cache is not None:
+        key = "xatlas_" + content_hash(vertices, faces, chart_options=sorted(chart_options.items()),
+                                       pack_options=sorted(pack_options.items()))
+        cached = uv_cache.load_arrays(key)
+        if cached is not None:
+            statistics = UnwrapStatistics(*cached["statistics"], cached=True)
+            print("[Info] xatlas unwrap taken from cache:", statistics)
+            return cached["vmapping"], cached["indices"], cached["uvs"], statistics
+
+    print("starting xatlas unwrap!")
+    atlas = xatlas.Atlas()
+    start = time.time()
+    atlas.add_mesh(np.asarray(vertices, dtype=np.float32), np.asarray(faces, dtype=np.uint32))
+    time_add_mesh = time.time() - start
+    start = time.time()
+    atlas.generate(make_xatlas_options(xatlas.ChartOptions, chart_options),
+                   make_xatlas_options(xatlas.PackOptions, pack_options))
+    time_generate = time.time() - start
+    start = time.time()
+    vmapping, indices, uvs = atlas.get_mesh(0)
+    statistics = UnwrapStatistics(atlas.chart_count, atlas.utilization, atlas.width, atlas.height, atlas.atlas_count,
+                                  time_add_mesh, time_generate, time.time() - start)
+    print("Finished xatlas unwrap!", statistics)
+    if atlas.atlas_count > 1:
+        print("[WARNING] The charts do not fit into one atlas of the given resolution, the {} atlases overlap in the "
+              "texture".format(atlas.atlas_count))
+
+    if uv_cache is not None:
+        uv_cache.store_arrays(key, vmapping=vmapping, indices=indices, uvs=uvs,
+                              statistics=np.array([statistics.chart_count, statistics.utilization, statistics.width,
+                                                   statistics.height, statistics.atlas_count]))
+    return vmapping, indices, uvs, statistics
+
+
+def get_texture_from_vertex_color(input_file: str, image_name:str, textureWidth: int = 1024, padding: int = 4,
+                                  uv_cache=None, chart_options: dict = None, pack_options: dict = None,
+                                  geometry=None, progress=None, source=None, color_sampler=None):
     '''
     Generate the texture from colors of vertices.
     :param input_file: the name of the input file, must not be None or empty. Should not include the file type '.obj'
            The object file includes an array of all faces (triangles). Each triangle includes an array of 3 vertices
-    :return: the texture
+    :param padding: number of pixels by which the UV charts are grown into the empty space around them, so that
+           mipmapping and bilinear filtering do not mix black into the seams.
+    :param uv_cache: DiskCache in which the xatlas unwraps are cached, None to always unwrap the mesh.
+    :param chart_options: dictionary of xatlas.ChartOptions, see parametrize.
+    :param pack_options: dictionary of xatlas.PackOptions, see parametrize.
+    :param geometry: Geometry of the mesh if it is already in memory (see GeometryStore), None to read input_file.
+    :param progress: function called with a description of every stage before it starts, e.g. to show the progress
+           in the GUI. It may raise an exception to cancel the computation.
+    :param source: Geometry of a finer mesh of the same surface from which colors, normals and positions are baked,
+           e.g. the mesh before decimation. None to interpolate them over the faces of the mesh itself.
+    :param color_sampler: PointColorSampler of the input point cloud from which the colors of the texture are taken,
+           None to take them from the mesh.
+    :return: UnwrapStatistics of the xatlas unwrap
     '''
-    mesh = trimesh.load(input_file + ".ply")
-    print("starting xatlas unwrap!")
-    vmapping, indices, uvs = xatlas.parametrize(mesh.vertices, mesh.faces)
-    print("Finished xatlas unwrap!")
-
-    # accessing vertex and face information from original file:
-    vertices = mesh.vertices[vmapping]
-    vertex_colors = mesh.visual.vertex_colors[vmapping]     # get the color per vertex after xatlas conversion
-    vertex_normals = mesh.vertex_normals[vmapping]          # contains normal vertices after xatlas conversion
-
-    # compute the maximum range of vertices for each dimension of the texture box
-    min_positions = np.argmin(vertices, axis=0)  # find the minimum for each column
-    max_positions = np.argmax(vertices, axis=0)  # find the maximum for each column
-
-    # calculate the ranges per axis
-    x_range = vertices[max_positions[0], 0] - vertices[min_positions[0], 0]
-    y_range = vertices[max_positions[1], 1] - vertices[min_positions[1], 1]
-    z_range = vertices[max_positions[2], 2] - vertices[min_positions[2], 2]
-    ranges = [x_range, y_range, z_range]
-    color_range = ranges[np.argmax(ranges)]  # np.argmax returns position of max value --> in ranges to get value
+    if geometry is None:
+        geometry = read_geometry(input_file + ".ply")
+    if geometry is None or not geometry.is_mesh:
+        raise ValueError("{}.ply does not contain a triangle mesh".format(input_file))
+    progress = progress or (lambda stage: None)
+    # the pixels of the faces are taken from the texel buffer of the last run if the mesh did not move
+    key = texel_key(geometry.vertices, geometry.triangles, textureWidth, chart_options, pack_options)
+    texels = TexelBuffer.load(str(image_name) + "_texels", key)
+    if texels is not None:
+        statistics = UnwrapStatistics(*texels.statistics, cached=True)
+        print("[Info] Texel buffer taken from {}_texels.npy: {}".format(image_name, statistics))
+    else:
+        progress("xatlas unwrap")
+        vmapping, indices, uvs, statistics = parametrize(geometry.vertices, geometry.triangles, uv_cache,
+                                                         chart_options, pack_options)
+        progress("rasterizing {0}x{0} texture".format(textureWidth))
+        face_index, barycentrics = rasterize(indices, uvs, textureWidth)
+        # the faces of the buffer refer to the vertices of the mesh instead of the vertices split by xatlas
+        texels = TexelBuffer(face_index, barycentrics, vmapping[indices].astype(np.int32), key,
+                             np.array([statistics.chart_count, statistics.utilization, statistics.width,
+                                       statistics.height, statistics.atlas_count]))
+        texels.save(str(image_name) + "_texels")
 
-    # UV COORDINATES (of Vertices)
-    (pixel_color_array, pixel_normal_array, pixel_position_array) = create_texture(vertices, indices, textureWidth, uvs, vertex_colors, vertex_normals, color_range, image_name)
+    vertices = geometry.vertices
+    colors = geometry.colors if len(geometry.colors) > 0 else np.full((len(geometry.vertices), 3), 0.4)
+    vertex_colors = np.rint(colors * 255)
+    vertex_normals = geometry.normals
+
+    # compute the maximum range of the vertices of the faces for each dimension of the texture box
+    used = vertices[np.unique(texels.faces)]
+    ranges = used.max(axis=0) - used.min(axis=0) if len(used) else np.ones(3)
+    color_range = ranges[np.argmax(ranges)]  # np.argmax returns position of max value --> in ranges to get value
 
-    cv = trimesh.visual.color.ColorVisuals(mesh, None, pixel_color_array)
+    progress("shading {0}x{0} texture".format(textureWidth))
+    (pixel_color_array, pixel_normal_array, pixel_position_array, coverage) = create_texture(
+        vertices, texels, vertex_colors, vertex_normals, color_range, source, color_sampler)
+    progress("filling gutters")
+    dilate_texture(pixel_color_array, pixel_normal_array, pixel_position_array, coverage, padding)
+    progress("saving maps")
 
     # save texture map
     im = Image.fromarray(pixel_color_array)
@@ -51,83 +173,291 @@ def get_texture_from_vertex_color(input_file: str, image_name:str, textureWidth:
     # save position map
     im_n = Image.fromarray(pixel_position_array)
     im_n.save(str(image_name) + '_position.png')
+    return statistics
 
-@jit(nopython=True, cache=True, parallel=True)
-def create_texture(vertices, faces, textureWidth, uv_coordinates, colors, normals, color_range, image_name):
+# edge length in pixels of the square tiles into which the texture is split for rasterization
+TILE_SIZE = 64
+
+
+def rasterize(faces, uv_coordinates, textureWidth):
     '''
-    Create the texture for the given set of vertices. Trios of vertices form faces. For each face, given color values
-    are interpolated so that the texture of the faces can be computed without holes.
+    Rasterize the faces in UV space. The faces are first sorted into square tiles of the texture. The tiles are
+    rasterized in parallel, each by one thread, so no pixel is ever written by two threads at the same time and the
+    result is deterministic: if faces overlap in UV space, the face with the higher index wins, as in a sequential pass
+    over all faces. See bin_faces and rasterize_tiles.
+    :return: tuple (face_index, barycentrics) as returned by rasterize_tiles
+    '''
+    tile_start, tile_faces = bin_faces(faces, uv_coordinates, textureWidth, TILE_SIZE)
+    return rasterize_tiles(faces, uv_coordinates, textureWidth, TILE_SIZE, tile_start, tile_faces)
+
+
+def create_texture(vertices, texels, colors, normals, color_range, source=None, color_sampler=None):
+    '''
+    Create the texture for the given set of vertices from the pixels of its faces. The colors, normals and positions of
+    the vertices are interpolated at every pixel covered by a face by one gather over the texel buffer.
     Texture and normal map will be returned.
     :param vertices: The vertices of the mesh for which a texture shall be created.
-    :param faces: The faces of the mesh formed by always 3 vertices.
-    :param textureWidth: number of pixel for the texture per row.
-           The resulting texture map will contain textureWidth x textureWidth RGB values.
-    :param uv_coordinates: Each vertex can be represented by UV coordinates which are specified in this parameter.
-    :param colors: Contains the color values for each vertex in vertices. Those can be specified in RGB or RGBA but in
-           the latter case, still A will not be considered. colors must be of same length as vertices
-    :param normals: Contains the normal values for each vertex in vertices. Those can be specified in RGB or RGBA but in
-           the latter case, still A will not be considered. colors must be of same length as vertices
-    :param color_range:
-    :param image_name:
+    :param texels: TexelBuffer of the faces of the mesh, see rasterize.
+    :param colors: Contains the color values for each vertex in vertices, as RGB values in [0, 255]. colors must be of
+           same length as vertices
+    :param normals: Contains the normal values for each vertex in vertices. normals must be of same length as vertices
+    :param color_range: largest extent of the mesh along the x, y or z axis, used to scale the positions to colors.
+    :param source: Geometry of a finer mesh from which the pixels are baked (see bake_texels) or None.
+    :param color_sampler: PointColorSampler from which the colors of the pixels are taken or None.
+    :return: tuple containing computed colors for each pixel colors, according normals and positions and the coverage
+             mask, which is True for every pixel covered by a face.
+    '''
+    face_index, barycentrics = texels.face_index, texels.barycentrics
+    if source is not None:
+        (pixel_color_array, pixel_normal_array, pixel_position_array) = bake_texels(
+            face_index, barycentrics, vertices, texels.faces, source, 255 / color_range)
+    else:
+        # the conversions to colors are affine, so they are applied to the vertices before the interpolation.
+        # Positions outside [0, 255] wrap around.
+        pixel_color_array = texels.gather(np.asarray(colors)[:, :3], np.uint8)
+        pixel_normal_array = texels.gather(255 * (np.asarray(normals)[:, :3] / 2 + 0.5), np.uint8)
+        pixel_position_array = texels.gather(np.asarray(vertices) * (255 / color_range), np.uint8)
+    if color_sampler is not None:
+        covered, positions = texel_positions(face_index, barycentrics, vertices, texels.faces, TILE_SIZE)
+        pixel_color_array[covered] = np.rint(np.clip(color_sampler.sample(positions), 0, 1) * 255).astype(np.uint8)
+    return (pixel_color_array, pixel_normal_array, pixel_position_array, face_index >= 0)
+
+
+@njit(cache=True)
+def face_pixel_bounds(uv_coordinates, face, textureWidth):
+    '''
+    Compute the pixels whose centers may lie within the face.
+    :return: tuple (first column, last column, first row, last row), all inclusive and clamped to the texture. The
+             face covers no pixel if first > last.
+    '''
+    u1 = uv_coordinates[face[0], 0] * textureWidth
+    u2 = uv_coordinates[face[1], 0] * textureWidth
+    u3 = uv_coordinates[face[2], 0] * textureWidth
+    v1 = uv_coordinates[face[0], 1] * textureWidth
+    v2 = uv_coordinates[face[1], 1] * textureWidth
+    v3 = uv_coordinates[face[2], 1] * textureWidth
+    # pixel x has its center at x + 0.5
+    start_x = max(int(np.ceil(min(u1, u2, u3) - 0.5)), 0)
+    end_x = min(int(np.floor(max(u1, u2, u3) - 0.5)), textureWidth - 1)
+    start_y = max(int(np.ceil(min(v1, v2, v3) - 0.5)), 0)
+    end_y = min(int(np.floor(max(v1, v2, v3) - 0.5)), textureWidth - 1)
+    return start_x, end_x, start_y, end_y
+
+
+@njit(cache=True)
+def bin_faces(faces, uv_coordinates, textureWidth, tile_size):
+    '''
+    Sort the faces into the square tiles of the texture which are touched by their bounding boxes.
+    :return: tuple (tile_start, tile_faces). The faces of tile t are tile_faces[tile_start[t]:tile_start[t + 1]],
+             in increasing order. Tile t covers the columns (t % tiles per row) * tile_size and the rows
+             (t // tiles per row) * tile_size.
+    '''
+    tiles_per_row = (textureWidth + tile_size - 1) // tile_size
+    tile_start = np.zeros(tiles_per_row * tiles_per_row + 1, dtype=np.int64)
+
+    # count the faces per tile
+    for i in range(len(faces)):
+        start_x, end_x, start_y, end_y = face_pixel_bounds(uv_coordinates, faces[i], textureWidth)
+        if start_x > end_x or start_y > end_y:
+            continue
+        for tile_y in range(start_y // tile_size, end_y // tile_size + 1):
+            for tile_x in range(start_x // tile_size, end_x // tile_size + 1):
+                tile_start[tile_y * tiles_per_row + tile_x + 1] += 1
+    tile_start = np.cumsum(tile_start)
+
+    # fill in the faces, the sequential loop keeps them sorted within each tile
+    tile_faces = np.empty(tile_start[-1], dtype=np.int64)
+    fill = tile_start[:-1].copy()
+    for i in range(len(faces)):
+        start_x, end_x, start_y, end_y = face_pixel_bounds(uv_coordinates, faces[i], textureWidth)
+        if start_x > end_x or start_y > end_y:
+            continue
+        for tile_y in range(start_y // tile_size, end_y // tile_size + 1):
+            for tile_x in range(start_x // tile_size, end_x // tile_size + 1):
+                tile = tile_y * tiles_per_row + tile_x
+                tile_faces[fill[tile]] = i
+                fill[tile] += 1
+    return tile_start, tile_faces
+
+
+@njit(cache=True, parallel=True)
+def rasterize_tiles(faces, uv_coordinates, textureWidth, tile_size, tile_start, tile_faces):
+    '''
+    Find for each pixel the face covering its center and the barycentric coordinates of the center within that face.
+    Each row of a face is walked with incremental edge functions, starting at the first pixel inside the face.
+    :return: tuple (face_index, barycentrics). face_index[x, y] is the face covering pixel (x, y) or -1, the weights of
+             the face's first two vertices are barycentrics[x, y], the weight of the third one is 1 minus their sum.
+    '''
+    face_index = np.full((textureWidth, textureWidth), -1, dtype=np.int32)
+    barycentrics = np.zeros((textureWidth, textureWidth, 2), dtype=np.float32)
+    tiles_per_row = (textureWidth + tile_size - 1) // tile_size
+    eps = -1e-6  # small tolerance, so that pixels on an edge shared by two faces are not missed by both
+
+    for tile in prange(tiles_per_row * tiles_per_row):
+        tile_x0 = (tile % tiles_per_row) * tile_size
+        tile_y0 = (tile // tiles_per_row) * tile_size
+        tile_x1 = min(tile_x0 + tile_size, textureWidth) - 1
+        tile_y1 = min(tile_y0 + tile_size, textureWidth) - 1
+
+        for k in range(tile_start[tile], tile_start[tile + 1]):
+            i = tile_faces[k]
+            face = faces[i]
+            u1 = uv_coordinates[face[0], 0] * textureWidth
+            v1 = uv_coordinates[face[0], 1] * textureWidth
+            u2 = uv_coordinates[face[1], 0] * textureWidth
+            v2 = uv_coordinates[face[1], 1] * textureWidth
+            u3 = uv_coordinates[face[2], 0] * textureWidth
+            v3 = uv_coordinates[face[2], 1] * textureWidth
+            area = (u2 - u1) * (v3 - v1) - (v2 - v1) * (u3 - u1)
+            if area == 0:
+                continue  # degenerated face
+
+            # edge functions w(x, y) = a * x + b * y + c, normalized so that they are the barycentric coordinates
+            a1 = (v2 - v3) / area
+            b1 = (u3 - u2) / area
+            c1 = (u2 * v3 - u3 * v2) / area
+            a2 = (v3 - v1) / area
+            b2 = (u1 - u3) / area
+            c2 = (u3 * v1 - u1 * v3) / area
+            a3 = -a1 - a2
+
+            start_x, end_x, start_y, end_y = face_pixel_bounds(uv_coordinates, face, textureWidth)
+            start_x = max(start_x, tile_x0)
+            end_x = min(end_x, tile_x1)
+            for y in range(max(start_y, tile_y0), min(end_y, tile_y1) + 1):
+                py = y + 0.5
+                r1 = b1 * py + c1
+                r2 = b2 * py + c2
+                r3 = 1 - r1 - r2
+
+                # scanline: intersect the half planes w_i(x) = a_i * x + r_i >= 0 to get the span of the row
+                span_start = start_x + 0.5
+                span_end = end_x + 0.5
+                if a1 > 0:
+                    span_start = max(span_start, -r1 / a1)
+                elif a1 < 0:
+                    span_end = min(span_end, -r1 / a1)
+                if a2 > 0:
+                    span_start = max(span_start, -r2 / a2)
+                elif a2 < 0:
+                    span_end = min(span_end, -r2 / a2)
+                if a3 > 0:
+                    span_start = max(span_start, -r3 / a3)
+                elif a3 < 0:
+                    span_end = min(span_end, -r3 / a3)
+                if span_start > span_end + 1:
+                    continue
+                x_start = max(int(np.ceil(span_start - 0.5)) - 1, start_x)
+                x_end = min(int(np.floor(span_end - 0.5)) + 1, end_x)
+                if x_start > x_end:
+                    continue
+
+                # step along the row
+                px = x_start + 0.5
+                w1 = a1 * px + r1
+                w2 = a2 * px + r2
+                for x in range(x_start, x_end + 1):
+                    if w1 >= eps and w2 >= eps and 1 - w1 - w2 >= eps:
+                        face_index[x, y] = i
+                        barycentrics[x, y, 0] = w1
+                        barycentrics[x, y, 1] = w2
+                    w1 += a1
+                    w2 += a2
+    return face_index, barycentrics
+
+
+def texel_positions(face_index, barycentrics, vertices, faces, tile_size: int = 0):
+    '''
+    Interpolate the 3D positions of the pixels covered by a face.
+    :param tile_size: if > 0, the pixels are ordered tile by tile, so that neighboring positions are processed together
+    :return: tuple (covered, positions), covered are the index arrays (x, y) of the pixels, positions has shape (m, 3)
+    '''
+    covered = np.nonzero(face_index >= 0)
+    if tile_size > 0:
+        tiles_per_row = (face_index.shape[0] + tile_size - 1) // tile_size
+        order = np.argsort((covered[1] // tile_size) * tiles_per_row + covered[0] // tile_size, kind="stable")
+        covered = (covered[0][order], covered[1][order])
+    corners = faces[face_index[covered]]
+    weights = barycentrics[covered].astype(np.float64)
+    positions = weights[:, 0:1] * vertices[corners[:, 0]] + weights[:, 1:2] * vertices[corners[:, 1]] + \
+        (1 - weights.sum(axis=1))[:, None] * vertices[corners[:, 2]]
+    return covered, positions
+
+
+def bake_texels(face_index, barycentrics, vertices, faces, source, position_color_range):
+    '''
+    Bake colors, normals and positions of the finer mesh source: for every pixel covered by a face, the point of the
+    face at the pixel is moved to the closest point of source, whose values are interpolated over its triangle.
+    :param source: Geometry of the finer triangle mesh
     :return: tuple containing computed colors for each pixel colors, according normals and positions.
     '''
-    ### INIT storing arrays
+    textureWidth = face_index.shape[0]
     textureShape = (textureWidth, textureWidth, 3)
-    pixel_color_array = np.zeros(textureShape, dtype=np.uint8)  # the texture to which the color will be mapped
-    pixel_normal_array = np.zeros(textureShape, dtype=np.uint8)  # the texture to which the normal color will be mapped
-    pixel_position_array = np.zeros(textureShape, dtype=np.uint8)  # the texture to which the position of the vertices will be mapped
-
-    position_color_range = 255/color_range
-
-    # process faces
-    for i in prange(0, len(faces)):
-        face = faces[i]
-        # get indices of vertices 0, 1 and 2 which are defining the face
-        iVertex0 = face[0]
-        iVertex1 = face[1]
-        iVertex2 = face[2]
-
-        u1 = uv_coordinates[iVertex0, 0]
-        v1 = uv_coordinates[iVertex0, 1]
-        u2 = uv_coordinates[iVertex1, 0]
-        v2 = uv_coordinates[iVertex1, 1]
-        u3 = uv_coordinates[iVertex2, 0]
-        v3 = uv_coordinates[iVertex2, 1]
-        # precompute for plane with P_Vertex1_Vertex2
-        v2v3 = v2-v3
-        u2u3 = u2-u3
-        # precompute for plane with P_Vertex2_Vertex0
-        v3v1 = v3-v1
-        u3u1 = u3-u1
-
-        # get smallest square of pixels that includes all three vertex positions
-        sqr_start_u = int(min(u1, u2, u3) * textureWidth)
-        sqr_end_u = int(max(u1, u2, u3) * textureWidth)
-        sqr_start_v = int(min(v1, v2, v3) * textureWidth)
-        sqr_end_v = int(max(v1, v2, v3) * textureWidth)
-
-        # cycle through each pixel within the square to see if the pixel is within the triangle
-        for y in prange(sqr_start_v, sqr_end_v):
-            for x in prange(sqr_start_u, sqr_end_u):
-                xNorm = x / textureWidth  # x normalized to value between 0 and 1 (easier to calculate)
-                yNorm = y / textureWidth  # y normalized to value between 0 and 1 (easier to calculate)
-
-                # see https://ceng2.ktu.edu.tr/~cakir/files/grafikler/Texture_Mapping.pdf
-                a = (xNorm - u2)*v2v3 - u2u3*(yNorm - v2)  # compute area between pixel, v2 and v3
-                b = (xNorm - u3)*v3v1 - u3u1*(yNorm - v3)  # compute area between pixel, v3 and v1
-                c = 1 - a - b
-
-                # check if point is within triangle
-                if 0 <= a and 0 <= b and 0 <= c and (a + b + c) <= 1:
-                    # color the pixel depending on the lerp between the three pixels
-                    # colors might have shape of (lenOfVertices, 4) if it stores RGBA values --> only use RGB
-                    pixel_color = (a * colors[iVertex0, :3] + b * colors[iVertex1, :3] + c * colors[iVertex2, :3])
-                    pixel_color_array[x, y] = pixel_color
-
-                    pColor = (a * normals[iVertex0] + b * normals[iVertex1] + c * normals[iVertex2])/2
-                    pixel_normal_color = [int(255*(pColor[0] + 0.5)), int(255*(pColor[1] + 0.5)), int(255*(pColor[2] + 0.5))]
-                    pixel_normal_array[x, y] = pixel_normal_color
-
-                    pixel_position_color = position_color_range * (a * vertices[iVertex0] + b * vertices[iVertex1] + c * vertices[iVertex2])
-                    pixel_position_array[x, y] = pixel_position_color
-    return (pixel_color_array, pixel_normal_array, pixel_position_array)
\ No newline at end of file
+    pixel_color_array = np.zeros(textureShape, dtype=np.uint8)
+    pixel_normal_array = np.zeros(textureShape, dtype=np.uint8)
+    pixel_position_array = np.zeros(textureShape, dtype=np.uint8)
+    covered, points = texel_positions(face_index, barycentrics, vertices, faces)
+    if len(points) == 0:
+        return (pixel_color_array, pixel_normal_array, pixel_position_array)
+
+    scene = o3d.t.geometry.RaycastingScene()
+    scene.add_triangles(o3d.core.Tensor(source.vertices.astype(np.float32)),
+                        o3d.core.Tensor(source.triangles.astype(np.uint32)))
+    closest = scene.compute_closest_points(o3d.core.Tensor(points.astype(np.float32)))
+    source_corners = source.triangles[closest["primitive_ids"].numpy()]
+    uv = closest["primitive_uvs"].numpy().astype(np.float64)
+    # the closest point is (1 - u - v) * first + u * second + v * third vertex of the triangle
+    source_weights = np.stack((1 - uv[:, 0] - uv[:, 1], uv[:, 0], uv[:, 1]), axis=1)
+
+    def interpolate(values):
+        return np.einsum("ij,ijk->ik", source_weights, values[source_corners])
+
+    source_colors = source.colors if len(source.colors) > 0 else np.full((len(source.vertices), 3), 0.4)
+    normals = interpolate(source.normals)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    pixel_color_array[covered] = np.clip(interpolate(source_colors) * 255, 0, 255).astype(np.uint8)
+    pixel_normal_array[covered] = (255 * (normals / 2 + 0.5)).astype(np.uint8)
+    # same conversion as in create_texture, positions outside [0, 255] wrap around
+    positions = position_color_range * closest["points"].numpy().astype(np.float64)
+    pixel_position_array[covered] = positions.astype(np.int64).astype(np.uint8)
+    return (pixel_color_array, pixel_normal_array, pixel_position_array)
+
+
+@njit(cache=True, parallel=True)
+def dilate_texture(pixel_color_array, pixel_normal_array, pixel_position_array, coverage, padding):
+    '''
+    Fill the gutters around the UV charts in place: in each of the padding passes, every pixel which is not covered
+    but has covered neighbors (8-neighborhood) gets the average of those neighbors and counts as covered afterwards.
+    :param coverage: mask which is True for every pixel covered by a face, it is updated in place.
+    :param padding: number of passes, i.e. how many pixels the charts grow.
+    '''
+    textureWidth = coverage.shape[0]
+    for _ in range(padding):
+        # only pixels which were uncovered before the pass are written, so reading the neighbors is race-free
+        grown = coverage.copy()
+        for x in prange(textureWidth):
+            color = np.zeros(3, dtype=np.int32)
+            normal = np.zeros(3, dtype=np.int32)
+            position = np.zeros(3, dtype=np.int32)
+            for y in range(textureWidth):
+                if coverage[x, y]:
+                    continue
+                count = 0
+                color[:] = 0
+                normal[:] = 0
+                position[:] = 0
+                for nx in range(max(x - 1, 0), min(x + 2, textureWidth)):
+                    for ny in range(max(y - 1, 0), min(y + 2, textureWidth)):
+                        if coverage[nx, ny]:
+                            count += 1
+                            for channel in range(3):
+                                color[channel] += pixel_color_array[nx, ny, channel]
+                                normal[channel] += pixel_normal_array[nx, ny, channel]
+                                position[channel] += pixel_position_array[nx, ny, channel]
+                if count > 0:
+                    for channel in range(3):
+                        pixel_color_array[x, y, channel] = color[channel] // count
+                        pixel_normal_array[x, y, channel] = normal[channel] // count
+                        pixel_position_array[x, y, channel] = position[channel] // count
+                    grown[x, y] = True
+        coverage[:] = grown
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def content_hash(*arrays, **options):
+    '''
+    Compute a key for a cache from the content of numpy arrays and further options.
+    :param arrays: arrays whose bytes, shape and dtype are hashed.
+    :param options: further values which influence the cached result, e.g. parameters of an algorithm.
+    :return: hex digest
+    '''
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update("{}{}".format(array.dtype.str, array.shape).encode())
+        digest.update(array.view(np.uint8).reshape(-1).data)
+    for key in sorted(options):
+        digest.update("{}={!r};".format(key, options[key]).encode())
+    return digest.hexdigest()
+
+
+# digests of files already hashed by this process: (path, modification time, size) -> digest
+_file_digests = {}
+
+
+def file_hash(path: str):
+    '''
+    Compute the sha256 digest of the content of a file. The digest is remembered as long as modification time and size
+    of the file do not change, so a large point cloud is only read once per process.
+    :return: hex digest
+    '''
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+class DiskCache:
+    '''
+    Class DiskCache stores files in a directory, e.g. results of expensive computations, under a name derived from
+    their content (see content_hash). The directory is limited to max_size MB: when it is exceeded, the least recently
+    used files are deleted. Every hit updates the modification time of the file, which is used as time of last use.
+    Several processes may use the same directory, files are only ever replaced atomically.
+    '''
+    def __init__(self, directory: str, max_size: float = 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str):
+        return os.path.join(self.directory, name)
+
+    def lookup(self, name: str):
+        '''
+        :return: path of the cached file name or None if it is not cached
+        '''
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def load_arrays(self, name: str):
+        '''
+        :return: dictionary of the arrays cached under name (see store_arrays) or None if they are not cached
+        '''
+        path = self.lookup(name + ".npz")
+        if path is None:
+            return None
+        try:
+            with np.load(path) as data:
+                return {key: data[key] for key in data.files}
+        except (OSError, ValueError):
+            # evicted by another process in the meantime or damaged
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def store_arrays(self, name: str, **arrays):
+        '''
+        Store numpy arrays in the cache as one uncompressed .npz file.
+        :return: path of the cached file
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp", suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        return self._add(name + ".npz", tmp_path)
+
+    def store_file(self, name: str, source: str):
+        '''
+        Store a copy of the file source in the cache.
+        :return: path of the cached file
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f, open(source, "rb") as src:
+            shutil.copyfileobj(src, f, 1 << 20)
+        return self._add(name, tmp_path)
+
+    def size(self):
+        '''
+        :return: size of all cached files in MB
+        '''
+        return sum(size for _, _, size in self._entries()) / (1 << 20)
+
+    def _add(self, name, tmp_path):
+        path = self.path(name)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def evict(self, keep: str = None):
+        '''
+        Delete the least recently used files until the cache is not larger than max_size.
+        :param keep: path of a file which must not be deleted (e.g. the one which was just added).
+        '''
+        entries = sorted(self._entries())
+        size = sum(entry[2] for entry in entries)
+        for _, path, entry_size in entries:
+            if size <= self.max_size * (1 << 20):
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+    def __repr__(self):
+        return "DiskCache({}, hits={}, misses={})".format(self.directory, self.hits, self.misses)
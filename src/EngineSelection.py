@@ -0,0 +1,133 @@
+import copy
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+
+from src.GeometryStore import read_geometry
+from src.PointCloudStream import read_ply_vertices
+from src.PoissonReconstruction import ENGINES, run_poisson_reconstruction
+
+'''
+Selection of the reconstruction engine. Screened Poisson (PoissonRecon) and smooth signed distance reconstruction
+(SSDRecon) solve for the implicit function differently, and which one is faster depends on the data: on some noisy scans
+SSD converges in fewer iterations, on others Poisson is faster. With the engine "auto" the engine is chosen per dataset
+class from the runs recorded in the metrics log: the engine with the lower median wall time is used. As long as an
+engine has no runs for the class, both engines are run as benchmark, their runs are recorded and the mesh of the faster
+one is kept.
+'''
+
+
+def count_points(input_file: str):
+    '''
+    :return: number of points of the point cloud file, only the header is read for binary PLY files
+    '''
+    vertices = read_ply_vertices(input_file) if input_file.lower().endswith(".ply") else None
+    if vertices is not None:
+        return vertices.count
+    geometry = read_geometry(input_file)
+    return len(geometry.vertices) if geometry is not None else 0
+
+
+def get_dataset_class(config, points_count: int):
+    '''
+    :return: config.dataset_class if it is set, otherwise the order of magnitude of the number of points, e.g. "1e5"
+    '''
+    if config.dataset_class:
+        return config.dataset_class
+    return "1e{}".format(int(math.log10(points_count))) if points_count > 0 else "empty"
+
+
+def load_engine_costs(metrics_log: str, dataset_class: str):
+    '''
+    Collect the runs of every engine for the dataset class from the metrics log. Cached and failed runs are ignored.
+    :return: dictionary engine -> tuple (median wall time in seconds, median peak memory in MB or None, number of runs)
+    '''
+    times = {engine: [] for engine in ENGINES}
+    memories = {engine: [] for engine in ENGINES}
+    if metrics_log and os.path.exists(metrics_log):
+        with open(metrics_log) as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                engine = record.get("engine")
+                if record.get("dataset_class") != dataset_class or engine not in ENGINES or record.get("cached") \
+                        or record.get("returncode") != 0 or record.get("cancelled"):
+                    continue
+                times[engine].append(record["wall_time"])
+                if record.get("peak_memory"):
+                    memories[engine].append(record["peak_memory"])
+    return {engine: (float(np.median(times[engine])),
+                     float(np.median(memories[engine])) if memories[engine] else None, len(times[engine]))
+            for engine in ENGINES if times[engine]}
+
+
+def choose_engine(costs):
+    '''
+    :param costs: dictionary as returned by load_engine_costs
+    :return: the engine with the lowest median wall time, None if not every engine has runs
+    '''
+    if any(engine not in costs for engine in ENGINES):
+        return None
+    return min(ENGINES, key=lambda engine: costs[engine][0])
+
+
+def with_engine(config, engine: str):
+    '''
+    :return: copy of config running engine
+    '''
+    config = copy.copy(config)
+    config.engine = engine
+    return config
+
+
+def run_reconstruction(settings, config, input_file: str, output_file: str, on_output=None, cancel=None,
+                       mesh_cache=None, metrics=None, points_count: int = None):
+    '''
+    Reconstruct the mesh with the engine of config, the counterpart of run_poisson_reconstruction which also resolves
+    the engine "auto" (see above). The parameters are those of run_poisson_reconstruction.
+    :param points_count: number of points of input_file if it is already known, used for the dataset class
+    :return: ReconstructionRun of the engine whose mesh was written to output_file + '.ply', None if no engine could
+             be found
+    '''
+    if config.engine != "auto":
+        return run_poisson_reconstruction(settings, config, input_file, output_file, on_output, cancel, mesh_cache,
+                                          metrics)
+    if points_count is None:
+        points_count = count_points(input_file)
+    dataset_class = get_dataset_class(config, points_count)
+    metrics = dict(metrics or {}, dataset_class=dataset_class)
+    costs = load_engine_costs(config.metrics_log, dataset_class)
+    engine = choose_engine(costs)
+    if engine is not None:
+        print("[Info] Engine {} chosen for dataset class {}: {}".format(engine, dataset_class, ", ".join(
+            "{} {:.1f} s ({} runs)".format(name, cost[0], cost[2]) for name, cost in sorted(costs.items()))))
+        return run_poisson_reconstruction(settings, with_engine(config, engine), input_file, output_file, on_output,
+                                          cancel, mesh_cache, metrics)
+
+    if not config.metrics_log:
+        print("[WARNING] Engine auto needs a metrics log to remember the benchmark, every run is a benchmark")
+    print("[Info] Benchmarking the engines for dataset class", dataset_class)
+    best = None
+    for engine in ENGINES:
+        # the meshes are not taken from the cache, so the wall times are measured
+        run = run_poisson_reconstruction(settings, with_engine(config, engine), input_file, output_file + "_" + engine,
+                                         on_output, cancel, None, metrics)
+        if run is not None and run.cancelled:
+            best = (engine, run)
+            break
+        if run is not None and run.succeeded and (best is None or run.wall_time < best[1].wall_time):
+            best = (engine, run)
+    if best is None:
+        return None
+    for engine in ENGINES:
+        if engine != best[0] and os.path.exists(output_file + "_" + engine + ".ply"):
+            os.remove(output_file + "_" + engine + ".ply")
+    if os.path.exists(output_file + "_" + best[0] + ".ply"):
+        shutil.move(output_file + "_" + best[0] + ".ply", output_file + ".ply")
+    print("[Info] Engine {} was faster: {}".format(best[0], best[1]))
+    return best[1]
@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import open3d as o3d
+
+'''
+Geometry store which parses every file only once. The Open3D geometry read from a file is kept in memory and is shared
+by all stages: the viewer renders it directly and normal estimation, PoissonRecon input preparation and the texturing
+get numpy views (np.asarray) of its vertex, normal, color and triangle buffers instead of copies or of reading the file
+again with another library.
+'''
+
+
+class Geometry:
+    '''
+    Class Geometry wraps the Open3D point cloud or triangle mesh read from path. The properties return numpy views of
+    the Open3D buffers, so changes, e.g. estimated normals, are visible to every user of the geometry.
+    '''
+    def __init__(self, path: str, geometry):
+        self.path = path
+        self.geometry = geometry
+        self._cloud = geometry if isinstance(geometry, o3d.geometry.PointCloud) else None
+
+    @property
+    def is_mesh(self):
+        return isinstance(self.geometry, o3d.geometry.TriangleMesh)
+
+    @property
+    def vertices(self):
+        return np.asarray(self.geometry.vertices if self.is_mesh else self.geometry.points)
+
+    @property
+    def normals(self):
+        '''
+        :return: normals per vertex, computed from the triangles for a mesh without normals
+        '''
+        if self.is_mesh:
+            if not self.geometry.has_vertex_normals():
+                self.geometry.compute_vertex_normals()
+            return np.asarray(self.geometry.vertex_normals)
+        return np.asarray(self.geometry.normals)
+
+    @property
+    def colors(self):
+        '''
+        :return: colors per vertex as floats in [0, 1] (empty if the file has no colors)
+        '''
+        return np.asarray(self.geometry.vertex_colors if self.is_mesh else self.geometry.colors)
+
+    @property
+    def triangles(self):
+        return np.asarray(self.geometry.triangles) if self.is_mesh else np.zeros((0, 3), dtype=np.int32)
+
+    @property
+    def cloud(self):
+        '''
+        :return: the geometry as point cloud. For a mesh the vertices are copied once into a point cloud.
+        '''
+        if self._cloud is None:
+            self._cloud = o3d.geometry.PointCloud(self.geometry.vertices)
+            if self.geometry.has_vertex_normals():
+                self._cloud.normals = self.geometry.vertex_normals
+            if self.geometry.has_vertex_colors():
+                self._cloud.colors = self.geometry.vertex_colors
+        return self._cloud
+
+    def __repr__(self):
+        return "Geometry({}, vertices={}, triangles={})".format(self.path, len(self.vertices), len(self.triangles))
+
+
+def read_geometry(path: str):
+    '''
+    Read a point cloud or triangle mesh. Files without triangles are read as point cloud.
+    :return: Geometry or None if the file could not be read
+    '''
+    geometry = None
+    try:
+        if o3d.io.read_file_geometry_type(path) & o3d.io.CONTAINS_TRIANGLES:
+            mesh = o3d.io.read_triangle_mesh(path)
+            if len(mesh.triangles) > 0:
+                geometry = mesh
+        if geometry is None:
+            geometry = o3d.io.read_point_cloud(path, remove_nan_points=False, remove_infinite_points=False)
+    except Exception:
+        return None
+    if geometry.is_empty():
+        return None
+    return Geometry(path, geometry)
+
+
+class GeometryStore:
+    '''
+    Class GeometryStore keeps the geometries of the last max_entries files in memory. A file is parsed again only if it
+    was changed on disk in the meantime (e.g. a mesh rewritten by PoissonRecon), which is detected by its modification
+    time and size. The store is shared by the UI thread and the background tasks: the entries are guarded by a lock,
+    files are parsed outside of it.
+    '''
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, path: str):
+        '''
+        :return: Geometry of the file path, read from disk only if it is not in the store or changed. None if the file
+                 could not be read.
+        '''
+        key = self._key(path)
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        geometry = read_geometry(path)
+        if geometry is not None:
+            self._put(key, stamp, geometry)
+        return geometry
+
+    def add(self, path: str, geometry: Geometry):
+        '''
+        Register a geometry which was written to path by this process, so that it is not parsed again.
+        '''
+        self._put(self._key(path), self._stamp(path), geometry)
+
+    def _put(self, key, stamp, geometry):
+        with self._lock:
+            self._entries[key] = (stamp, geometry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
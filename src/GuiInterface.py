@@ -2,25 +2,43 @@ import open3d as o3d
 import open3d.visualization.gui as gui
 import open3d.visualization.rendering as rendering
 from src.GuiParameters import Parameters
-from src.PoissonReconstruction import run_poisson_reconstruction
+from src.PointCloudInput import prepare_point_cloud
+from src.EngineSelection import run_reconstruction
+from src.AdaptiveDepth import plan_depth, report_plan
+from src.SurfaceTrimming import trim_surface
 from src.ColorToTexture import get_texture_from_vertex_color
+from src.BackgroundTask import BackgroundTask, TaskCancelled
+from src.DiskCache import DiskCache
+from src.GeometryStore import GeometryStore
+from src.ReconstructionConfig import ReconstructionConfig
+from src.Settings import Settings
+import copy
+import time
 import numpy as np
 
+# seconds between two checks whether the parameters of the running reconstruction were changed
+PARAMETER_CHECK_INTERVAL = 0.25
 
-class Settings:
 
-    gen_filename = "generated_input.ply"
-    input_file = ""
-    output_file = ""
-
-    def __init__(self, main_dir, my_os):
-        # Directories
-        self.main_dir = main_dir
-        self.model_dir = main_dir + "/models/"
-        self.out_dir = main_dir + "/out/"
-
-        # Operation system
-        self.my_os = my_os
+def make_preview_config(config, depth: int):
+    '''
+    :return: copy of config for a fast preview reconstruction at the given depth, without voxel grid, densities and
+             metrics. The engine "auto" is replaced by Poisson, so the preview never benchmarks.
+    '''
+    config = copy.copy(config)
+    config.depth_auto = False
+    config.depth_selected = True
+    config.depth_value = depth
+    config.samplesPerNode_selected = False
+    # a complete octree deeper than the preview would cost more than the preview itself
+    config.fullDepth_value = min(config.fullDepth_value, depth)
+    config.maxSolveDepth_selected = False
+    config.grid_selected = False
+    config.density_selected = False
+    config.metrics_log = ""
+    if config.engine == "auto":
+        config.engine = "poisson"
+    return config
 
 
 class GUI:
@@ -34,9 +52,19 @@ class GUI:
     mesh_button_enabled = False
     uvmap_button_enabled = False
 
+    # BackgroundTask of the running reconstruction or UV mapping, None if nothing is running
+    task = None
+    # parameters (ReconstructionConfig.to_dict) of the running reconstruction, which is cancelled when they change
+    task_parameters = None
+    last_parameter_check = 0.0
+
     def __init__(self, main_dir, my_os):
         # set settings
         self.settings = Settings(main_dir, my_os)
+        self.uv_cache = DiskCache(self.settings.cache_dir + "uv")
+        self.mesh_cache = DiskCache(self.settings.cache_dir + "mesh", ReconstructionConfig.mesh_cache_size)
+        # every file is parsed once, viewer, reconstruction and texturing share the geometry
+        self.store = GeometryStore()
 
         # create window
         self.window = gui.Application.instance.create_window("Poisson Surface Reconstruction", 2200, 1400)
@@ -44,6 +72,7 @@ class GUI:
 
         # set the window's layout
         w.set_on_layout(self._on_layout)
+        w.set_on_tick_event(self._on_tick)
 
         # 3D widget
         self.widget = gui.SceneWidget()
@@ -84,6 +113,14 @@ class GUI:
         self._mesh_button.enabled = False
         self.panel.add_child(self._mesh_button)
 
+        # progress of the running calculation and button to cancel it
+        self._status = gui.Label("")
+        self.panel.add_child(self._status)
+        self._cancel_button = gui.Button("Cancel")
+        self._cancel_button.set_on_clicked(self._on_cancel)
+        self._cancel_button.enabled = False
+        self.panel.add_child(self._cancel_button)
+
         # Parameters class
         self.param = Parameters()
 
@@ -106,6 +143,16 @@ class GUI:
         tabs.add_tab(" 4 ", self.param.tab4(em))
         # tab 5
         tabs.add_tab(" 5 ", self.param.tab5(em))
+        # tab 6
+        self.param.valueWeight_value.set_preferred_width(5.5 * em)
+        self.param.gradientWeight_value.set_preferred_width(5.5 * em)
+        self.param.biLapWeight_value.set_preferred_width(5.5 * em)
+        tabs.add_tab(" 6 ", self.param.tab6(em))
+        # tab 7
+        self.param.maxSolveDepth_value.set_preferred_width(5.5 * em)
+        self.param.fullDepth_value.set_preferred_width(5.5 * em)
+        self.param.cgDepth_value.set_preferred_width(5.5 * em)
+        tabs.add_tab(" 7 ", self.param.tab7(em))
 
         # add tabs to panel
         self.panel.add_child(tabs)
@@ -185,10 +232,17 @@ class GUI:
         self.param.linearFit.checked = self.param.linearFit_selected
         self.param.nWeights.checked = self.param.nWeights_selected
         self.param.degree.checked = self.param.degree_selected
+        self.param.double.checked = self.param.double_selected
+        self.param.maxSolveDepth.checked = self.param.maxSolveDepth_selected
+        self.param.fullDepth.checked = self.param.fullDepth_selected
+        self.param.cgDepth.checked = self.param.cgDepth_selected
+        self.param.polygonMesh.checked = self.param.polygonMesh_selected
 
         # enable buttons
-        self._mesh_button.enabled = self.mesh_button_enabled
-        self._uvmap_button.enabled = self.uvmap_button_enabled
+        running = self.task is not None
+        self._mesh_button.enabled = self.mesh_button_enabled and not running
+        self._uvmap_button.enabled = self.uvmap_button_enabled and not running
+        self._cancel_button.enabled = running
 
     def _on_layout(self, layout_context):
         '''
@@ -229,58 +283,33 @@ class GUI:
         self.settings.input_file = path
         self.window.close_dialog()
         self.check_loaded_file(path)
-        self.plot_result(shader="defaultUnlit")
         self.load(path)
 
     def load(self, path):
         '''
-        Method is basically from: https://github.com/isl-org/Open3D/blob/master/examples/python/gui/vis-gui.py
+        Show the chosen file. It is taken from the geometry store, so the file read by check_loaded_file is not parsed
+        again. Method is basically from: https://github.com/isl-org/Open3D/blob/master/examples/python/gui/vis-gui.py
         '''
-        self.widget.scene.clear_geometry()
-
-        geometry = None
-        geometry_type = o3d.io.read_file_geometry_type(path)
-
-        mesh = None
-        if geometry_type & o3d.io.CONTAINS_TRIANGLES:
-            mesh = o3d.io.read_triangle_mesh(path)
-        if mesh is not None:
-            if len(mesh.triangles) == 0:
-                # Probably always the case for this project
-                print(
-                    "[INFO] Contains 0 triangles, will read as point cloud")
-                mesh = None
-            else:
-                mesh.compute_vertex_normals()
-                if len(mesh.vertex_colors) == 0:
-                    mesh.paint_uniform_color([1, 1, 1])
-                geometry = mesh
-                # Make sure the mesh has texture coordinates
-                if not mesh.has_triangle_uvs():
-                    uv = np.array([[0.0, 0.0]] * (3 * len(mesh.triangles)))
-                    mesh.triangle_uvs = o3d.utility.Vector2dVector(uv)
+        geometry = self.store.load(path)
+        if geometry is None:
+            print("[WARNING] Failed to read", path)
+            return
+        print("[Info] Successfully read", path)
+
+        if geometry.is_mesh:
+            mesh = geometry.geometry
+            mesh.compute_vertex_normals()
+            if len(mesh.vertex_colors) == 0:
+                mesh.paint_uniform_color([1, 1, 1])
+            # Make sure the mesh has texture coordinates
+            if not mesh.has_triangle_uvs():
+                uv = np.array([[0.0, 0.0]] * (3 * len(mesh.triangles)))
+                mesh.triangle_uvs = o3d.utility.Vector2dVector(uv)
+            self.actual_geometry = mesh
         else:
+            # Probably always the case for this project
             print("[Info]", path, "seems to be a point cloud. :)")
-
-        if geometry is None:
-            cloud = o3d.io.read_point_cloud(path)
-            if cloud is not None:
-                print("[Info] Successfully read", path)
-                if not cloud.has_normals():
-                    cloud.estimate_normals()
-                cloud.normalize_normals()
-                geometry = cloud
-            else:
-                print("[WARNING] Failed to read points", path)
-
-        if geometry is not None:
-            try:
-                self.widget.scene.add_geometry("__model__", geometry,
-                                               self.settings.material)
-                bounds = geometry.get_axis_aligned_bounding_box()
-                self.widget.setup_camera(60, bounds, bounds.get_center())
-            except Exception as e:
-                print(e)
+            self.actual_geometry = geometry.cloud
         self.plot_result()
 
     '''
@@ -297,36 +326,13 @@ class GUI:
         self.mesh_button_enabled = True
 
         # check if loaded file has normal and color values
-        geometry = None
-        newfile = False
-
-        if geometry is None:
-            cloud = None
-            try:
-                cloud = o3d.io.read_point_cloud(path, remove_nan_points=False, remove_infinite_points=False)
-            except Exception:
-                pass
-            if cloud is not None:
-                if not cloud.has_normals():
-                    print("[Info] Missing normals: they are calculated")
-                    cloud.estimate_normals()
-                    newfile = True
-                cloud.normalize_normals()
-
-                if not cloud.has_colors():
-                    print("[Info] Missing colors: assign each point uniform colors")
-                    cloud.paint_uniform_color([1.0, 0, 0])
-                    newfile = True
-
-                if newfile:
-                    print("'generated_input.ply' is generated with normals and colors")
-                    new_path = self.settings.model_dir+self.settings.gen_filename
-                    o3d.io.write_point_cloud(new_path, cloud, write_ascii=True, compressed=False)
-                    self._fileedit.text_value = new_path
-                    self.settings.input_file = new_path
-                self.actual_geometry = cloud
-            else:
-                print("[WARNING] Failed to read points", path)
+        cloud, input_file = prepare_point_cloud(path, self.settings.model_dir+self.settings.gen_filename,
+                                                store=self.store, config=self.param.to_config())
+        if cloud is not None:
+            if input_file != path:
+                self._fileedit.text_value = input_file
+                self.settings.input_file = input_file
+            self.actual_geometry = cloud
 
         self.apply_settings()
 
@@ -334,7 +340,11 @@ class GUI:
         self.widget.scene.clear_geometry()
         if path is not None:
             # path should be set if mesh shall be shown
-            self.actual_geometry = o3d.io.read_triangle_mesh(path)
+            geometry = self.store.load(path)
+            if geometry is None:
+                print("[WARNING] Failed to read", path)
+                return
+            self.actual_geometry = geometry.geometry
 
         if not self.actual_geometry.is_empty():
             mat = rendering.Material()
@@ -343,10 +353,58 @@ class GUI:
             bounds = self.actual_geometry.get_axis_aligned_bounding_box()
             self.widget.setup_camera(60, bounds, bounds.get_center())
 
+    '''_________________________________BACKGROUND TASKS_________________________________'''
+    def _start_task(self, function, on_success):
+        '''
+        Run function(task) in a worker thread (see BackgroundTask) while the window stays responsive. Progress messages
+        are shown in the panel, on_success(result) is called in the main thread if the task neither failed nor was
+        cancelled.
+        '''
+        def on_done(result, error):
+            self.task = None
+            self.task_parameters = None
+            if error is None:
+                self._status.text = "Done"
+                on_success(result)
+            elif isinstance(error, TaskCancelled):
+                self._status.text = "Cancelled"
+            else:
+                self._status.text = "Failed: {}".format(error)[:60]
+            self.apply_settings()
+
+        self.task = BackgroundTask(function, self._on_progress, on_done,
+                                   lambda callback: gui.Application.instance.post_to_main_thread(self.window, callback))
+        self.apply_settings()
+        self.task.start()
+
+    def _on_progress(self, message):
+        # PoissonRecon --verbose prints its stages as '#  Stage name:  time (s), memory (MB)'
+        self._status.text = " ".join(message.strip("# ").split())[:60]
+
+    def _on_cancel(self):
+        if self.task is not None:
+            self._status.text = "Cancelling..."
+            self.task.cancel()
+
+    def _on_tick(self):
+        '''
+        Cancel the running reconstruction as soon as the user changes its parameters, its mesh would be outdated.
+        :return: False, nothing has to be redrawn
+        '''
+        now = time.time()
+        if self.task_parameters is None or self.task.cancelled or now - self.last_parameter_check < \
+                PARAMETER_CHECK_INTERVAL:
+            return False
+        self.last_parameter_check = now
+        if self.param.to_config().to_dict() != self.task_parameters:
+            self._status.text = "Parameters changed, cancelling..."
+            self.task.cancel()
+        return False
+
     '''_________________________________ACTION LISTENER FOR BUTTON_________________________________'''
     def on_calculate_mesh(self):
-        # enable uvmap button
-        self.uvmap_button_enabled = True
+        if self.task is not None:
+            return
 
         # set outputfile
         # check for empty field and set default
@@ -355,26 +413,91 @@ class GUI:
         else:
             self.settings.output_file = self.settings.out_dir+"mesh"
 
-        # run poisson reconstruction + xatlas
-        run_poisson_reconstruction(self, self.settings.input_file, self.settings.output_file)
+        config = self.param.to_config()
+        parameters = config.to_dict()
+        # the stage timings of PoissonRecon are shown as progress
+        config.verbose_selected = True
+        input_file = self.settings.input_file
+        output_file = self.settings.output_file
+
+        def reconstruct(task):
+            run_config, plan, metrics = config, None, None
+            if config.depth_auto:
+                task.progress("Choosing depth")
+                geometry = self.store.load(input_file)
+                if geometry is None:
+                    raise RuntimeError("Failed to read points {}".format(input_file))
+                plan = plan_depth(np.asarray(geometry.cloud.points), config)
+                run_config, metrics = plan.apply(config), {"depth_plan": plan.to_dict()}
+            depth = run_config.depth_value if run_config.depth_selected else 8
+            if 0 < config.preview_depth < depth:
+                # a shallow reconstruction takes seconds and shows at once whether the parameters are right
+                task.progress("Preview at depth {}".format(config.preview_depth))
+                preview = run_reconstruction(self.settings, make_preview_config(run_config, config.preview_depth),
+                                             input_file, output_file + "_preview", on_output=lambda line: None,
+                                             cancel=task.cancel_event, mesh_cache=self.mesh_cache)
+                if preview is not None and preview.succeeded:
+                    self.store.load(output_file + "_preview.ply")
+                    task.post(lambda: self._show_preview(output_file + "_preview.ply", config.preview_depth, depth))
+            task.progress("Starting PoissonRecon")
+            run = run_reconstruction(self.settings, run_config, input_file, output_file,
+                                     on_output=lambda line: line and task.report(line),
+                                     cancel=task.cancel_event, mesh_cache=self.mesh_cache, metrics=metrics)
+            if plan is not None:
+                report_plan(plan, run)
+            if run is not None and run.cancelled:
+                raise TaskCancelled()
+            if run is None or not run.succeeded:
+                raise RuntimeError("PoissonRecon failed")
+            if config.density_selected and config.trim_percentile > 0:
+                task.progress("Trimming surface")
+                trim = trim_surface(self.settings, config, output_file + ".ply")
+                if trim is not None:
+                    print("[Info] Trimmed {}.ply: {}".format(output_file, trim))
+            task.progress("Loading mesh")
+            self.store.load(output_file + ".ply")
+            return run
+
+        def on_success(run):
+            # enable uvmap button
+            self.uvmap_button_enabled = True
+            if run.cached:
+                self._status.text = "Mesh taken from cache ({} hits, {} misses)".format(self.mesh_cache.hits,
+                                                                                       self.mesh_cache.misses)
+            else:
+                self._status.text = "Mesh done in {:.1f} s".format(run.wall_time)
+            # plot new generated mesh
+            self.plot_result(output_file + ".ply", "unlitLine")
 
-        # plot new generated mesh
-        self.plot_result(self.settings.output_file+".ply", "unlitLine")
+        self._start_task(reconstruct, on_success)
+        self.task_parameters = parameters
 
-        # apply settings
-        self.apply_settings()
+    def _show_preview(self, path, preview_depth, depth):
+        if self.task is None or self.task.cancelled:
+            return
+        self.plot_result(path, "unlitLine")
+        self._status.text = "Preview (depth {}), computing depth {}".format(preview_depth, depth)
 
     def _on_calculate_uvmap(self):
+        if self.task is not None:
+            return
+
         # output_file is the file where the output from mesh generation was stored
         image_name = str(self.settings.out_dir) + str(self.texture_name.text_value)
-        get_texture_from_vertex_color(self.settings.output_file, image_name)
-
-        # show new generated mesh
-        normal = o3d.io.read_image(str(image_name) + '_normal.png')
-
-        # show texture
-        self._texture_image.update_image(o3d.io.read_image(str(image_name) + '_texture.png'))
-        # show normal map
-        self._normal_image.update_image(o3d.io.read_image(str(image_name) + '_normal.png'))
-        # apply settings2,4615485866666668713
-        self.apply_settings()
\ No newline at end of file
+        output_file = self.settings.output_file
+
+        def bake(task):
+            task.progress("Loading mesh")
+            geometry = self.store.load(output_file + ".ply")
+            return get_texture_from_vertex_color(output_file, image_name, uv_cache=self.uv_cache, geometry=geometry,
+                                                 progress=task.progress)
+
+        def on_success(statistics):
+            self._status.text = "{} charts, {:.0f}% utilization".format(statistics.chart_count,
+                                                                        100 * statistics.utilization)
+            # show texture
+            self._texture_image.update_image(o3d.io.read_image(str(image_name) + '_texture.png'))
+            # show normal map
+            self._normal_image.update_image(o3d.io.read_image(str(image_name) + '_normal.png'))
+
+        self._start_task(bake, on_success)
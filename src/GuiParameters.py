@@ -1,5 +1,6 @@
 import open3d as o3d
 import open3d.visualization.gui as gui
+from src.ReconstructionConfig import ReconstructionConfig
 
 '''
 Class Parameters contains all parameters of the PointCloud2Mesh tool which are available for the user to change when the
@@ -19,6 +20,7 @@ class Parameters:
 
     # second tab
     depth_selected = False          # maximal depth of tree for surface reconstruction (default 8)
+    depth_auto_selected = False     # depth and samples per node chosen from the point spacing
     iters_selected = False          # number of gauss-seidel relaxation at each iteration (default 8)
     degree_selected = False         # degree of B-spline: larger degree = higher order (default 2)
 
@@ -33,11 +35,24 @@ class Parameters:
     scale_selected = False          # ratio of cube diameter for reconstruction and those for bounding (default 1.100)
     threads_selected = False        # number of threads used for parallelization for reconstruntion (default 0)
 
+    # solver tab
+    double_selected = False         # solve in double precision
+    maxSolveDepth_selected = False  # depth up to which the system is solved (default: tree depth)
+    fullDepth_selected = False      # depth up to which the octree is complete (default 5)
+    cgDepth_selected = False        # depth up to which conjugate gradients are used (default 0)
+    polygonMesh_selected = False    # output polygons instead of triangles
+
     # sixth tab: output related
     primalVoxel_selected = False
     density_selected = False
     verbose_selected = False
 
+    # engine tab
+    engine = "poisson"              # "poisson", "ssd" or "auto"
+    valueWeight_selected = False    # SSD: weight of the zero-crossing at the points (default 4)
+    gradientWeight_selected = False  # SSD: weight of the gradient matching the normals (default 0.001)
+    biLapWeight_selected = False    # SSD: weight of the smoothness term (default 0.00001)
+
     def __init__(self):
         # 1 --out <name>
         self.out = gui.Checkbox("Output file")
@@ -69,6 +84,9 @@ class Parameters:
         self.depth.set_on_checked(self.on_depth)
         self.depth_value = gui.NumberEdit(gui.NumberEdit.INT)
         self.depth_value.set_value(8)
+        self.depth_auto = gui.Checkbox("Auto")
+        self.depth_auto.tooltip = "Choose depth and samples per node from the spacing of the points"
+        self.depth_auto.set_on_checked(self.on_depth_auto)
 
         # 5 --iters <GS iters>
         self.iters = gui.Checkbox("Relaxation")
@@ -143,6 +161,66 @@ class Parameters:
         self.verbose.tooltip = "Verbose description of the running times and memory usages of individual components"
         self.verbose.set_on_checked(self.on_verbose)
 
+        # reconstruction engine
+        self.engine_label = gui.Label("Engine")
+        self.engine_box = gui.Combobox()
+        self.engine_box.add_item("Screened Poisson")
+        self.engine_box.add_item("SSD")
+        self.engine_box.add_item("Auto (benchmark)")
+        self.engine_box.set_on_selection_changed(self.on_engine)
+
+        # SSD --valueWeight <zero-crossing weight>
+        self.valueWeight = gui.Checkbox("Value weight")
+        self.valueWeight.tooltip = "SSD: importance of the implicit function being zero at the points"
+        self.valueWeight.set_on_checked(self.on_valueWeight)
+        self.valueWeight_value = gui.NumberEdit(gui.NumberEdit.DOUBLE)
+        self.valueWeight_value.set_value(4.0)
+
+        # SSD --gradientWeight <gradient weight>
+        self.gradientWeight = gui.Checkbox("Gradient weight")
+        self.gradientWeight.tooltip = "SSD: importance of the gradient of the implicit function matching the normals"
+        self.gradientWeight.set_on_checked(self.on_gradientWeight)
+        self.gradientWeight_value = gui.NumberEdit(gui.NumberEdit.DOUBLE)
+        self.gradientWeight_value.set_value(0.001)
+
+        # SSD --biLapWeight <bi-laplacian weight>
+        self.biLapWeight = gui.Checkbox("Bi-Laplacian weight")
+        self.biLapWeight.tooltip = "SSD: importance of the smoothness of the implicit function"
+        self.biLapWeight.set_on_checked(self.on_biLapWeight)
+        self.biLapWeight_value = gui.NumberEdit(gui.NumberEdit.DOUBLE)
+        self.biLapWeight_value.set_value(0.00001)
+
+        # --double
+        self.double = gui.Checkbox("Double precision")
+        self.double.tooltip = "Solve in double precision: more accurate, but needs more memory and time"
+        self.double.set_on_checked(self.on_double)
+
+        # --maxSolveDepth <solve depth>
+        self.maxSolveDepth = gui.Checkbox("Solve depth")
+        self.maxSolveDepth.tooltip = "Maximum depth up to which the system is solved, the finer levels are only extrapolated\nDefault: tree depth"
+        self.maxSolveDepth.set_on_checked(self.on_maxSolveDepth)
+        self.maxSolveDepth_value = gui.NumberEdit(gui.NumberEdit.INT)
+        self.maxSolveDepth_value.set_value(8)
+
+        # --fullDepth <full depth>
+        self.fullDepth = gui.Checkbox("Full depth")
+        self.fullDepth.tooltip = "Depth up to which the octree is complete, beyond it the octree is adapted to the points\nLower values save memory for sparse scans"
+        self.fullDepth.set_on_checked(self.on_fullDepth)
+        self.fullDepth_value = gui.NumberEdit(gui.NumberEdit.INT)
+        self.fullDepth_value.set_value(5)
+
+        # --cgDepth <conjugate-gradients depth>
+        self.cgDepth = gui.Checkbox("CG depth")
+        self.cgDepth.tooltip = "Depth up to which conjugate gradients are used instead of Gauss-Seidel relaxation"
+        self.cgDepth.set_on_checked(self.on_cgDepth)
+        self.cgDepth_value = gui.NumberEdit(gui.NumberEdit.INT)
+        self.cgDepth_value.set_value(0)
+
+        # --polygonMesh
+        self.polygonMesh = gui.Checkbox("Polygon mesh")
+        self.polygonMesh.tooltip = "Output the iso-surface as polygons instead of triangles (triangulated when it is read)"
+        self.polygonMesh.set_on_checked(self.on_polygonMesh)
+
 
     '''
         tabs for grid
@@ -175,6 +253,7 @@ class Parameters:
 
         h = gui.Horiz(0.25 * em)  # row 1
         h.add_child(self.depth)
+        h.add_child(self.depth_auto)
         h.add_stretch()
         h.add_child(self.depth_value)
         grid.add_child(h)
@@ -233,6 +312,89 @@ class Parameters:
         grid.add_child(self.density)
         grid.add_child(self.verbose)
         return grid
+
+    def tab6(self, em):
+        grid = gui.VGrid(1, 0.25 * em)
+
+        h = gui.Horiz(0.25 * em)  # row 1
+        h.add_child(self.engine_label)
+        h.add_child(self.engine_box)
+        h.add_stretch()
+        grid.add_child(h)
+
+        for checkbox, value in ((self.valueWeight, self.valueWeight_value),
+                                (self.gradientWeight, self.gradientWeight_value),
+                                (self.biLapWeight, self.biLapWeight_value)):
+            h = gui.Horiz(0.25 * em)
+            h.add_child(checkbox)
+            h.add_stretch()
+            h.add_child(value)
+            grid.add_child(h)
+        return grid
+
+    def tab7(self, em):
+        grid = gui.VGrid(1, 0.25 * em)
+        grid.add_child(self.double)
+        for checkbox, value in ((self.maxSolveDepth, self.maxSolveDepth_value),
+                                (self.fullDepth, self.fullDepth_value),
+                                (self.cgDepth, self.cgDepth_value)):
+            h = gui.Horiz(0.25 * em)
+            h.add_child(checkbox)
+            h.add_stretch()
+            h.add_child(value)
+            grid.add_child(h)
+        grid.add_child(self.polygonMesh)
+        return grid
+
+    def to_config(self):
+        '''
+        Collect the current state of all widgets in a ReconstructionConfig, which is used to run the reconstruction.
+        :return: ReconstructionConfig with the values chosen by the user
+        '''
+        config = ReconstructionConfig()
+        config.out_selected = self.out_selected
+        config.out_name = self.out_name.text_value
+        config.grid_selected = self.grid_selected
+        config.grid_name = self.grid_name.text_value
+        config.color_selected = self.color_selected
+        config.color_value = self.color_value.double_value
+        config.depth_selected = self.depth_selected
+        config.depth_value = self.depth_value.int_value
+        config.depth_auto = self.depth_auto_selected
+        config.iters_selected = self.iters_selected
+        config.iters_value = self.iters_value.int_value
+        config.degree_selected = self.degree_selected
+        config.degree_value = self.degree_value.int_value
+        config.confidence_selected = self.confidence_selected
+        config.linearFit_selected = self.linearFit_selected
+        config.nWeights_selected = self.nWeights_selected
+        config.pointWeight_selected = self.pointWeight_selected
+        config.pointWeight_value = self.pointWeight_value.int_value
+        config.samplesPerNode_selected = self.samplesPerNode_selected
+        config.samplesPerNode_value = self.samplesPerNode_value.double_value
+        config.scale_selected = self.scale_selected
+        config.scale_value = self.scale_value.double_value
+        config.threads_selected = self.threads_selected
+        config.threads_value = self.threads_value.int_value
+        config.double_selected = self.double_selected
+        config.maxSolveDepth_selected = self.maxSolveDepth_selected
+        config.maxSolveDepth_value = self.maxSolveDepth_value.int_value
+        config.fullDepth_selected = self.fullDepth_selected
+        config.fullDepth_value = self.fullDepth_value.int_value
+        config.cgDepth_selected = self.cgDepth_selected
+        config.cgDepth_value = self.cgDepth_value.int_value
+        config.polygonMesh_selected = self.polygonMesh_selected
+        config.primalVoxel_selected = self.primalVoxel_selected
+        config.density_selected = self.density_selected
+        config.verbose_selected = self.verbose_selected
+        config.engine = self.engine
+        config.valueWeight_selected = self.valueWeight_selected
+        config.valueWeight_value = self.valueWeight_value.double_value
+        config.gradientWeight_selected = self.gradientWeight_selected
+        config.gradientWeight_value = self.gradientWeight_value.double_value
+        config.biLapWeight_selected = self.biLapWeight_selected
+        config.biLapWeight_value = self.biLapWeight_value.double_value
+        return config
     '''
         set on checked boxes
     '''
@@ -256,6 +418,9 @@ class Parameters:
     def on_depth(self, selected):
         self.depth_selected = selected
 
+    def on_depth_auto(self, selected):
+        self.depth_auto_selected = selected
+
     def on_scale(self, selected):
         self.scale_selected = selected
 
@@ -277,6 +442,33 @@ class Parameters:
     def on_verbose(self, selected):
         self.verbose_selected = selected
 
+    def on_engine(self, text, index):
+        self.engine = ("poisson", "ssd", "auto")[index]
+
+    def on_valueWeight(self, selected):
+        self.valueWeight_selected = selected
+
+    def on_gradientWeight(self, selected):
+        self.gradientWeight_selected = selected
+
+    def on_biLapWeight(self, selected):
+        self.biLapWeight_selected = selected
+
+    def on_double(self, selected):
+        self.double_selected = selected
+
+    def on_maxSolveDepth(self, selected):
+        self.maxSolveDepth_selected = selected
+
+    def on_fullDepth(self, selected):
+        self.fullDepth_selected = selected
+
+    def on_cgDepth(self, selected):
+        self.cgDepth_selected = selected
+
+    def on_polygonMesh(self, selected):
+        self.polygonMesh_selected = selected
+
     def on_linearFit(self, selected):
         self.linearFit_selected = selected
 
@@ -0,0 +1,293 @@
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import open3d as o3d
+
+from src.GeometryStore import Geometry, read_geometry
+from src.PointCloudStream import chunk_size, read_ply_vertices, stream_bounds
+from src.PointColorSampler import PointColorSampler
+
+'''
+Re-extraction of iso-surfaces from the implicit function PoissonRecon writes with --voxel (grid_name in the config).
+The file holds the resolution (int) followed by resolution^3 floats, x varying fastest, which are the values of the
+implicit function minus the iso-value of the reconstruction, sampled at the centers of the cells of the finest level
+or, with --primalVoxel, at their corners. The grid covers the cube PoissonRecon fits around the points: the bounding
+box of the points, its longest side scaled by --scale, centered on the box.
+The grid is memory-mapped, and the surface is extracted by marching tetrahedra, the variant of marching cubes which
+splits every cube into six tetrahedra, so every cell is handled by the same few array operations. The iso-value, a
+region and a coarser resolution can be chosen, which takes seconds instead of solving the system again.
+'''
+
+# number of cells processed in one slab of the grid
+SLAB_CELLS = 1 << 21
+
+
+def _cube_tetrahedra():
+    '''
+    :return: array (6, 4, 3) of the corner offsets of the six tetrahedra around the main diagonal of a cube. Neighboring
+             cubes split their common faces along the same diagonals, so the surface has no cracks.
+    '''
+    tetrahedra = []
+    for axes in itertools.permutations(range(3)):
+        corner = [0, 0, 0]
+        tetrahedron = [tuple(corner)]
+        for axis in axes:
+            corner[axis] = 1
+            tetrahedron.append(tuple(corner))
+        tetrahedra.append(tetrahedron)
+    return np.array(tetrahedra)
+
+
+def _case_triangles():
+    '''
+    :return: list of the triangles of the 16 cases of a tetrahedron (bit c set: corner c is inside). A triangle is a
+             list of three edges (inside corner, outside corner), its vertices lie on these edges.
+    '''
+    table = []
+    for case in range(16):
+        inside = [c for c in range(4) if case >> c & 1]
+        outside = [c for c in range(4) if not case >> c & 1]
+        if len(inside) == 1:
+            table.append([[(inside[0], c) for c in outside]])
+        elif len(inside) == 3:
+            table.append([[(c, outside[0]) for c in inside]])
+        elif len(inside) == 2:
+            (a, b), (c, d) = inside, outside
+            table.append([[(a, c), (a, d), (b, d)], [(a, c), (b, d), (b, c)]])
+        else:
+            table.append([])
+    return table
+
+
+TETRAHEDRA = _cube_tetrahedra()
+CASE_TRIANGLES = _case_triangles()
+
+
+class ImplicitGrid:
+    '''
+    Class ImplicitGrid contains the implicit function written by PoissonRecon: values[x, y, z] (memory-mapped), whether
+    the values lie at the corners of the cells (--primalVoxel) instead of their centers, and the cube of the grid in the
+    coordinates of the point cloud (origin: corner with the lowest coordinates, size: edge length).
+    '''
+    def __init__(self, path, values, primal, origin, size):
+        self.path = path
+        self.values = values
+        self.primal = primal
+        self.origin = origin
+        self.size = size
+
+    @property
+    def resolution(self):
+        return self.values.shape[0]
+
+    def to_world(self, index):
+        '''
+        :param index: array (..., 3) of (fractional) sample indices
+        :return: array (..., 3) of the positions in the coordinates of the point cloud
+        '''
+        if self.primal:
+            return self.origin + self.size * np.asarray(index) / max(self.resolution - 1, 1)
+        return self.origin + self.size * (np.asarray(index) + 0.5) / self.resolution
+
+    def to_index(self, position):
+        '''
+        :return: fractional sample indices of the positions, the inverse of to_world
+        '''
+        if self.primal:
+            return (np.asarray(position) - self.origin) / self.size * max(self.resolution - 1, 1)
+        return (np.asarray(position) - self.origin) / self.size * self.resolution - 0.5
+
+    def sample_range(self, minimum=None, maximum=None):
+        '''
+        :param minimum: lowest corner of the region in the coordinates of the point cloud, None for the whole grid
+        :param maximum: highest corner of the region, None for the whole grid
+        :return: tuple (low, high) of the sample indices covering the region, high exclusive
+        '''
+        low = np.zeros(3, dtype=int)
+        high = np.full(3, self.resolution)
+        if minimum is not None:
+            low = np.clip(np.floor(self.to_index(minimum)).astype(int), 0, self.resolution)
+        if maximum is not None:
+            high = np.clip(np.ceil(self.to_index(maximum)).astype(int) + 1, 0, self.resolution)
+        return low, high
+
+
+def read_implicit_grid(path: str, bounds=None, scale: float = 1.1):
+    '''
+    Memory-map the implicit function written by PoissonRecon with --voxel.
+    :param path: path of the grid file
+    :param bounds: tuple (minimum, maximum) of the bounding box of the points passed to PoissonRecon, None to keep the
+           unit cube of PoissonRecon as coordinates
+    :param scale: --scale of the reconstruction (default of PoissonRecon 1.1)
+    :return: ImplicitGrid or None if the file is no grid
+    '''
+    if not os.path.exists(path) or os.path.getsize(path) < 4:
+        print("[WARNING] No implicit function grid at", path)
+        return None
+    resolution = int(np.fromfile(path, dtype="<i4", count=1)[0])
+    if resolution <= 0 or os.path.getsize(path) != 4 + 4 * resolution ** 3:
+        print("[WARNING] Unexpected size of the implicit function grid", path)
+        return None
+    # the file stores x fastest, so its z, y, x order is transposed without copying
+    values = np.memmap(path, dtype="<f4", mode="r", offset=4, shape=(resolution,) * 3).transpose(2, 1, 0)
+    # the finest level has 2^depth cells, with --primalVoxel the grid has one sample more along each axis
+    primal = resolution > 1 and resolution & (resolution - 1) != 0
+    if bounds is None:
+        return ImplicitGrid(path, values, primal, np.zeros(3), 1.0)
+    minimum, maximum = np.asarray(bounds[0], dtype=np.float64), np.asarray(bounds[1], dtype=np.float64)
+    size = float((maximum - minimum).max()) * scale
+    return ImplicitGrid(path, values, primal, (minimum + maximum) / 2 - size / 2, size)
+
+
+def _tetrahedra_triangles(inside, x0, shape):
+    '''
+    Triangles of all tetrahedra of the cells of a slab.
+    :param inside: boolean array of the samples of the slab, True where the function is above the iso-value
+    :param x0: x index of the first sample of the slab
+    :param shape: shape of the sampled grid
+    :return: array (m, 3, 2) of the edges of the triangles as pairs (inside sample, outside sample) of linear indices
+    '''
+    cells = np.array(inside.shape) - 1
+    parts = []
+    for tetrahedron in TETRAHEDRA:
+        case = np.zeros(cells, dtype=np.uint8)
+        for c, (dx, dy, dz) in enumerate(tetrahedron):
+            case |= inside[dx:dx + cells[0], dy:dy + cells[1], dz:dz + cells[2]].astype(np.uint8) << c
+        for value in range(1, 15):
+            cx, cy, cz = np.nonzero(case == value)
+            if len(cx) == 0:
+                continue
+            # linear index of every corner of the tetrahedron in the cells
+            corners = [((x0 + cx + dx) * shape[1] + cy + dy) * shape[2] + cz + dz for dx, dy, dz in tetrahedron]
+            for triangle in CASE_TRIANGLES[value]:
+                parts.append(np.stack([np.stack((corners[a], corners[b]), axis=1) for a, b in triangle], axis=1))
+    return np.concatenate(parts) if parts else np.empty((0, 3, 2), dtype=np.int64)
+
+
+def extract_isosurface(grid, iso_value: float = 0.0, minimum=None, maximum=None, step: int = 1,
+                       color_sampler=None, output_file: str = None):
+    '''
+    Extract the iso-surface of the implicit function by marching tetrahedra.
+    :param grid: ImplicitGrid
+    :param iso_value: value of the surface relative to the iso-value of the reconstruction, i.e. 0 for the surface of
+           PoissonRecon. Positive values shrink the surface, negative values grow it.
+    :param minimum: lowest corner of the region which is extracted, None for the whole grid
+    :param maximum: highest corner of the region which is extracted, None for the whole grid
+    :param step: only every step-th sample along each axis is used, e.g. 2 for half the resolution
+    :param color_sampler: PointColorSampler from which the vertex colors are taken, None for no colors
+    :param output_file: path to which the mesh is written, None to not write it
+    :return: tuple (Geometry of the mesh, wall time in seconds)
+    '''
+    start = time.time()
+    low, high = grid.sample_range(minimum, maximum)
+    step = max(int(step), 1)
+    values = grid.values[low[0]:high[0]:step, low[1]:high[1]:step, low[2]:high[2]:step]
+    shape = np.array(values.shape)
+    parts = []
+    if np.all(shape >= 2):
+        slab = max(1, SLAB_CELLS // int((shape[1] - 1) * (shape[2] - 1)))
+        for x0 in range(0, shape[0] - 1, slab):
+            x1 = min(x0 + slab, shape[0] - 1)
+            parts.append(_tetrahedra_triangles(np.asarray(values[x0:x1 + 1]) > iso_value, x0, shape))
+    edges = np.concatenate(parts) if parts else np.empty((0, 3, 2), dtype=np.int64)
+
+    # every edge crossing the surface becomes one vertex, shared by the triangles around the edge
+    keys = np.minimum(edges[..., 0], edges[..., 1]) * int(np.prod(shape)) + np.maximum(edges[..., 0], edges[..., 1])
+    keys, first, triangles = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+    triangles = triangles.reshape(-1, 3)
+    pairs = edges.reshape(-1, 2)[first]
+    inner = np.stack(np.unravel_index(pairs[:, 0], shape), axis=1)
+    outer = np.stack(np.unravel_index(pairs[:, 1], shape), axis=1)
+    inner_values = values[inner[:, 0], inner[:, 1], inner[:, 2]].astype(np.float64)
+    outer_values = values[outer[:, 0], outer[:, 1], outer[:, 2]].astype(np.float64)
+    t = (inner_values - iso_value) / (inner_values - outer_values)
+    indices = inner + t[:, None] * (outer - inner)
+
+    # an outside sample equal to the iso-value (t = 1) is the vertex of every edge ending in it: these vertices are
+    # merged and the triangles which collapse to a line or a point are removed
+    on_sample = outer_values == iso_value
+    if np.any(on_sample):
+        vertex_keys = np.where(on_sample, -1 - pairs[:, 1], keys)
+        _, first, remap = np.unique(vertex_keys, return_index=True, return_inverse=True)
+        triangles = remap.reshape(-1)[triangles]
+        indices = indices[first]
+        keep = (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & \
+            (triangles[:, 0] != triangles[:, 2])
+        triangles, edges = triangles[keep], edges[keep]
+        used, triangles = np.unique(triangles, return_inverse=True)
+        triangles = triangles.reshape(-1, 3)
+        indices = indices[used]
+
+    # the triangles of the table have no consistent orientation: the normals are turned to the outside, i.e. from the
+    # inside to the outside sample of an edge of the triangle
+    if len(triangles):
+        corners = indices[triangles]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        first_edge = edges[:, 0]
+        direction = np.stack(np.unravel_index(first_edge[:, 1], shape), axis=1) - \
+            np.stack(np.unravel_index(first_edge[:, 0], shape), axis=1)
+        flip = np.einsum("ij,ij->i", normals, direction) < 0
+        triangles[flip] = triangles[flip][:, ::-1]
+
+    vertices = grid.to_world(low + indices * step)
+    mesh = o3d.geometry.TriangleMesh(o3d.utility.Vector3dVector(vertices),
+                                     o3d.utility.Vector3iVector(triangles.astype(np.int32)))
+    mesh.compute_vertex_normals()
+    if color_sampler is not None:
+        mesh.vertex_colors = o3d.utility.Vector3dVector(np.clip(color_sampler.sample(vertices), 0, 1))
+    if output_file is not None:
+        o3d.io.write_triangle_mesh(output_file, mesh)
+    return Geometry(output_file, mesh), time.time() - start
+
+
+def read_bounds(path: str, memory_budget: float = 1024):
+    '''
+    :return: tuple (minimum, maximum) of the points of the point cloud file, None if it can not be read. Binary PLY
+             files are read chunk by chunk.
+    '''
+    vertices = read_ply_vertices(path) if path.lower().endswith(".ply") else None
+    if vertices is not None:
+        minimum, maximum, _ = stream_bounds(vertices, chunk_size(memory_budget, vertices.dtype.itemsize * 4))
+        return minimum, maximum
+    geometry = read_geometry(path)
+    if geometry is None:
+        return None
+    return geometry.vertices.min(axis=0), geometry.vertices.max(axis=0)
+
+
+def main(argv=None):
+    '''
+    Entry point of the iso-surface extraction, see main.py.
+    :return: exit code
+    '''
+    parser = argparse.ArgumentParser(prog="main.py isosurface",
+                                     description="Extract an iso-surface from the implicit function of PoissonRecon.")
+    parser.add_argument("grid", help="implicit function written by PoissonRecon (Function file / grid_name)")
+    parser.add_argument("--points", help="point cloud passed to PoissonRecon, places the mesh in its coordinates")
+    parser.add_argument("--scale", type=float, default=1.1, help="--scale of the reconstruction (default: 1.1)")
+    parser.add_argument("--iso", type=float, default=0.0, help="iso-value relative to the surface (default: 0)")
+    parser.add_argument("--step", type=int, default=1, help="use every step-th sample (default: 1)")
+    parser.add_argument("--min", type=float, nargs=3, help="lowest corner of the region which is extracted")
+    parser.add_argument("--max", type=float, nargs=3, help="highest corner of the region which is extracted")
+    parser.add_argument("--colors", action="store_true", help="take the vertex colors from the points")
+    parser.add_argument("--out", default="isosurface.ply", help="output mesh (default: isosurface.ply)")
+    args = parser.parse_args(argv)
+
+    bounds = read_bounds(args.points) if args.points else None
+    if args.points and bounds is None:
+        print("[WARNING] Failed to read points", args.points)
+        return 1
+    grid = read_implicit_grid(args.grid, bounds, args.scale)
+    if grid is None:
+        return 1
+    color_sampler = None
+    if args.colors and args.points:
+        geometry = read_geometry(args.points)
+        color_sampler = PointColorSampler.from_cloud(geometry.cloud) if geometry is not None else None
+    geometry, wall_time = extract_isosurface(grid, args.iso, args.min, args.max, args.step, color_sampler, args.out)
+    print("[Info] {}: {} vertices, {} triangles from a {}^3 grid in {:.2f} s".format(
+        args.out, len(geometry.vertices), len(geometry.triangles), grid.resolution, wall_time))
+    return 0
@@ -0,0 +1,50 @@
+import time
+
+import open3d as o3d
+
+from src.GeometryStore import Geometry
+
+'''
+Decimation of the reconstructed mesh before the UV mapping. PoissonRecon returns meshes with millions of triangles,
+and the xatlas unwrap as well as the rasterization of the maps grow with the number of triangles. The mesh is simplified
+by quadric error decimation (Garland and Heckbert) and the maps of the decimated mesh are baked from the full mesh (see
+get_texture_from_vertex_color), so the details the decimation removes are kept in the textures.
+'''
+
+
+class DecimationStatistics:
+    '''
+    Class DecimationStatistics describes one decimation: number of triangles before and after and the wall time in
+    seconds.
+    '''
+    def __init__(self, triangles_before, triangles_after, wall_time):
+        self.triangles_before = triangles_before
+        self.triangles_after = triangles_after
+        self.wall_time = wall_time
+
+    def __repr__(self):
+        return "{} -> {} triangles in {:.2f} s".format(self.triangles_before, self.triangles_after, self.wall_time)
+
+
+def decimate_mesh(geometry, target_triangles: int, max_error: float = 0.0, output_file: str = None):
+    '''
+    Simplify the mesh by quadric error decimation.
+    :param geometry: Geometry of the triangle mesh, it is not changed.
+    :param target_triangles: number of triangles of the decimated mesh, 0 to only stop at max_error
+    :param max_error: maximum quadric error of an edge collapse, 0 for no bound
+    :param output_file: path to which the decimated mesh is written, None to not write it
+    :return: tuple (Geometry of the decimated mesh, DecimationStatistics)
+    :raises ValueError: if neither target_triangles nor max_error bounds the decimation, which would remove every
+            triangle
+    '''
+    if target_triangles <= 0 and max_error <= 0:
+        raise ValueError("Decimation needs decimate_triangles > 0 or decimate_max_error > 0")
+    start = time.time()
+    mesh = geometry.geometry.simplify_quadric_decimation(int(target_triangles),
+                                                         maximum_error=max_error if max_error > 0 else float("inf"))
+    mesh.remove_unreferenced_vertices()
+    mesh.compute_vertex_normals()
+    if output_file is not None:
+        o3d.io.write_triangle_mesh(output_file, mesh)
+    statistics = DecimationStatistics(len(geometry.triangles), len(mesh.triangles), time.time() - start)
+    return Geometry(output_file, mesh), statistics
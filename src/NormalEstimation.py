@@ -0,0 +1,240 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+from numba import njit, prange
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial import cKDTree
+
+from src.DiskCache import content_hash
+
+'''
+Normal estimation stage for point clouds without normals. The neighbors of all points are searched once in a KD-tree
+(hybrid search: at most max_nn neighbors within radius) and are used twice: for the normals, which are fitted to the
+neighborhoods by PCA, and for the consistent orientation. Unoriented normals let PoissonRecon flip parts of the
+surface, so the normals are oriented by propagating the orientation along a minimum spanning tree over the neighborhood
+graph (Hoppe et al., "Surface reconstruction from unorganized points", 1992), starting at the points farthest from the
+centroid, whose normals are pointed outwards.
+'''
+
+
+class NormalParameters:
+    '''
+    Class NormalParameters contains the parameters of the normal estimation.
+    '''
+    radius = 0.0                # radius of the neighborhood, 0: only the max_nn nearest neighbors are used
+    max_nn = 30                 # maximum number of neighbors (including the point itself) used to fit the normal
+    orient = True               # orient the normals consistently
+    orient_nn = 10              # number of nearest neighbors connected in the graph used for the orientation
+
+    def __init__(self, radius: float = 0.0, max_nn: int = 30, orient: bool = True, orient_nn: int = 10):
+        self.radius = radius
+        self.max_nn = max_nn
+        self.orient = orient
+        self.orient_nn = orient_nn
+
+    @classmethod
+    def from_config(cls, config):
+        '''
+        :param config: ReconstructionConfig
+        '''
+        return cls(config.normals_radius, config.normals_max_nn, config.normals_orient, config.normals_orient_nn)
+
+    def to_dict(self):
+        return {"radius": self.radius, "max_nn": self.max_nn, "orient": self.orient, "orient_nn": self.orient_nn}
+
+
+# number of points whose neighborhoods are searched and fitted at once, limits the memory of the neighbor lists
+CHUNK_SIZE = 1 << 18
+
+
+@njit(cache=True, parallel=True)
+def neighborhood_covariances(points, neighbors):
+    '''
+    :param neighbors: indices of the neighbors of every point, missing neighbors are len(points).
+    :return: tuple (covariance matrix of the neighborhood of every point, number of neighbors of every point)
+    '''
+    n = neighbors.shape[0]
+    covariances = np.zeros((n, 3, 3))
+    counts = np.zeros(n, dtype=np.int64)
+    for i in prange(n):
+        mean = np.zeros(3)
+        count = 0
+        for j in range(neighbors.shape[1]):
+            k = neighbors[i, j]
+            if k < points.shape[0]:
+                mean += points[k]
+                count += 1
+        if count < 3:
+            counts[i] = count
+            continue
+        mean /= count
+        for j in range(neighbors.shape[1]):
+            k = neighbors[i, j]
+            if k < points.shape[0]:
+                d = points[k] - mean
+                for a in range(3):
+                    for b in range(3):
+                        covariances[i, a, b] += d[a] * d[b]
+        counts[i] = count
+    return covariances, counts
+
+
+def fit_normals(points, neighbors):
+    '''
+    Fit a plane to the neighborhood of every point. The normal is the eigenvector of the smallest eigenvalue of the
+    covariance matrix of the neighborhood. Points with less than three neighbors get the normal (0, 0, 1).
+    :return: unit normals, not oriented
+    '''
+    covariances, counts = neighborhood_covariances(points, neighbors)
+    _, eigenvectors = np.linalg.eigh(covariances)
+    normals = np.ascontiguousarray(eigenvectors[:, :, 0])
+    normals[counts < 3] = (0.0, 0.0, 1.0)
+    return normals
+
+
+def search_neighbors(tree, points, parameters: NormalParameters, workers: int = -1):
+    '''
+    Search the neighbors of the points and fit their normals, chunk by chunk.
+    :param tree: cKDTree of points
+    :return: tuple (normals, indices of the orient_nn nearest neighbors of every point without the point itself, missing
+             neighbors are len(points))
+    '''
+    max_nn = max(parameters.max_nn, parameters.orient_nn + 1)
+    upper_bound = parameters.radius if parameters.radius > 0 else np.inf
+    normals = np.empty_like(points)
+    graph = np.empty((len(points), parameters.orient_nn), dtype=np.int64)
+    for start in range(0, len(points), CHUNK_SIZE):
+        chunk = points[start:start + CHUNK_SIZE]
+        _, neighbors = tree.query(chunk, k=max_nn, distance_upper_bound=upper_bound, workers=workers)
+        neighbors = neighbors.reshape(len(chunk), max_nn)
+        normals[start:start + len(chunk)] = fit_normals(points, neighbors[:, :parameters.max_nn])
+        graph[start:start + len(chunk)] = neighbors[:, 1:parameters.orient_nn + 1]
+    return normals, graph
+
+
+@njit(cache=True)
+def propagate_orientation(normals, indptr, indices, seeds):
+    '''
+    Orient the normals by a breadth first traversal of the spanning tree (CSR matrix indptr, indices). A normal is
+    flipped if it points against the normal of its parent. Each connected component is started at its first point in
+    seeds, whose normal has to be oriented already.
+    '''
+    n = normals.shape[0]
+    visited = np.zeros(n, dtype=np.bool_)
+    queue = np.empty(n, dtype=np.int64)
+    for seed in seeds:
+        if visited[seed]:
+            continue
+        visited[seed] = True
+        head = 0
+        tail = 1
+        queue[0] = seed
+        while head < tail:
+            parent = queue[head]
+            head += 1
+            for k in range(indptr[parent], indptr[parent + 1]):
+                child = indices[k]
+                if visited[child]:
+                    continue
+                visited[child] = True
+                if normals[child, 0] * normals[parent, 0] + normals[child, 1] * normals[parent, 1] \
+                        + normals[child, 2] * normals[parent, 2] < 0:
+                    normals[child, 0] = -normals[child, 0]
+                    normals[child, 1] = -normals[child, 1]
+                    normals[child, 2] = -normals[child, 2]
+                queue[tail] = child
+                tail += 1
+
+
+def orient_normals(points, normals, graph, fixed=None, center=None):
+    '''
+    Orient the normals consistently (in place) along the minimum spanning tree of the neighborhood graph. Edges between
+    points with parallel normals are cheap, so the orientation is propagated over flat regions first.
+    :param graph: indices of the neighbors of every point, missing neighbors are len(points).
+    :param fixed: indices of points whose normals are oriented already, the orientation is propagated from them first.
+    :param center: point from which the normals of the remaining components are pointed away, None for the centroid.
+    '''
+    n = len(points)
+    rows = np.repeat(np.arange(n), graph.shape[1])
+    columns = graph.reshape(-1)
+    valid = (columns < n) & (columns != rows)
+    # every edge once, coo_matrix would add the weights of duplicates
+    edges = np.unique(np.minimum(rows[valid], columns[valid]) * n + np.maximum(rows[valid], columns[valid]))
+    rows = edges // n
+    columns = edges % n
+    weights = 1.0 - np.abs(np.einsum("ij,ij->i", normals[rows], normals[columns])) + 1e-6
+    tree = minimum_spanning_tree(coo_matrix((weights, (rows, columns)), shape=(n, n)).tocsr())
+    tree = (tree + tree.T).tocsr()
+
+    # the point farthest from the centroid of a component lies on its convex hull, so its normal points outwards. All
+    # normals are pointed away from the centroid, but only the first point of each component keeps this orientation.
+    offsets = points - (points.mean(axis=0) if center is None else center)
+    seeds = np.argsort(-np.einsum("ij,ij->i", offsets, offsets))
+    if fixed is not None and len(fixed) > 0:
+        is_fixed = np.zeros(n, dtype=bool)
+        is_fixed[fixed] = True
+        seeds = seeds[~is_fixed[seeds]]
+    flip = np.einsum("ij,ij->i", normals[seeds], offsets[seeds]) < 0
+    normals[seeds[flip]] *= -1
+    if fixed is not None and len(fixed) > 0:
+        seeds = np.concatenate((np.asarray(fixed, dtype=np.int64), seeds))
+    propagate_orientation(normals, tree.indptr.astype(np.int64), tree.indices.astype(np.int64), seeds)
+
+
+def estimate_normals(points, parameters: NormalParameters = None, workers: int = -1):
+    '''
+    Estimate the normals of a point cloud.
+    :param points: array of shape (n, 3)
+    :param parameters: NormalParameters, None for the defaults.
+    :param workers: number of threads used for the KD-tree queries, -1: all cores.
+    :return: array of unit normals of shape (n, 3)
+    '''
+    parameters = parameters or NormalParameters()
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    start = time.time()
+    tree = cKDTree(points)
+    normals, graph = search_neighbors(tree, points, parameters, workers)
+    if parameters.orient and len(points) > 0:
+        orient_normals(points, normals, graph)
+    print("[Info] Estimated normals of {} points in {:.1f} s".format(len(points), time.time() - start))
+    return normals
+
+
+def normals_cache_path(path: str):
+    '''
+    :return: path of the file next to the point cloud path in which its estimated normals are cached
+    '''
+    return os.path.splitext(path)[0] + ".normals.npz"
+
+
+def estimate_normals_cached(path: str, points, parameters: NormalParameters = None, workers: int = -1):
+    '''
+    Estimate the normals of the point cloud read from path. The normals are cached in a file next to the point cloud
+    (see normals_cache_path) together with a hash of the points and the parameters, so they are only estimated again if
+    the points or the parameters changed. If the cache can not be written (e.g. read-only directory), the normals are
+    just not cached.
+    :return: array of unit normals of shape (n, 3)
+    '''
+    parameters = parameters or NormalParameters()
+    cache_path = normals_cache_path(path)
+    key = content_hash(points, **parameters.to_dict())
+    try:
+        with np.load(cache_path) as cached:
+            if str(cached["key"]) == key:
+                print("[Info] Normals taken from", cache_path)
+                return cached["normals"]
+    except (OSError, KeyError, ValueError):
+        pass
+
+    normals = estimate_normals(points, parameters, workers)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), prefix=".tmp", suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, key=key, normals=normals)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print("[WARNING] Could not cache normals:", e)
+    return normals
@@ -0,0 +1,65 @@
+import numpy as np
+import open3d as o3d
+
+from src.GeometryStore import Geometry, read_geometry
+from src.Preprocessing import needs_preprocessing, preprocess_point_cloud
+from src.NormalEstimation import NormalParameters, estimate_normals, estimate_normals_cached
+
+
+def prepare_point_cloud(path: str, generated_path: str, write_ascii: bool = False, store=None, config=None,
+                        metrics: dict = None):
+    '''
+    Read the point cloud stored in path and check if it has normal and color values, which are both needed by
+    PoissonRecon. Missing normals are estimated and missing colors are set uniformly. If chosen in config, outliers are
+    removed and the point cloud is downsampled before (see Preprocessing). In these cases the resulting point cloud is
+    written to generated_path.
+    :param path: path of the point cloud file chosen by the user.
+    :param generated_path: path of the file to which the completed point cloud is written if something was missing.
+    :param write_ascii: write generated_path as ASCII instead of binary (little endian) PLY. Writing and parsing ASCII
+           is much slower for large point clouds, see benchmarks/ply_format.py.
+    :param store: GeometryStore from which the point cloud is taken, so a file already loaded (e.g. by the viewer) is
+           not parsed again. Normals and colors are added in place and the completed point cloud is registered for
+           generated_path. None to read the file.
+    :param config: ReconstructionConfig containing the parameters of the preprocessing and of the normal estimation
+           (normals_*), None for the defaults.
+    :param metrics: dictionary in which the PreprocessingResult is stored as "preprocessing" (see to_dict), e.g. the
+           values of the run in the metrics log. None to drop it.
+    :return: tuple (cloud, input_file). cloud is the loaded point cloud or None if it could not be read, input_file is
+             the file which has to be passed to PoissonRecon (either path or generated_path).
+    '''
+    geometry = store.load(path) if store is not None else read_geometry(path)
+    if geometry is None:
+        print("[WARNING] Failed to read points", path)
+        return None, path
+    cloud = geometry.cloud
+    newfile = False
+
+    if config is not None and needs_preprocessing(config):
+        cloud, preprocessing = preprocess_point_cloud(cloud, config)
+        if metrics is not None:
+            metrics["preprocessing"] = preprocessing.to_dict()
+        newfile = True
+
+    if not cloud.has_normals():
+        print("[Info] Missing normals: they are calculated")
+        parameters = NormalParameters.from_config(config) if config is not None else NormalParameters()
+        if config is None or config.normals_cache:
+            normals = estimate_normals_cached(path, np.asarray(cloud.points), parameters)
+        else:
+            normals = estimate_normals(np.asarray(cloud.points), parameters)
+        cloud.normals = o3d.utility.Vector3dVector(normals)
+        newfile = True
+    cloud.normalize_normals()
+
+    if not cloud.has_colors():
+        print("[Info] Missing colors: assign each point uniform colors")
+        cloud.paint_uniform_color([1.0, 0, 0])
+        newfile = True
+
+    if newfile:
+        print("'{}' is generated with normals and colors".format(generated_path))
+        o3d.io.write_point_cloud(generated_path, cloud, write_ascii=write_ascii, compressed=False)
+        if store is not None:
+            store.add(generated_path, Geometry(generated_path, cloud))
+        return cloud, generated_path
+    return cloud, path
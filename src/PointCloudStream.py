@@ -0,0 +1,358 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from src.NormalEstimation import NormalParameters, orient_normals, search_neighbors
+
+'''
+Out-of-core preparation of point clouds which do not fit into memory. A binary PLY file is memory-mapped and only read
+chunk by chunk, so the point cloud is never loaded completely. Missing normals are estimated slab by slab: the cloud is
+cut along its longest axis into slabs which fit into the memory budget, the points are sorted into one temporary file
+per slab in a single pass, and every slab is processed together with a margin of points of its neighbor slabs, so the
+neighborhoods at the cuts are complete. The orientation of a slab is
+aligned with the normals of the previous slab in the margin between them. The completed points are written slab by slab
+to a binary PLY file, which PoissonRecon itself reads as a stream.
+'''
+
+PLY_TYPES = {"char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1", "short": "i2", "int16": "i2",
+             "ushort": "u2", "uint16": "u2", "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+             "float": "f4", "float32": "f4", "double": "f8", "float64": "f8"}
+
+# memory in bytes needed per point of a slab during the normal estimation: coordinates, normals, KD-tree, neighbor
+# indices, covariances and the orientation graph
+BYTES_PER_POINT = 1024
+# number of bins of the histogram along the longest axis from which the slabs are cut
+HISTOGRAM_BINS = 1 << 14
+
+
+class PlyVertices:
+    '''
+    Class PlyVertices describes the vertex element of a binary PLY file: number of vertices, numpy dtype of one vertex
+    and offset of the first vertex in the file.
+    '''
+    def __init__(self, path, count, dtype, offset):
+        self.path = path
+        self.count = count
+        self.dtype = dtype
+        self.offset = offset
+
+    @property
+    def names(self):
+        return self.dtype.names
+
+    @property
+    def has_normals(self):
+        return all(name in self.names for name in ("nx", "ny", "nz"))
+
+    @property
+    def has_colors(self):
+        return all(name in self.names for name in ("red", "green", "blue"))
+
+    def memmap(self):
+        '''
+        :return: read-only memory map of the vertices, structured array with the properties as fields
+        '''
+        return np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.offset, shape=(self.count,))
+
+
+def read_ply_vertices(path: str):
+    '''
+    Parse the header of a PLY file.
+    :return: PlyVertices or None if path is no binary PLY file whose first element are the vertices (e.g. ASCII PLY)
+    '''
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            return None
+        byte_order = None
+        count = None
+        properties = []
+        element = None
+        first_element = None
+        while True:
+            line = f.readline()
+            if not line:
+                return None
+            words = line.decode("ascii", errors="replace").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "format":
+                byte_order = {"binary_little_endian": "<", "binary_big_endian": ">"}.get(words[1])
+            elif words[0] == "element":
+                element = words[1]
+                first_element = first_element or element
+                if element == "vertex":
+                    count = int(words[2])
+            elif words[0] == "property" and element == "vertex":
+                if words[1] == "list" or words[1] not in PLY_TYPES:
+                    return None
+                properties.append((words[2], byte_order + PLY_TYPES[words[1]] if byte_order else PLY_TYPES[words[1]]))
+            elif words[0] == "end_header":
+                break
+        offset = f.tell()
+    if byte_order is None or count is None or first_element != "vertex":
+        return None
+    return PlyVertices(path, count, np.dtype(properties), offset)
+
+
+def chunk_size(memory_budget: float, bytes_per_point: int):
+    '''
+    :param memory_budget: memory in MB which may be used
+    :return: number of points which can be processed at once
+    '''
+    return max(1 << 12, int(memory_budget * (1 << 20) / bytes_per_point))
+
+
+def iterate_chunks(vertices, size: int):
+    '''
+    Iterate over the vertices in chunks of size vertices.
+    :return: generator of tuples (index of the first vertex, structured array of the chunk)
+    '''
+    data = vertices.memmap()
+    for start in range(0, vertices.count, size):
+        yield start, data[start:start + size]
+
+
+def positions(chunk):
+    return np.stack((chunk["x"], chunk["y"], chunk["z"]), axis=1).astype(np.float64)
+
+
+def stream_bounds(vertices, size: int):
+    '''
+    Compute the bounding box and the centroid of the vertices chunk by chunk.
+    :return: tuple (minimum, maximum, centroid)
+    '''
+    minimum = np.full(3, np.inf)
+    maximum = np.full(3, -np.inf)
+    total = np.zeros(3)
+    for _, chunk in iterate_chunks(vertices, size):
+        points = positions(chunk)
+        minimum = np.minimum(minimum, points.min(axis=0))
+        maximum = np.maximum(maximum, points.max(axis=0))
+        total += points.sum(axis=0)
+    return minimum, maximum, total / max(vertices.count, 1)
+
+
+def cut_slabs(vertices, size: int, axis: int, minimum: float, maximum: float, slab_points: int):
+    '''
+    Cut the range [minimum, maximum] of axis into slabs containing at most about slab_points vertices each, based on a
+    histogram of the vertices computed chunk by chunk.
+    :return: array of the borders of the slabs, starting with minimum and ending with maximum
+    '''
+    if maximum <= minimum:
+        return np.array([minimum, maximum])
+    counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    edges = np.linspace(minimum, maximum, HISTOGRAM_BINS + 1)
+    for _, chunk in iterate_chunks(vertices, size):
+        counts += np.histogram(chunk[("x", "y", "z")[axis]].astype(np.float64), bins=edges)[0]
+    borders = [minimum]
+    total = 0
+    for i, count in enumerate(counts):
+        if count > 0 and total > 0 and total + count > slab_points:
+            borders.append(edges[i])
+            total = 0
+        total += count
+    borders.append(maximum)
+    return np.array(borders)
+
+
+def gather_points(vertices, size: int, axis: int, low: float, high: float, last: bool):
+    '''
+    Gather the vertices with low <= coordinate < high (<= high if last) of axis chunk by chunk.
+    :return: structured array of the vertices
+    '''
+    name = ("x", "y", "z")[axis]
+    parts = []
+    for _, chunk in iterate_chunks(vertices, size):
+        coordinate = chunk[name]
+        mask = (coordinate >= low) & ((coordinate <= high) if last else (coordinate < high))
+        if np.any(mask):
+            parts.append(np.array(chunk[mask]))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=vertices.dtype)
+
+
+def split_slabs(vertices, size: int, axis: int, borders, directory: str):
+    '''
+    Sort the vertices into one file per slab in a single pass over the file. Slab i contains the vertices with
+    borders[i] <= coordinate < borders[i + 1] (<= for the last slab) of axis.
+    :param directory: directory in which the files slab_<i>.bin are written
+    :return: list of PlyVertices of the slab files, raw vertices with the dtype of vertices
+    '''
+    name = ("x", "y", "z")[axis]
+    slabs = len(borders) - 1
+    paths = [os.path.join(directory, "slab_{}.bin".format(i)) for i in range(slabs)]
+    counts = np.zeros(slabs, dtype=np.int64)
+    files = [open(path, "wb") for path in paths]
+    try:
+        for _, chunk in iterate_chunks(vertices, size):
+            slab = np.clip(np.searchsorted(borders, chunk[name], side="right") - 1, 0, slabs - 1)
+            order = np.argsort(slab, kind="stable")
+            chunk_counts = np.bincount(slab, minlength=slabs)
+            starts = np.concatenate(([0], np.cumsum(chunk_counts)))
+            for i in np.flatnonzero(chunk_counts):
+                np.asarray(chunk[order[starts[i]:starts[i + 1]]]).tofile(files[i])
+            counts += chunk_counts
+    finally:
+        for f in files:
+            f.close()
+    return [PlyVertices(path, int(count), vertices.dtype, 0) for path, count in zip(paths, counts)]
+
+
+def neighborhood_margin(points, parameters: NormalParameters, samples: int = 10000):
+    '''
+    Estimate the width of the margin around a slab which contains the neighbors of its points: the 99th percentile of
+    the distances to the farthest neighbor of sample points, or the radius of the neighborhood if it is limited.
+    '''
+    if parameters.radius > 0:
+        return parameters.radius
+    if len(points) < 2:
+        return 0.0
+    sample = points[np.random.default_rng(0).choice(len(points), min(samples, len(points)), replace=False)]
+    k = min(max(parameters.max_nn, parameters.orient_nn + 1), len(points))
+    distances, _ = cKDTree(points).query(sample, k=k)
+    return float(np.percentile(distances.reshape(len(sample), -1)[:, -1], 99)) * 1.5
+
+
+class PlyWriter:
+    '''
+    Class PlyWriter writes the points for PoissonRecon (double coordinates, float normals, uchar colors) as binary
+    little endian PLY chunk by chunk. The number of points is written into the header when the file is closed.
+    '''
+    dtype = np.dtype([("x", "<f8"), ("y", "<f8"), ("z", "<f8"), ("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4"),
+                      ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.file = open(path, "wb")
+        self.file.write(self._header())
+
+    def _header(self):
+        # the count is padded, so the header keeps its length when the real count is written
+        return ("ply\nformat binary_little_endian 1.0\nelement vertex {:<20d}\n".format(self.count) +
+                "".join("property {} {}\n".format({"<f8": "double", "<f4": "float", "|u1": "uchar"}[
+                    self.dtype[name].str], name) for name in self.dtype.names) +
+                "end_header\n").encode("ascii")
+
+    def write(self, points, normals, colors):
+        '''
+        :param colors: array of shape (n, 3) of uint8
+        '''
+        data = np.empty(len(points), dtype=self.dtype)
+        data["x"], data["y"], data["z"] = points[:, 0], points[:, 1], points[:, 2]
+        data["nx"], data["ny"], data["nz"] = normals[:, 0], normals[:, 1], normals[:, 2]
+        data["red"], data["green"], data["blue"] = colors[:, 0], colors[:, 1], colors[:, 2]
+        data.tofile(self.file)
+        self.count += len(points)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+
+
+def _colors(chunk, has_colors):
+    if has_colors:
+        return np.stack((chunk["red"], chunk["green"], chunk["blue"]), axis=1).astype(np.uint8)
+    # uniform colors as for point clouds loaded into memory, see prepare_point_cloud
+    colors = np.zeros((len(chunk), 3), dtype=np.uint8)
+    colors[:, 0] = 255
+    return colors
+
+
+def _normals(chunk):
+    normals = np.stack((chunk["nx"], chunk["ny"], chunk["nz"]), axis=1).astype(np.float64)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths > 0, lengths, 1)
+
+
+def estimate_normals_streaming(vertices, writer, parameters: NormalParameters, memory_budget: float):
+    '''
+    Estimate the normals of the vertices slab by slab and write the completed points. The slabs are sorted into
+    temporary files next to the written file, so the input is read three times (bounds, histogram, split) instead of
+    once per slab. Every slab but the first starts the orientation at the normals the previous slab wrote in the margin
+    between them. Components without connection to the previous slab are oriented as in orient_normals, but away from
+    the centroid of the whole cloud. The margin of a slab is the widest margin estimated for it and its neighbor slabs,
+    so the neighborhoods reaching into a sparser neighbor are complete.
+    '''
+    size = chunk_size(memory_budget, vertices.dtype.itemsize * 4)
+    minimum, maximum, centroid = stream_bounds(vertices, size)
+    axis = int(np.argmax(maximum - minimum))
+    # the core of a slab and its margins have to fit into the budget
+    slab_points = chunk_size(memory_budget, BYTES_PER_POINT) // 2
+    borders = cut_slabs(vertices, size, axis, minimum[axis], maximum[axis], slab_points)
+    print("[Info] Estimating normals of {} points in {} slabs".format(vertices.count, len(borders) - 1))
+
+    directory = tempfile.mkdtemp(prefix="slabs_", dir=os.path.dirname(os.path.abspath(writer.path)))
+    try:
+        slabs = split_slabs(vertices, size, axis, borders, directory)
+        margins = [neighborhood_margin(positions(slab.memmap()), parameters) if slab.count else 0.0 for slab in slabs]
+        margins = [max(margins[max(i - 1, 0):i + 2]) for i in range(len(slabs))]
+        previous = None         # points and normals of the previous slab lying in the margin of the current one
+        for i, slab in enumerate(slabs):
+            low, high, margin = borders[i], borders[i + 1], margins[i]
+            parts = [np.array(slab.memmap())] if slab.count else []
+            for j in range(len(slabs)):
+                if j != i and slabs[j].count and borders[j] <= high + margin and borders[j + 1] >= low - margin:
+                    parts.append(gather_points(slabs[j], size, axis, low - margin, high + margin, True))
+            if not parts:
+                continue
+            data = np.concatenate(parts)
+            points = positions(data)
+            if len(points) == 0:
+                continue
+            coordinate = points[:, axis]
+            core = np.zeros(len(points), dtype=bool)
+            core[:slab.count] = True
+            normals, graph = search_neighbors(cKDTree(points), points, parameters)
+            if parameters.orient:
+                fixed = None
+                if previous is not None and len(previous[0]) > 0:
+                    # the points below low were written by the previous slab
+                    fixed = np.flatnonzero(coordinate < low)
+                    _, index = cKDTree(previous[0]).query(points[fixed])
+                    normals[fixed] = previous[1][index]
+                orient_normals(points, normals, graph, fixed, centroid)
+            writer.write(points[core], normals[core], _colors(data[core], vertices.has_colors))
+            next_margin = margins[i + 1] if i + 1 < len(slabs) else 0.0
+            upper = core & (coordinate >= high - next_margin)
+            previous = (points[upper], normals[upper])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def prepare_point_cloud_streaming(path: str, generated_path: str, config=None):
+    '''
+    Out-of-core counterpart of prepare_point_cloud: complete missing normals and colors of a binary PLY point cloud
+    without loading it completely. The memory used is bounded by config.stream_memory_budget. The preprocessing
+    (downsampling, outlier removal) and the normals cache are not supported.
+    :return: the file which has to be passed to PoissonRecon (either path or generated_path) or None if path is no
+             binary PLY file
+    '''
+    vertices = read_ply_vertices(path)
+    if vertices is None:
+        return None
+    if vertices.has_normals and vertices.has_colors:
+        return path
+    memory_budget = config.stream_memory_budget if config is not None else 1024
+    parameters = NormalParameters.from_config(config) if config is not None else NormalParameters()
+    start = time.time()
+    writer = PlyWriter(generated_path)
+    try:
+        if vertices.has_normals:
+            print("[Info] Missing colors: assign each point uniform colors")
+            for _, chunk in iterate_chunks(vertices, chunk_size(memory_budget, vertices.dtype.itemsize * 4)):
+                writer.write(positions(chunk), _normals(chunk), _colors(chunk, False))
+        else:
+            print("[Info] Missing normals: they are calculated")
+            estimate_normals_streaming(vertices, writer, parameters, memory_budget)
+    finally:
+        writer.close()
+    if writer.count != vertices.count:
+        os.remove(generated_path)
+        raise RuntimeError("Wrote {} of {} points to {}".format(writer.count, vertices.count, generated_path))
+    print("[Info] '{}' is generated with normals and colors in {:.1f} s".format(generated_path, time.time() - start))
+    return generated_path
@@ -0,0 +1,56 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+'''
+Colors of the texture taken from the input point cloud instead of the mesh. The vertex colors of the Poisson mesh are
+averages over its cells, so the color detail of the texture is limited by the depth of the reconstruction. Looking up
+the nearest input points of every texel keeps the detail of the scan even for a mesh reconstructed at a low depth.
+'''
+
+# number of texels whose neighbors are searched in one query
+QUERY_CHUNK = 1 << 18
+
+
+class PointColorSampler:
+    '''
+    Class PointColorSampler interpolates the colors of a point cloud at arbitrary positions from the k nearest points,
+    weighted by their inverse distances. The KD-tree is built once, so the sampler can be reused for several bakes of
+    the same point cloud.
+    '''
+    def __init__(self, points, colors, neighbors: int = 4):
+        '''
+        :param points: array of shape (n, 3)
+        :param colors: array of shape (n, 3) with values in [0, 1]
+        :param neighbors: number of points blended per position
+        '''
+        self.tree = cKDTree(np.asarray(points))
+        self.colors = np.asarray(colors, dtype=np.float64)
+        self.neighbors = max(1, min(int(neighbors), len(self.colors)))
+
+    @classmethod
+    def from_cloud(cls, cloud, neighbors: int = 4):
+        '''
+        :param cloud: open3d point cloud
+        :return: PointColorSampler or None if the cloud has no colors
+        '''
+        if not cloud.has_colors():
+            return None
+        return cls(np.asarray(cloud.points), np.asarray(cloud.colors), neighbors)
+
+    def sample(self, positions):
+        '''
+        Interpolate the colors at the positions. The positions are queried in chunks, each chunk by all cores.
+        :param positions: array of shape (m, 3)
+        :return: array of shape (m, 3) with values in [0, 1]
+        '''
+        result = np.empty((len(positions), 3))
+        for start in range(0, len(positions), QUERY_CHUNK):
+            chunk = positions[start:start + QUERY_CHUNK]
+            distances, indices = self.tree.query(chunk, k=self.neighbors, workers=-1)
+            if self.neighbors == 1:
+                result[start:start + len(chunk)] = self.colors[indices]
+                continue
+            weights = 1 / np.maximum(distances, 1e-12)
+            weights /= weights.sum(axis=1, keepdims=True)
+            result[start:start + len(chunk)] = np.einsum("ij,ijk->ik", weights, self.colors[indices])
+        return result
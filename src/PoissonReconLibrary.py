@@ -0,0 +1,217 @@
+import ctypes
+import os
+import threading
+import time
+
+import numpy as np
+import open3d as o3d
+
+from src.DiskCache import content_hash
+from src.GeometryStore import Geometry, read_geometry
+from src.PoissonReconstruction import ReconstructionRun, _cached_reconstruction, _log_run, get_poisson_command, \
+    reconstruction_key
+from src.ReconstructionProfile import ReconstructionProfile
+
+'''
+In-process binding to PoissonRecon. The sources in ext/PoissonRecon are compiled as shared library (make library in
+ext/PoissonRecon, see PoissonReconFromPoints in Src/PoissonRecon.cpp), which takes the points, normals and colors
+from memory and returns the mesh in memory. Compared to the executable, the point cloud is neither written to nor read
+from a PLY file, and the mesh is not written and read again. PoissonRecon keeps its parameters in global variables, so
+only one reconstruction runs at a time, and a running reconstruction can not be cancelled.
+'''
+
+
+class _PoissonReconMesh(ctypes.Structure):
+    # struct PoissonReconMesh in Src/PoissonRecon.cpp
+    _fields_ = [("vertex_count", ctypes.c_longlong),
+                ("polygon_count", ctypes.c_longlong),
+                ("index_count", ctypes.c_longlong),
+                ("points", ctypes.POINTER(ctypes.c_float)),
+                ("colors", ctypes.POINTER(ctypes.c_ubyte)),
+                ("values", ctypes.POINTER(ctypes.c_float)),
+                ("polygon_sizes", ctypes.POINTER(ctypes.c_int)),
+                ("indices", ctypes.POINTER(ctypes.c_int)),
+                ("comments", ctypes.c_char_p)]
+
+
+_libraries = {}
+_lock = threading.Lock()
+
+
+def get_poisson_library_path(settings):
+    '''
+    :param settings: Settings containing the main directory and the operation system.
+    :return: absolute path of the PoissonRecon library for the operation system
+    '''
+    if settings.my_os == 'Windows':
+        return os.path.join(settings.main_dir + "/ext/PoissonRecon.x64/", "PoissonRecon.dll")
+    return os.path.join(settings.main_dir + "/ext/PoissonRecon/Bin/Linux", "libPoissonRecon.so")
+
+
+def load_poisson_library(settings):
+    '''
+    Load the PoissonRecon library once.
+    :return: ctypes library or None if it was not built or can not be loaded
+    '''
+    path = get_poisson_library_path(settings)
+    if path in _libraries:
+        return _libraries[path]
+    library = None
+    if os.path.exists(path):
+        try:
+            library = ctypes.CDLL(path)
+            library.PoissonReconFromPoints.restype = ctypes.POINTER(_PoissonReconMesh)
+            library.PoissonReconFromPoints.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_char_p),
+                                                       ctypes.c_longlong] + [ctypes.POINTER(ctypes.c_double)] * 3
+            library.PoissonReconFreeMesh.restype = None
+            library.PoissonReconFreeMesh.argtypes = [ctypes.POINTER(_PoissonReconMesh)]
+        except (OSError, AttributeError) as e:
+            print("[WARNING] Could not load the PoissonRecon library:", e)
+            library = None
+    _libraries[path] = library
+    return library
+
+
+def get_library_arguments(config):
+    '''
+    :return: arguments for the library built from the parameters in config, i.e. the command line of PoissonRecon
+             without executable, input and output file
+    '''
+    return get_poisson_command("", config, "", "")[5:]
+
+
+class PoissonMesh:
+    '''
+    Class PoissonMesh contains a mesh reconstructed in-process: vertices (n x 3), triangles (m x 3), vertex colors in
+    [0, 1] (n x 3, None without --color) and the density values of the vertices (n, None without --density).
+    '''
+    def __init__(self, vertices, triangles, colors=None, values=None):
+        self.vertices = vertices
+        self.triangles = triangles
+        self.colors = colors
+        self.values = values
+
+    def to_open3d(self):
+        mesh = o3d.geometry.TriangleMesh(o3d.utility.Vector3dVector(self.vertices.astype(np.float64)),
+                                         o3d.utility.Vector3iVector(self.triangles))
+        if self.colors is not None:
+            mesh.vertex_colors = o3d.utility.Vector3dVector(self.colors)
+        return mesh
+
+
+def _triangulate(polygon_sizes, indices):
+    '''
+    Split the polygons into triangle fans. PoissonRecon only returns polygons with more than three vertices if it is
+    asked to (--polygonMesh).
+    :return: array of triangles (m x 3)
+    '''
+    if np.all(polygon_sizes == 3):
+        return indices.reshape(-1, 3)
+    starts = np.concatenate(([0], np.cumsum(polygon_sizes)[:-1]))
+    fans = polygon_sizes - 2
+    first = np.repeat(starts, fans)
+    offsets = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    return np.stack((indices[first], indices[first + offsets], indices[first + offsets + 1]), axis=1)
+
+
+def _copy_mesh(result):
+    n = result.vertex_count
+    vertices = np.ctypeslib.as_array(result.points, shape=(n * 3,)).reshape(n, 3).copy() if n else np.empty((0, 3))
+    colors = None
+    if result.colors:
+        colors = np.ctypeslib.as_array(result.colors, shape=(n * 3,)).reshape(n, 3) / 255.0
+    values = np.ctypeslib.as_array(result.values, shape=(n,)).copy() if result.values else None
+    triangles = np.empty((0, 3), dtype=np.int32)
+    if result.polygon_count:
+        polygon_sizes = np.ctypeslib.as_array(result.polygon_sizes, shape=(result.polygon_count,))
+        indices = np.ctypeslib.as_array(result.indices, shape=(result.index_count,))
+        triangles = _triangulate(polygon_sizes, indices).astype(np.int32)
+    return PoissonMesh(vertices, triangles, colors, values)
+
+
+def reconstruct_points(settings, config, points, normals, colors=None):
+    '''
+    Reconstruct the surface of an oriented point cloud with the PoissonRecon library.
+    :param settings: Settings containing the main directory and the operation system.
+    :param config: ReconstructionConfig containing the parameters for PoissonRecon. --voxel is not supported.
+    :param points: array of shape (n, 3)
+    :param normals: array of shape (n, 3)
+    :param colors: array of shape (n, 3) with values in [0, 1] or None. Only used with --color.
+    :return: tuple (PoissonMesh or None if the reconstruction failed, ReconstructionRun) or None if the library is not
+             available
+    '''
+    library = load_poisson_library(settings)
+    if library is None:
+        return None
+    arguments = get_library_arguments(config)
+    argv = (ctypes.c_char_p * len(arguments))(*[argument.encode() for argument in arguments])
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    normals = np.ascontiguousarray(normals, dtype=np.float64)
+    colors = np.ascontiguousarray(colors, dtype=np.float64) if colors is not None and len(colors) else None
+
+    def pointer(array):
+        return array.ctypes.data_as(ctypes.POINTER(ctypes.c_double)) if array is not None else None
+
+    start = time.time()
+    with _lock:
+        result = library.PoissonReconFromPoints(len(arguments), argv, len(points), pointer(points), pointer(normals),
+                                                pointer(colors))
+        mesh = None
+        profile = ReconstructionProfile()
+        if result:
+            try:
+                mesh = _copy_mesh(result.contents)
+                for line in (result.contents.comments or b"").decode("ascii", errors="replace").splitlines():
+                    profile.parse_line(line)
+            finally:
+                library.PoissonReconFreeMesh(result)
+    command = [get_poisson_library_path(settings)] + arguments
+    # PoissonRecon reports the memory of the whole process, which here also contains python and the point cloud
+    run = ReconstructionRun(command, 0 if mesh is not None else 1, time.time() - start, profile.peak_memory,
+                            profile=profile)
+    return mesh, run
+
+
+def run_poisson_library(settings, config, cloud, input_file: str, output_file: str, mesh_cache=None, metrics=None):
+    '''
+    Reconstruct the mesh of a point cloud in-process, the counterpart of run_poisson_reconstruction. The mesh is written
+    to output_file + '.ply' (without the density values) and, if config.metrics_log is set, the run is appended to this
+    JSONL file.
+    :param cloud: open3d point cloud with normals
+    :param input_file: path of the point cloud, only used for the metrics log.
+    :param mesh_cache: DiskCache for the reconstructed meshes or None.
+    :param metrics: dictionary of further values stored in the record of the run in the metrics log.
+    :return: tuple (Geometry of the mesh or None if the reconstruction failed, ReconstructionRun) or None if the library
+             is not available
+    '''
+    library_path = get_poisson_library_path(settings)
+    if load_poisson_library(settings) is None:
+        return None
+    points = np.asarray(cloud.points)
+    normals = np.asarray(cloud.normals)
+    colors = np.asarray(cloud.colors) if cloud.has_colors() else None
+    command = [library_path] + get_library_arguments(config)
+    print("[Info] PoissonRecon library: " + " ".join(command[1:]))
+    metrics = dict(metrics or {}, engine="poisson")
+
+    key = None
+    if mesh_cache is not None:
+        # a cloud without colors hashes only its points and normals
+        input_hash = content_hash(*(a for a in (points, normals, colors) if a is not None), colors=colors is not None)
+        key = reconstruction_key(command, None, input_hash=input_hash)
+        run = _cached_reconstruction(mesh_cache, key, command, output_file)
+        if run is not None:
+            _log_run(config, run, input_file, output_file, metrics)
+            return read_geometry(output_file + ".ply"), run
+
+    mesh, run = reconstruct_points(settings, config, points, normals, colors)
+    geometry = None
+    if mesh is None:
+        print("[WARNING] PoissonRecon library failed")
+    else:
+        geometry = Geometry(output_file + ".ply", mesh.to_open3d())
+        o3d.io.write_triangle_mesh(output_file + ".ply", geometry.geometry)
+        if key is not None:
+            mesh_cache.store_file(key + ".ply", output_file + ".ply")
+    _log_run(config, run, input_file, output_file, metrics)
+    return geometry, run
@@ -1,82 +1,359 @@
+import datetime
+import json
 import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
 
+from src.DiskCache import content_hash, file_hash
+from src.ReconstructionProfile import ReconstructionProfile
 
-def run_poisson_reconstruction(self, input_file: str="input.ply", output_file:str="mesh.ply",):
+
+class ReconstructionRun:
     '''
-    Method to call the PoissonRecon tool (see https://github.com/mkazhdan/PoissonRecon) with the provided parameters in
-    order to obtain the according mesh.
-    :param input_file: name of the input file containing specifications of the point cloud for which the mesh shall be
-           generated.
-    :param output_file: name of the output file in which the result is stored.
-    :param depth: maximum depth of the tree that will be used for surface reconstruction, default value is 8.
-    :param pointWeight: specifies the importance that interpolation of the point samples is given in the formulation of
-           the screened Poisson equation. Results of the original (unscreened) Poisson Reconstruction can be obtained by
-           setting this value to 0
-    :param color: boolean value defines if color values should be output with the vertices of the reconstructed surface.
-           If True, the input file must contain the according color specification.
-    :return: The output file is saved under PoissonRecon/Bin/Linux under the name specified in output_file, default file
-             name is "eagle.output.ply"
-    :return: The output file is saved under PoissonRecon/Bin/Linux under the name specified in output_file, default file
-             name is "eagle.output.ply"
+    Class ReconstructionRun describes one call of PoissonRecon: the command, its exit status, the wall time in seconds
+    and the peak resident memory of the PoissonRecon process in MB (None if the operation system does not report it).
+    cancelled is True if the process was killed because the run was cancelled. profile is the ReconstructionProfile
+    with the stage timings reported by PoissonRecon (None if it was not parsed). cached is True if PoissonRecon was not
+    run at all because the mesh was taken from the cache, wall time is then the time to copy it.
+    '''
+    def __init__(self, command, returncode, wall_time, peak_memory, cancelled=False, profile=None, cached=False):
+        self.command = command
+        self.returncode = returncode
+        self.wall_time = wall_time
+        self.peak_memory = peak_memory
+        self.cancelled = cancelled
+        self.profile = profile
+        self.cached = cached
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and not self.cancelled
+
+    def to_dict(self):
+        return {"command": list(self.command), "returncode": self.returncode, "wall_time": self.wall_time,
+                "peak_memory": self.peak_memory, "cancelled": self.cancelled, "cached": self.cached,
+                "profile": self.profile.to_dict() if self.profile is not None else None}
+
+    def __repr__(self):
+        memory = "?" if self.peak_memory is None else "{:.1f}".format(self.peak_memory)
+        profile = "" if self.profile is None or self.profile.empty else ", {}".format(self.profile)
+        state = ", cancelled" if self.cancelled else ", cached" if self.cached else ""
+        return "ReconstructionRun(returncode={}, wall_time={:.1f} s, peak_memory={} MB{}{})".format(
+            self.returncode, self.wall_time, memory, state, profile)
+
+
+def append_metrics(path: str, run: ReconstructionRun, **values):
+    '''
+    Append a record of run as one line of json to the metrics log path (JSONL), so the performance of the
+    reconstructions can be tracked over time.
+    :param values: further values stored in the record, e.g. the input file.
+    '''
+    record = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "host": platform.node()}
+    record.update(values)
+    record.update(run.to_dict())
+    line = json.dumps(record) + "\n"
+    # one write per record in append mode, so records of processes running in parallel are not mixed
+    with open(path, "a") as log:
+        log.write(line)
+
+
+# arguments of PoissonRecon which do not change the reconstructed mesh, with their number of values
+OUTPUT_INDEPENDENT_ARGUMENTS = {"--in": 1, "--out": 1, "--threads": 1, "--verbose": 0}
+
+
+def reconstruction_key(command, input_file: str, input_hash: str = None):
+    '''
+    Compute the key of a reconstruction for the mesh cache from the content of the input file, the PoissonRecon
+    executable and all arguments which influence the mesh.
+    :param command: list of arguments as returned by get_poisson_command
+    :param input_hash: hash of the input points to use instead of the hash of input_file, e.g. for points in memory.
+    :return: key for DiskCache
+    '''
+    arguments = []
+    i = 1
+    while i < len(command):
+        if command[i] in OUTPUT_INDEPENDENT_ARGUMENTS:
+            i += 1 + OUTPUT_INDEPENDENT_ARGUMENTS[command[i]]
+        else:
+            arguments.append(command[i])
+            i += 1
+    if input_hash is None:
+        input_hash = file_hash(input_file)
+    return "mesh_" + content_hash(input=input_hash, executable=file_hash(command[0]), arguments=arguments)
+
+
+def _cached_reconstruction(mesh_cache, key, command, output_file):
+    '''
+    :return: ReconstructionRun if the mesh of key was copied from mesh_cache to output_file, otherwise None
+    '''
+    start = time.time()
+    cached = mesh_cache.lookup(key + ".ply")
+    if cached is None:
+        return None
+    try:
+        shutil.copyfile(cached, output_file + ".ply")
+    except OSError:
+        # evicted by another process in the meantime
+        mesh_cache.hits -= 1
+        mesh_cache.misses += 1
+        return None
+    print("[Info] Mesh taken from cache:", cached)
+    profile = ReconstructionProfile().parse_ply_header(output_file + ".ply")
+    return ReconstructionRun(command, 0, time.time() - start, None, profile=profile, cached=True)
+
+
+# executables of the reconstruction engines: screened Poisson and smooth signed distance (SSD) reconstruction
+ENGINES = {"poisson": "PoissonRecon", "ssd": "SSDRecon"}
+
+
+def get_engine(config):
+    '''
+    :return: the engine config.engine runs, "poisson" or "ssd" ("auto" has to be resolved first, see EngineSelection)
+    '''
+    return config.engine if config.engine in ENGINES else "poisson"
+
+
+def get_poisson_executable(settings, engine: str = "poisson"):
+    '''
+    :param settings: Settings containing the main directory and the operation system.
+    :param engine: "poisson" for PoissonRecon or "ssd" for SSDRecon
+    :return: absolute path of the executable for the operation system or None if it does not exist.
     '''
     path = ""
     file = ""
     # for windows os
-    if self.settings.my_os == 'Windows':
+    if settings.my_os == 'Windows':
         path = "/ext/PoissonRecon.x64/"
-        file = "PoissonRecon.x64.exe"
+        file = ENGINES[engine] + ".x64.exe"
 
     # for linux os
-    if self.settings.my_os == 'Linux':
+    if settings.my_os == 'Linux':
         path = "/ext/PoissonRecon/Bin/Linux"
-        file = "./PoissonRecon"
+        file = ENGINES[engine]
 
     # for macOs
-    if self.settings.my_os == 'Darwin':
+    if settings.my_os == 'Darwin':
         path = "/ext/PoissonRecon/Bin/Linux"
-        file = "./PoissonRecon"
+        file = ENGINES[engine]
 
-    # call PoissonRecon to get the output mesh
-    if not os.path.exists(self.settings.main_dir + path):
-        print(" PoissonRecon could not be found at expectd location: ", path)
-        return
-    os.chdir(self.settings.main_dir + path)
+    executable = os.path.join(settings.main_dir + path, file)
+    if not os.path.exists(executable):
+        print(" {} could not be found at expectd location: ".format(ENGINES[engine]), path)
+        return None
+    return executable
 
+
+def get_poisson_command(executable: str, config, input_file: str, output_file: str):
+    '''
+    Build the argument list for PoissonRecon or SSDRecon (see config.engine) from the parameters in config.
+    :return: list of arguments, starting with the executable
+    '''
     # add according parameter if specified in valid form (defaults here are also defaults of PoissonRecon)
-    command = "{} --in {} --out {} ".format(file, input_file, output_file)
-
-    if self.param.linearFit_selected:
-        command += "--linearFit "
-    if self.param.degree_selected:
-        command += "--degree {} ".format(self.param.degree_value.int_value)
-    if self.param.color_selected:
-        command += "--color {} ".format(self.param.color_value.double_value)
-    if self.param.grid_selected:
-        command += "--voxel {} ".format(self.param.grid_name.text_value)
-    if self.param.depth_selected:
-        command += "--depth {} ".format(self.param.depth_value.int_value)
-    if self.param.primalVoxel_selected:
-        command += "--primalVoxel "
-    if self.param.scale_selected:
-        command += "--scale {} ".format(self.param.scale_value.double_value)
-    if self.param.samplesPerNode_selected:
-        command += "--samplesPerNode {} ".format(self.param.samplesPerNode_value.double_value)
-    if self.param.pointWeight_selected:
-        command += "--pointWeight {} ".format(self.param.pointWeight_value.int_value)
-    if self.param.iters_selected:
-        command += "--iters {} ".format(self.param.iters_value.int_value)
-    if self.param.threads_selected:
-        command += "--threads {} ".format(self.param.threads_value.int_value)
-    if self.param.confidence_selected:
-        command += "--confidence "
-    if self.param.nWeights_selected:
-        command += "--nWeights "
-    if self.param.density_selected:
-        command += "--density "
-    if self.param.verbose_selected:
-        command += "--verbose "
-
-    print("$ " + command)
-
-    os.system(command)
-    os.chdir(self.settings.main_dir)
+    command = [executable, "--in", input_file, "--out", output_file]
+    ssd = get_engine(config) == "ssd"
+
+    # SSDRecon always fits the iso-vertices linearly and has no point weight, but its own weights
+    if config.linearFit_selected and not ssd:
+        command += ["--linearFit"]
+    if config.degree_selected:
+        command += ["--degree", str(config.degree_value)]
+    if config.color_selected:
+        command += ["--color", str(config.color_value)]
+    if config.grid_selected:
+        command += ["--voxel", str(config.grid_name)]
+    if config.depth_selected:
+        command += ["--depth", str(config.depth_value)]
+    if config.primalVoxel_selected:
+        command += ["--primalVoxel"]
+    if config.scale_selected:
+        command += ["--scale", str(config.scale_value)]
+    if config.samplesPerNode_selected:
+        command += ["--samplesPerNode", str(config.samplesPerNode_value)]
+    if config.pointWeight_selected and not ssd:
+        command += ["--pointWeight", str(config.pointWeight_value)]
+    if config.valueWeight_selected and ssd:
+        command += ["--valueWeight", str(config.valueWeight_value)]
+    if config.gradientWeight_selected and ssd:
+        command += ["--gradientWeight", str(config.gradientWeight_value)]
+    if config.biLapWeight_selected and ssd:
+        command += ["--biLapWeight", str(config.biLapWeight_value)]
+    if config.iters_selected:
+        command += ["--iters", str(config.iters_value)]
+    if config.double_selected:
+        command += ["--double"]
+    if config.maxSolveDepth_selected:
+        command += ["--maxSolveDepth", str(config.maxSolveDepth_value)]
+    if config.fullDepth_selected:
+        command += ["--fullDepth", str(config.fullDepth_value)]
+    if config.cgDepth_selected:
+        command += ["--cgDepth", str(config.cgDepth_value)]
+    if config.polygonMesh_selected:
+        command += ["--polygonMesh"]
+    if config.threads_selected:
+        command += ["--threads", str(config.threads_value)]
+    if config.confidence_selected:
+        command += ["--confidence"]
+    if config.nWeights_selected:
+        command += ["--nWeights"]
+    if config.density_selected:
+        command += ["--density"]
+    if config.verbose_selected:
+        command += ["--verbose"]
+    return command
+
+
+def _read_peak_memory(pid):
+    '''
+    :return: peak resident memory (VmHWM) in MB of the running process pid, 0 if it can not be read (anymore)
+    '''
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / (1 << 10)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _forward_output(stream, on_output):
+    try:
+        for line in stream:
+            on_output(line.rstrip())
+    except OSError:
+        # reading a pseudo terminal whose other side was closed fails on linux instead of returning end of file
+        pass
+    stream.close()
+
+
+def run_command(command, on_output=None, cancel=None):
+    '''
+    Run command as child process and wait for it. In contrast to os.system the current working directory of this
+    process is never changed, so several commands can run at the same time.
+    :param command: list of arguments, starting with the executable
+    :param on_output: function called with every line the child process writes to stdout or stderr (from another
+           thread), None to let the child write to the stdout of this process.
+    :param cancel: threading.Event, the child process is killed as soon as it is set. None if the run can not be
+           cancelled.
+    :return: ReconstructionRun with exit status, wall time and peak memory of the child process
+    '''
+    start = time.time()
+    if on_output is None:
+        process = subprocess.Popen(command)
+    elif os.name == "posix":
+        # the C library of the child flushes its output after every line only if it writes to a terminal, to a pipe
+        # only when its buffer is full, so the output is read from a pseudo terminal
+        import pty
+        master, slave = pty.openpty()
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=slave, stderr=slave)
+        os.close(slave)
+        reader = threading.Thread(target=_forward_output, args=(open(master, errors="replace"), on_output),
+                                  daemon=True)
+        reader.start()
+    else:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   universal_newlines=True, bufsize=1)
+        reader = threading.Thread(target=_forward_output, args=(process.stdout, on_output), daemon=True)
+        reader.start()
+
+    peak_memory = None
+    cancelled = False
+    linux = os.path.exists("/proc/self/status")
+    if linux or cancel is not None:
+        # ru_maxrss of a child also contains the memory this process had when forking, so on linux the peak memory
+        # of the child is read from /proc while it is running
+        peak_memory = 0 if linux else None
+        while True:
+            if linux:
+                peak_memory = max(peak_memory, _read_peak_memory(process.pid))
+            if cancel is not None and cancel.is_set() and not cancelled:
+                process.kill()
+                cancelled = True
+            try:
+                process.wait(timeout=0.05)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+    elif hasattr(os, "wait4"):
+        # wait4 reports the resource usage of exactly this child, also when other children run in parallel
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is given in bytes on macOS
+        peak_memory = usage.ru_maxrss / (1 << 20) if platform.system() == 'Darwin' else usage.ru_maxrss / (1 << 10)
+    else:
+        process.wait()
+    if on_output is not None:
+        reader.join()
+    return ReconstructionRun(command, process.returncode, time.time() - start, peak_memory, cancelled)
+
+
+def run_poisson_reconstruction(settings, config, input_file: str="input.ply", output_file:str="mesh.ply",
+                               on_output=None, cancel=None, mesh_cache=None, metrics=None):
+    '''
+    Method to call the PoissonRecon tool (see https://github.com/mkazhdan/PoissonRecon) with the provided parameters in
+    order to obtain the according mesh. The profiler output of PoissonRecon is parsed into the profile of the returned
+    run and, if config.metrics_log is set, the run is appended to this JSONL file. If the same input file was already
+    reconstructed with the same parameters, the mesh is taken from mesh_cache instead of running PoissonRecon again.
+    :param settings: Settings containing the main directory and the operation system.
+    :param config: ReconstructionConfig containing the parameters chosen for PoissonRecon, e.g. the maximum depth of
+           the tree that will be used for surface reconstruction, the importance of the point samples in the screened
+           Poisson equation (pointWeight) or if colors should be output with the vertices of the reconstructed surface.
+    :param input_file: path of the input file containing specifications of the point cloud for which the mesh shall be
+           generated.
+    :param output_file: path of the output file in which the result is stored. PoissonRecon appends '.ply'.
+    :param on_output: function called with every line of output of PoissonRecon, None to print it.
+    :param cancel: threading.Event which kills PoissonRecon when it is set, see run_command.
+    :param mesh_cache: DiskCache for the reconstructed meshes or None. Reconstructions writing the implicit function
+           (--voxel) are not cached.
+    :param metrics: dictionary of further values stored in the record of the run in the metrics log, e.g. the DepthPlan.
+    :return: ReconstructionRun describing the call or None if PoissonRecon could not be found
+    '''
+    engine = get_engine(config)
+    executable = get_poisson_executable(settings, engine)
+    if executable is None:
+        return None
+    metrics = dict(metrics or {}, engine=engine)
+
+    command = get_poisson_command(executable, config, input_file, output_file)
+    print("$ " + " ".join(command))
+
+    key = None
+    if mesh_cache is not None and not config.grid_selected:
+        key = reconstruction_key(command, input_file)
+        run = _cached_reconstruction(mesh_cache, key, command, output_file)
+        if run is not None:
+            _log_run(config, run, input_file, output_file, metrics)
+            return run
+
+    profile = ReconstructionProfile()
+
+    def parse_output(line):
+        profile.parse_line(line)
+        if on_output is not None:
+            on_output(line)
+        else:
+            print(line)
+
+    run = run_command(command, parse_output, cancel)
+    if not profile.stages and run.succeeded and os.path.exists(output_file + ".ply"):
+        # without --verbose the stages are only written into the header of the mesh
+        profile.parse_ply_header(output_file + ".ply")
+    run.profile = profile
+
+    if run.cancelled:
+        print("[Info] PoissonRecon was cancelled")
+    elif not run.succeeded:
+        print("[WARNING] PoissonRecon failed with exit status", run.returncode)
+    elif key is not None and os.path.exists(output_file + ".ply"):
+        mesh_cache.store_file(key + ".ply", output_file + ".ply")
+    _log_run(config, run, input_file, output_file, metrics)
+    return run
+
+
+def _log_run(config, run, input_file, output_file, metrics=None):
+    if config.metrics_log:
+        append_metrics(config.metrics_log, run, input_file=os.path.abspath(input_file),
+                       output_file=os.path.abspath(output_file + ".ply"), **(metrics or {}))
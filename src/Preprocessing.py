@@ -0,0 +1,120 @@
+import time
+
+import numpy as np
+
+from src.AdaptiveDepth import plan_depth, predict_sample_time
+
+'''
+Preprocessing of the point cloud before PoissonRecon. Scans are often much denser than the octree of the chosen depth
+can resolve, but runtime and memory of PoissonRecon grow with the number of samples. The point cloud is therefore
+downsampled to a voxel grid finer than the finest octree level, which averages positions, colors and normals of the
+points in every voxel, and outliers can be removed before. The time the reconstruction saves is estimated from the
+removed points with the time model of AdaptiveDepth. It is a lower bound: the octree does not change as long as the
+voxels are finer than its cells, a coarser voxel_size also removes octree nodes.
+'''
+
+OUTLIER_REMOVAL_METHODS = ("none", "statistical", "radius")
+
+
+class PreprocessingResult:
+    '''
+    Class PreprocessingResult describes what the preprocessing did: number of points before and after outlier removal
+    and downsampling, the voxel size used (0 if not downsampled), the time in seconds spent on it and the predicted
+    time in seconds the reconstruction saves through the fewer points.
+    '''
+    def __init__(self, points_in, points_after_outliers, points_out, voxel_size, duration, time_saved=0.0):
+        self.points_in = points_in
+        self.points_after_outliers = points_after_outliers
+        self.points_out = points_out
+        self.voxel_size = voxel_size
+        self.duration = duration
+        self.time_saved = time_saved
+
+    def to_dict(self):
+        return {"points_in": self.points_in, "points_after_outliers": self.points_after_outliers,
+                "points_out": self.points_out, "voxel_size": self.voxel_size, "duration": self.duration,
+                "time_saved": self.time_saved}
+
+    @property
+    def ratio(self):
+        '''
+        :return: ratio of the points kept
+        '''
+        return self.points_out / self.points_in if self.points_in else 1.0
+
+    def __repr__(self):
+        return "{} points in, {} outliers removed, {} points out ({:.1f}%, voxel size {:.4g}) in {:.1f} s, " \
+               "reconstruction predicted at least {:.1f} s faster".format(
+                   self.points_in, self.points_in - self.points_after_outliers, self.points_out, 100 * self.ratio,
+                   self.voxel_size, self.duration, self.time_saved)
+
+
+def octree_cell_size(cloud, depth: int, scale: float = 1.1):
+    '''
+    Compute the edge length of the finest cells PoissonRecon uses: the bounding cube of the points is enlarged by scale
+    and split depth times.
+    :param depth: maximum depth of the octree (PoissonRecon --depth)
+    :param scale: ratio between the reconstruction cube and the bounding cube (PoissonRecon --scale)
+    '''
+    extent = cloud.get_max_bound() - cloud.get_min_bound()
+    return float(np.max(extent)) * scale / (1 << depth)
+
+
+def remove_outliers(cloud, config):
+    '''
+    Remove outliers with the method chosen in config.outlier_removal:
+    statistical: points whose mean distance to their outlier_neighbors nearest neighbors is more than outlier_std_ratio
+                 standard deviations above the average,
+    radius: points with less than outlier_neighbors neighbors within outlier_radius.
+    :return: point cloud without the outliers
+    '''
+    if config.outlier_removal == "statistical":
+        cloud, _ = cloud.remove_statistical_outlier(config.outlier_neighbors, config.outlier_std_ratio)
+    elif config.outlier_removal == "radius":
+        cloud, _ = cloud.remove_radius_outlier(config.outlier_neighbors, config.outlier_radius)
+    elif config.outlier_removal != "none":
+        raise ValueError("Unknown outlier removal {!r}, use one of {}".format(config.outlier_removal,
+                                                                              OUTLIER_REMOVAL_METHODS))
+    return cloud
+
+
+def needs_preprocessing(config):
+    return config.outlier_removal != "none" or config.downsample_selected
+
+
+def preprocess_point_cloud(cloud, config):
+    '''
+    Remove outliers and downsample the point cloud to a voxel grid as chosen in config. The voxel size is either
+    config.downsample_voxel_size or, if that is 0, the size of the finest octree cells divided by
+    config.downsample_factor, so the grid adapts to the depth of the reconstruction. With config.depth_auto this is the
+    depth AdaptiveDepth plans for the points without outliers.
+    :param cloud: open3d point cloud
+    :param config: ReconstructionConfig
+    :return: tuple (preprocessed point cloud, PreprocessingResult)
+    '''
+    start = time.time()
+    points_in = len(cloud.points)
+    cloud = remove_outliers(cloud, config)
+    points_after_outliers = len(cloud.points)
+
+    voxel_size = 0.0
+    if config.downsample_selected and points_after_outliers > 0:
+        voxel_size = config.downsample_voxel_size
+        if voxel_size <= 0:
+            if config.depth_auto:
+                # the depth the reconstruction of the points without outliers will be planned with
+                depth = plan_depth(np.asarray(cloud.points), config, verbose=False).depth
+            else:
+                depth = config.depth_value if config.depth_selected else 8
+            scale = config.scale_value if config.scale_selected else 1.1
+            voxel_size = octree_cell_size(cloud, depth, scale) / config.downsample_factor
+        cloud = cloud.voxel_down_sample(voxel_size)
+        if cloud.has_normals():
+            # averaged normals are shorter than 1
+            cloud.normalize_normals()
+
+    time_saved = predict_sample_time(points_in - len(cloud.points), config)
+    result = PreprocessingResult(points_in, points_after_outliers, len(cloud.points), voxel_size, time.time() - start,
+                                 time_saved)
+    print("[Info] Preprocessing:", result)
+    return cloud, result
@@ -0,0 +1,154 @@
+import json
+
+'''
+Class ReconstructionConfig contains the same parameters as GuiParameters.Parameters, but stores them as plain values
+instead of GUI widgets. It is used to run the reconstruction and texturing pipeline without any GUI, e.g. in batch mode.
+A config can be read from a json file whose keys are the attribute names below, for example
+    {"depth_selected": true, "depth_value": 10, "texture_width": 2048}
+'''
+class ReconstructionConfig:
+    engine = "poisson"              # "poisson" (PoissonRecon), "ssd" (SSDRecon) or "auto" (see EngineSelection)
+    dataset_class = ""              # auto: class of the point clouds whose runs are compared ("": by number of points)
+
+    # first tab
+    out_selected = True             # name of output file (default: mesh)
+    out_name = "mesh"
+    grid_selected = False           # name of file to which the sampled implicit function is written
+    grid_name = "implicit_fct_out"
+    color_selected = True           # color value (default 16)
+    color_value = 16.0
+
+    # second tab
+    depth_selected = False          # maximal depth of tree for surface reconstruction (default 8)
+    depth_value = 8
+    depth_auto = False              # choose depth and samples per node from the point spacing (see AdaptiveDepth)
+    iters_selected = False          # number of gauss-seidel relaxation at each iteration (default 8)
+    iters_value = 8
+    degree_selected = False         # degree of B-spline: larger degree = higher order (default 2)
+    degree_value = 2
+
+    # third tab
+    confidence_selected = False
+    linearFit_selected = False
+    nWeights_selected = False
+    pointWeight_selected = False    # importance for interpolation of point samples (default 4)
+    pointWeight_value = 4
+
+    # fourth tab
+    samplesPerNode_selected = False  # min number of samples per node in octree; adapted to density (default 1.000)
+    samplesPerNode_value = 1.0
+    scale_selected = False          # ratio of cube diameter for reconstruction and those for bounding (default 1.100)
+    scale_value = 1.1
+    threads_selected = False        # number of threads used for parallelization for reconstruntion (default 0)
+    threads_value = 0
+
+    # solver (seventh tab): memory and speed of the solver (see SolverProfiler)
+    double_selected = False         # solve in double instead of single precision, more memory
+    maxSolveDepth_selected = False  # depth up to which the system is solved, finer levels extrapolated (default: depth)
+    maxSolveDepth_value = 8
+    fullDepth_selected = False      # depth up to which the octree is complete (default 5)
+    fullDepth_value = 5
+    cgDepth_selected = False        # depth up to which conjugate gradients are used instead of Gauss-Seidel (default 0)
+    cgDepth_value = 0
+    polygonMesh_selected = False    # output the iso-surface as polygons instead of triangles
+    profile_combinations = []       # batch --profile: parameters set per run, e.g. [{"double_selected": true}]
+
+    # SSD reconstruction (engine "ssd")
+    valueWeight_selected = False    # weight of the zero-crossing of the implicit function at the points (default 4)
+    valueWeight_value = 4.0
+    gradientWeight_selected = False  # weight of the gradient matching the normals (default 0.001)
+    gradientWeight_value = 0.001
+    biLapWeight_selected = False    # weight of the smoothness (bi-Laplacian) term (default 0.00001)
+    biLapWeight_value = 0.00001
+
+    # fifth tab: output related
+    primalVoxel_selected = False
+    density_selected = False
+    trim_percentile = 5.0           # with density: trim the surface below this percentile of the densities (0: never)
+    trim_smooth = 5                 # smoothing iterations of the densities before trimming
+    trim_island_ratio = 0.001       # also remove trimmed islands smaller than this fraction of the area
+    verbose_selected = False
+    mesh_cache_size = 2048          # maximum size in MB of the cache for reconstructed meshes (0: no cache)
+    metrics_log = ""                # JSONL file to which a record of every PoissonRecon run is appended ("": none)
+    use_library = False             # run PoissonRecon in-process (make library in ext/PoissonRecon), not as executable
+    preview_depth = 5               # GUI: depth of the preview shown while the mesh is reconstructed (0: no preview)
+
+    # preprocessing of the point cloud before PoissonRecon
+    downsample_selected = False     # average the points in the voxels of a grid finer than the octree
+    downsample_voxel_size = 0.0     # edge length of the voxels (0: finest octree cell size / downsample_factor)
+    downsample_factor = 2.0         # number of voxels per finest octree cell along each axis
+    outlier_removal = "none"        # "none", "statistical" or "radius"
+    outlier_neighbors = 20          # neighbors considered by the outlier removal
+    outlier_std_ratio = 2.0         # statistical: threshold in standard deviations of the mean neighbor distance
+    outlier_radius = 0.05           # radius: radius in which at least outlier_neighbors points must lie
+
+    # tiled reconstruction of large scans (see TiledReconstruction)
+    tiles_selected = False          # reconstruct the cells of a grid over the bounding box separately and stitch them
+    tile_grid = [2, 2, 1]           # number of cells along x, y and z
+    tile_overlap = 0.1              # overlap of neighboring cells as fraction of the cell size
+    tile_workers = 0                # number of cells reconstructed at the same time (0: one per core)
+
+    # out-of-core preparation of point clouds larger than the memory (binary PLY only, see PointCloudStream)
+    stream_selected = False         # read the point cloud chunk by chunk instead of loading it (batch mode)
+    stream_memory_budget = 1024     # memory in MB used for the chunks and the slabs of the normal estimation
+
+    # normal estimation for point clouds without normals
+    normals_radius = 0.0            # radius of the neighborhood (0: only the normals_max_nn nearest neighbors)
+    normals_max_nn = 30             # maximum number of neighbors used to fit a normal
+    normals_orient = True           # orient the normals consistently, otherwise PoissonRecon may flip surfaces
+    normals_orient_nn = 10          # number of neighbors connected in the graph used for the orientation
+    normals_cache = True            # cache the estimated normals next to the input file (<name>.normals.npz)
+
+    # decimation of the mesh before the UV mapping (see MeshDecimation)
+    decimate_selected = False       # unwrap a decimated mesh (<name>_decimated.ply), baked from the full mesh
+    decimate_triangles = 100000     # number of triangles of the decimated mesh (0: only bounded by decimate_max_error)
+    decimate_max_error = 0.0        # maximum quadric error of an edge collapse (0: no bound, needs decimate_triangles)
+
+    # texture
+    texture_width = 1024            # number of pixels per row (and column) of the generated texture maps
+    texture_padding = 4             # number of pixels by which the UV charts are grown into the empty gutters
+    texture_from_points = False     # take the colors of the texture from the input points instead of the mesh
+    texture_neighbors = 4           # number of nearest input points blended per pixel
+    uv_cache_size = 1024            # maximum size in MB of the cache for xatlas unwraps (0: no cache)
+    xatlas_chart_options = {}       # attributes of xatlas.ChartOptions, e.g. {"max_iterations": 1}
+    xatlas_pack_options = {}        # attributes of xatlas.PackOptions, e.g. {"bruteForce": true, "resolution": 4096}
+
+    def __init__(self, **values):
+        # every config gets its own dictionaries and lists
+        self.xatlas_chart_options = {}
+        self.xatlas_pack_options = {}
+        self.tile_grid = list(ReconstructionConfig.tile_grid)
+        self.profile_combinations = []
+        for key, value in values.items():
+            self.set(key, value)
+
+    def set(self, key, value):
+        '''
+        Set a single parameter. Only known parameters can be set, so that typos in a config file are not ignored.
+        :param key: name of the parameter, e.g. "depth_value"
+        :param value: new value of the parameter
+        '''
+        if not self._is_parameter(key):
+            raise KeyError("Unknown reconstruction parameter: {}".format(key))
+        setattr(self, key, value)
+
+    def to_dict(self):
+        '''
+        :return: dictionary of all parameters with their current values
+        '''
+        return {key: getattr(self, key) for key in vars(ReconstructionConfig) if self._is_parameter(key)}
+
+    @staticmethod
+    def _is_parameter(key):
+        return not key.startswith("_") and hasattr(ReconstructionConfig, key) \
+            and not callable(getattr(ReconstructionConfig, key))
+
+    @classmethod
+    def from_file(cls, path: str):
+        '''
+        Read a config from a json file.
+        :param path: path of the json file
+        :return: the ReconstructionConfig
+        '''
+        with open(path) as f:
+            return cls(**json.load(f))
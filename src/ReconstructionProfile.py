@@ -0,0 +1,164 @@
+import platform
+import re
+
+'''
+Parser of the profiler output of PoissonRecon. For every stage PoissonRecon reports the time and memory in lines like
+    # Read input into tree:       0.3 (s),      18.2 (MB) /      18.2 (MB)
+    #          Total Solve:       4.4 (s),      63.0 (MB)
+(time of the stage, memory in use, maximum memory so far and, on Windows, the peak memory of the process). With
+--verbose these lines are printed together with counts like 'Vertices / Polygons: 33146 / 65997'. The stage lines are
+also written as comments into the header of the output mesh, so they are available without --verbose, too.
+'''
+
+STAGE_PATTERN = re.compile(r"^#?\s*([A-Za-z][A-Za-z ]*?):\s+([\d.]+) \(s\),\s+([\d.]+) \(MB\)"
+                           r"(?: /\s+([\d.]+) \(MB\))?(?: /\s+([\d.]+) \(MB\))?\s*$")
+COUNT_PATTERN = re.compile(r"^([A-Za-z][A-Za-z ]*(?: / [A-Za-z][A-Za-z ]*)*):\s*(\d+(?:\s*/\s*\d+)*)\s*$")
+DEPTH_PATTERN = re.compile(r"^Depth\[(\d+)/\d+\]:\s*Evaluated / Got / Solved in:\s*([\d.]+) /\s*([\d.]+) /\s*([\d.]+)"
+                           r"\s*\(([\d.]+) MB\)\s*Nodes:\s*(\d+)")
+ISO_VALUE_PATTERN = re.compile(r"^Iso-Value:\s*(\S+)")
+# only the Windows build reports the peak memory of the process. Other builds print the line 'Got average' with the same
+# format, but without passing a value for the peak memory, so the number printed there is meaningless.
+PEAK_MEMORY_REPORTED = platform.system() == 'Windows'
+
+# stages of PoissonRecon which belong to the set up of the linear system
+SET_UP_STAGES = ("Got kernel density", "Got normal field", "Finalized tree", "Set FEM constraints",
+                 "Set point constraints")
+# stages of PoissonRecon which belong to the extraction of the iso-surface
+ISO_SURFACE_STAGES = ("Got average", "Got triangles", "Got polygons")
+
+
+class StageTiming:
+    '''
+    Class StageTiming contains time in seconds and memory in MB of one stage of PoissonRecon: memory in use after the
+    stage, maximum memory used so far and peak memory of the process (None if not reported).
+    '''
+    def __init__(self, name, time, memory, max_memory=None, peak_memory=None):
+        self.name = name
+        self.time = time
+        self.memory = memory
+        self.max_memory = max_memory
+        self.peak_memory = peak_memory
+
+    def to_dict(self):
+        return {"time": self.time, "memory": self.memory, "max_memory": self.max_memory,
+                "peak_memory": self.peak_memory}
+
+    def __repr__(self):
+        return "StageTiming({}: {:.1f} s, {:.1f} MB)".format(self.name, self.time, self.memory)
+
+
+def _number(text):
+    return float(text) if text is not None else None
+
+
+def _key(name):
+    return "_".join(name.lower().replace("-", " ").split())
+
+
+class ReconstructionProfile:
+    '''
+    Class ReconstructionProfile collects the stages and counts reported by one run of PoissonRecon. Lines are added one
+    by one with parse_line, so the output can be parsed while PoissonRecon is running.
+    '''
+    def __init__(self):
+        self.stages = {}        # name of the stage -> StageTiming, in the order of the output
+        self.counts = {}        # e.g. input_points, samples, leaf_nodes, active_nodes, vertices, polygons
+        self.depths = []        # per depth of the solver: dictionary of times, memory and number of nodes
+        self.iso_value = None
+
+    def parse_line(self, line: str):
+        '''
+        Parse one line of the output of PoissonRecon, lines which are not part of the profile are ignored.
+        :return: True if the line was part of the profile
+        '''
+        line = line.strip()
+        match = STAGE_PATTERN.match(line)
+        if match:
+            name = match.group(1).strip()
+            peak_memory = _number(match.group(5)) if PEAK_MEMORY_REPORTED else None
+            self.stages[name] = StageTiming(name, float(match.group(2)), float(match.group(3)),
+                                            _number(match.group(4)), peak_memory)
+            return True
+        match = DEPTH_PATTERN.match(line)
+        if match:
+            self.depths.append({"depth": int(match.group(1)), "evaluated": float(match.group(2)),
+                                "got": float(match.group(3)), "solved": float(match.group(4)),
+                                "memory": float(match.group(5)), "nodes": int(match.group(6))})
+            return True
+        match = ISO_VALUE_PATTERN.match(line)
+        if match:
+            self.iso_value = float(match.group(1))
+            return True
+        match = COUNT_PATTERN.match(line)
+        if match:
+            names = [_key(name) for name in match.group(1).split(" / ")]
+            values = [int(value) for value in match.group(2).split("/")]
+            if len(names) == len(values):
+                self.counts.update(zip(names, values))
+                return True
+        return False
+
+    def parse_ply_header(self, path: str):
+        '''
+        Parse the stages PoissonRecon writes as comments into the header of the mesh in path.
+        '''
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.decode("ascii", errors="replace").rstrip()
+                if line == "end_header":
+                    break
+                if line.startswith("comment "):
+                    self.parse_line(line[len("comment "):])
+        return self
+
+    def _sum(self, names):
+        times = [self.stages[name].time for name in names if name in self.stages]
+        return round(sum(times), 3) if times else None
+
+    @property
+    def read_tree(self):
+        '''
+        :return: time in seconds to read the input into the tree or None if not reported
+        '''
+        return self._sum(("Read input into tree",))
+
+    @property
+    def set_up_system(self):
+        return self._sum(SET_UP_STAGES)
+
+    @property
+    def solve(self):
+        return self._sum(("Linear system solved",))
+
+    @property
+    def iso_surface(self):
+        return self._sum(ISO_SURFACE_STAGES)
+
+    @property
+    def total(self):
+        return self._sum(("Total Solve",))
+
+    @property
+    def peak_memory(self):
+        '''
+        :return: highest memory in MB reported in any stage or None if no stage was reported
+        '''
+        memory = [value for stage in self.stages.values()
+                  for value in (stage.memory, stage.max_memory, stage.peak_memory) if value is not None]
+        return max(memory) if memory else None
+
+    @property
+    def empty(self):
+        return not self.stages and not self.counts
+
+    def to_dict(self):
+        return {"read_tree": self.read_tree, "set_up_system": self.set_up_system, "solve": self.solve,
+                "iso_surface": self.iso_surface, "total": self.total, "peak_memory": self.peak_memory,
+                "stages": {_key(name): stage.to_dict() for name, stage in self.stages.items()},
+                "counts": dict(self.counts), "depths": list(self.depths), "iso_value": self.iso_value}
+
+    def __repr__(self):
+        def seconds(value):
+            return "?" if value is None else "{:.1f} s".format(value)
+        return "ReconstructionProfile(read tree {}, set up system {}, solve {}, iso-surface {})".format(
+            seconds(self.read_tree), seconds(self.set_up_system), seconds(self.solve), seconds(self.iso_surface))
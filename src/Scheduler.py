@@ -0,0 +1,57 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+
+'''
+Scheduler to run several jobs (e.g. reconstructions of different point clouds) at the same time in a process pool.
+The cores of the machine are split between the jobs: every job gets its share as PoissonRecon --threads value and as
+number of numba threads instead of every job using all cores.
+'''
+
+
+def split_cores(jobs: int, workers: int = None, cpu_count: int = None):
+    '''
+    Compute how many jobs run at the same time and how many threads each of them may use.
+    :param jobs: number of jobs which shall be run.
+    :param workers: maximum number of jobs running at the same time, default: one job per core.
+    :param cpu_count: number of cores, default: number of cores of this machine.
+    :return: tuple (workers, threads per job)
+    '''
+    cpu_count = cpu_count or os.cpu_count() or 1
+    workers = max(1, min(jobs, workers or cpu_count))
+    return workers, max(1, cpu_count // workers)
+
+
+def with_threads(config, threads: int):
+    '''
+    :return: copy of the ReconstructionConfig config which lets PoissonRecon use the given number of threads
+    '''
+    config = copy.copy(config)
+    config.threads_selected = True
+    config.threads_value = threads
+    return config
+
+
+def _init_worker(threads):
+    numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+
+
+def run_jobs(function, jobs, workers: int = None, threads: int = 1):
+    '''
+    Call function(*arguments) for every tuple of arguments in jobs, using a pool of worker processes.
+    :param function: function to call, must be defined at module level so that it can be sent to the workers.
+    :param jobs: list of argument tuples.
+    :param workers: number of worker processes.
+    :param threads: number of numba threads per worker.
+    :return: generator of (arguments, result, exception) in the order of jobs. exception is None if the job succeeded.
+    '''
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(function, *arguments) for arguments in jobs]
+        for arguments, future in zip(jobs, futures):
+            try:
+                yield arguments, future.result(), None
+            except Exception as e:
+                yield arguments, None, e
+
@@ -0,0 +1,19 @@
+class Settings:
+    '''
+    Class Settings contains the directories and the operation system the PointCloud2Mesh tool is running on. It does not
+    depend on the GUI, so it can be used by the GUI as well as by the headless batch mode.
+    '''
+
+    gen_filename = "generated_input.ply"
+    input_file = ""
+    output_file = ""
+
+    def __init__(self, main_dir, my_os):
+        # Directories
+        self.main_dir = main_dir
+        self.model_dir = main_dir + "/models/"
+        self.out_dir = main_dir + "/out/"
+        self.cache_dir = main_dir + "/cache/"
+
+        # Operation system
+        self.my_os = my_os
@@ -0,0 +1,122 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from src.EngineSelection import with_engine
+from src.PointCloudStream import read_ply_vertices
+from src.PoissonReconstruction import get_engine, run_poisson_reconstruction
+
+'''
+Profiling of the solver settings of PoissonRecon which trade memory against speed: the precision of the solver
+(--double), the depth up to which the system is solved (--maxSolveDepth, finer levels are only extrapolated), the depth
+up to which the octree is complete (--fullDepth) and the depth up to which conjugate gradients are used instead of
+Gauss-Seidel (--cgDepth). The same point cloud is reconstructed with a few combinations and the wall time, the peak
+memory and the number of faces of every run are reported, so the settings can be chosen for the hardware at hand.
+'''
+
+
+class SolverProfile:
+    '''
+    Class SolverProfile describes the run of one combination: its label, the parameters set on top of the config, the
+    ReconstructionRun (None if PoissonRecon could not be found) and the number of faces of the mesh.
+    '''
+    def __init__(self, label, parameters, run, faces):
+        self.label = label
+        self.parameters = parameters
+        self.run = run
+        self.faces = faces
+
+    def __repr__(self):
+        if self.run is None or not self.run.succeeded:
+            return "{:<24} failed".format(self.label)
+        memory = "{:.0f} MB".format(self.run.peak_memory) if self.run.peak_memory is not None else "?"
+        return "{:<24} {:>8.2f} s {:>10} {:>10} faces".format(self.label, self.run.wall_time, memory, self.faces)
+
+
+def get_combinations(config):
+    '''
+    :param config: ReconstructionConfig whose profile_combinations are used, by default combinations around its depth
+    :return: list of tuples (label, dictionary of the parameters set on top of config)
+    '''
+    if config.profile_combinations:
+        return [(", ".join("{}={}".format(key, value) for key, value in parameters.items()) or "config", parameters)
+                for parameters in config.profile_combinations]
+    depth = config.depth_value if config.depth_selected else 8
+    full_depth = config.fullDepth_value if config.fullDepth_selected else 5
+    return [("config", {}),
+            ("double", {"double_selected": True}),
+            ("fullDepth {}".format(max(full_depth - 2, 0)), {"fullDepth_selected": True,
+                                                              "fullDepth_value": max(full_depth - 2, 0)}),
+            ("fullDepth {}".format(min(full_depth + 1, depth)), {"fullDepth_selected": True,
+                                                                  "fullDepth_value": min(full_depth + 1, depth)}),
+            ("maxSolveDepth {}".format(depth - 1), {"maxSolveDepth_selected": True, "maxSolveDepth_value": depth - 1}),
+            ("cgDepth {}".format(full_depth), {"cgDepth_selected": True, "cgDepth_value": full_depth})]
+
+
+def count_faces(mesh_file: str):
+    '''
+    :return: number of faces (triangles or, with --polygonMesh, polygons) in the header of the PLY file, 0 if unknown
+    '''
+    if read_ply_vertices(mesh_file) is None:
+        return 0
+    with open(mesh_file, "rb") as f:
+        for line in f:
+            words = line.decode("ascii", errors="replace").split()
+            if words[:2] == ["element", "face"]:
+                return int(words[2])
+            if words[:1] == ["end_header"]:
+                break
+    return 0
+
+
+def profile_solver(settings, config, input_file: str, out_dir: str, on_output=None):
+    '''
+    Reconstruct input_file with every combination of get_combinations. The meshes are not taken from the cache and are
+    deleted afterwards. The runs are recorded in the metrics log of config with the label as solver_profile.
+    :param settings: Settings containing the main directory and the operation system.
+    :param config: ReconstructionConfig of the reconstruction, the combinations are set on top of it.
+    :param input_file: point cloud with normals, i.e. the file which is passed to PoissonRecon.
+    :param out_dir: directory in which the temporary meshes are written.
+    :param on_output: function called with every line of output of PoissonRecon, default: output is dropped.
+    :return: list of SolverProfile
+    '''
+    if config.engine == "auto":
+        print("[WARNING] The solver is profiled with the Poisson engine, not with auto")
+    config = with_engine(config, get_engine(config) if config.engine != "auto" else "poisson")
+    config.grid_selected = False
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="profile_", dir=out_dir)
+    profiles = []
+    try:
+        for i, (label, parameters) in enumerate(get_combinations(config)):
+            combination = copy.copy(config)
+            for key, value in parameters.items():
+                combination.set(key, value)
+            output_file = os.path.join(tmp_dir, "mesh_{}".format(i))
+            run = run_poisson_reconstruction(settings, combination, input_file, output_file,
+                                             on_output or (lambda line: None), metrics={"solver_profile": label})
+            faces = count_faces(output_file + ".ply") if run is not None and run.succeeded else 0
+            profile = SolverProfile(label, parameters, run, faces)
+            print("[Info] Profile", profile)
+            profiles.append(profile)
+            if run is None:
+                break
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return profiles
+
+
+def report_profiles(profiles):
+    '''
+    Print the runs as table, the fastest run and the run with the lowest peak memory.
+    '''
+    print("{:<24} {:>10} {:>10} {:>16}".format("combination", "wall time", "memory", "faces"))
+    for profile in profiles:
+        print(profile)
+    succeeded = [profile for profile in profiles if profile.run is not None and profile.run.succeeded]
+    if succeeded:
+        print("[Info] Fastest:", min(succeeded, key=lambda profile: profile.run.wall_time).label)
+        measured = [profile for profile in succeeded if profile.run.peak_memory is not None]
+        if measured:
+            print("[Info] Lowest peak memory:", min(measured, key=lambda profile: profile.run.peak_memory).label)
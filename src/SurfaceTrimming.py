@@ -0,0 +1,165 @@
+import os
+import subprocess
+import time
+
+import numpy as np
+import open3d as o3d
+
+from src.PointCloudStream import PLY_TYPES, read_ply_vertices
+
+'''
+Trimming of the reconstructed surface with SurfaceTrimmer of PoissonRecon (make release in ext/PoissonRecon). With
+--density PoissonRecon stores at every vertex the depth of the octree at which it lies, which is low where no samples
+are near: the surface PoissonRecon closes over holes and around open scans. SurfaceTrimmer cuts away the parts of the
+mesh whose value is below a threshold. The threshold is chosen as a percentile of the vertex values, so the same
+setting works for every depth. Removing these triangles before the UV mapping saves xatlas and rasterization time and
+texture area.
+'''
+
+
+class TrimStatistics:
+    '''
+    Class TrimStatistics describes one trimming: number of triangles before and after, the density threshold, the
+    wall time in seconds and whether SurfaceTrimmer was used (otherwise the triangles were removed without cutting).
+    '''
+    def __init__(self, triangles_before, triangles_after, threshold, wall_time, trimmer=True):
+        self.triangles_before = triangles_before
+        self.triangles_after = triangles_after
+        self.threshold = threshold
+        self.wall_time = wall_time
+        self.trimmer = trimmer
+
+    @property
+    def removed(self):
+        return max(self.triangles_before - self.triangles_after, 0)
+
+    def saved_time(self, downstream_time: float):
+        '''
+        Estimate the time the removed triangles would have cost downstream, which grows linearly with the triangles.
+        :param downstream_time: time in seconds spent on the trimmed mesh, e.g. UV mapping and texture
+        :return: estimated time in seconds saved by the trimming
+        '''
+        if self.triangles_after == 0:
+            return 0.0
+        return downstream_time * self.removed / self.triangles_after
+
+    def __repr__(self):
+        return "{} of {} triangles removed ({:.1f}%) below density {:.3f} in {:.2f} s".format(
+            self.removed, self.triangles_before, 100 * self.removed / max(self.triangles_before, 1), self.threshold,
+            self.wall_time)
+
+
+def get_trimmer_executable(settings):
+    '''
+    :param settings: Settings containing the main directory and the operation system.
+    :return: absolute path of the SurfaceTrimmer executable or None if it was not built.
+    '''
+    if settings.my_os == 'Windows':
+        executable = os.path.join(settings.main_dir + "/ext/PoissonRecon.x64/", "SurfaceTrimmer.x64.exe")
+    else:
+        executable = os.path.join(settings.main_dir + "/ext/PoissonRecon/Bin/Linux", "SurfaceTrimmer")
+    return executable if os.path.exists(executable) else None
+
+
+def read_ply_triangles(vertices):
+    '''
+    Read the faces which follow the vertices of a binary PLY file written by PoissonRecon.
+    :param vertices: PlyVertices of the file
+    :return: array of triangles (m x 3) or None if the faces are no triangles with uchar count and int indices
+    '''
+    count = None
+    list_types = None
+    byte_order = None
+    with open(vertices.path, "rb") as f:
+        for line in f:
+            words = line.decode("ascii", errors="replace").split()
+            if words[:1] == ["format"]:
+                byte_order = {"binary_little_endian": "<", "binary_big_endian": ">"}.get(words[1])
+            elif words[:2] == ["element", "face"]:
+                count = int(words[2])
+            elif count is not None and list_types is None and words[:2] == ["property", "list"]:
+                list_types = words[2:4]
+            elif words[:1] == ["end_header"]:
+                break
+    if byte_order is None or count is None or list_types is None or any(t not in PLY_TYPES for t in list_types):
+        return None
+    dtype = np.dtype([("n", byte_order + PLY_TYPES[list_types[0]]), ("i", byte_order + PLY_TYPES[list_types[1]], 3)])
+    offset = vertices.offset + vertices.count * vertices.dtype.itemsize
+    if os.path.getsize(vertices.path) < offset + count * dtype.itemsize:
+        return None
+    faces = np.memmap(vertices.path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+    if np.any(faces["n"] != 3):
+        return None
+    return np.asarray(faces["i"], dtype=np.int64)
+
+
+def smooth_values(values, triangles, iterations: int):
+    '''
+    Average every value with the values of its neighbors, the same way as SurfaceTrimmer does before trimming.
+    '''
+    values = values.astype(np.float64)
+    a = triangles.ravel()
+    b = np.roll(triangles, -1, axis=1).ravel()
+    count = np.bincount(a, minlength=len(values)) + np.bincount(b, minlength=len(values))
+    for _ in range(iterations):
+        sums = np.bincount(a, weights=values[b], minlength=len(values)) + \
+               np.bincount(b, weights=values[a], minlength=len(values))
+        values = (sums + values) / (count + 1)
+    return values
+
+
+def _trim_triangles(mesh_file: str, values, threshold: float):
+    '''
+    Remove the triangles with a vertex at or below threshold without SurfaceTrimmer. The density values are lost.
+    :return: number of triangles left
+    '''
+    mesh = o3d.io.read_triangle_mesh(mesh_file)
+    triangles = np.asarray(mesh.triangles)
+    mesh.remove_triangles_by_mask(np.any(values[triangles] <= threshold, axis=1))
+    mesh.remove_unreferenced_vertices()
+    tmp_file = os.path.splitext(mesh_file)[0] + ".tmp.ply"
+    o3d.io.write_triangle_mesh(tmp_file, mesh)
+    os.replace(tmp_file, mesh_file)
+    return len(mesh.triangles)
+
+
+def trim_surface(settings, config, mesh_file: str):
+    '''
+    Trim the mesh written by PoissonRecon with --density in place: parts whose density is below the
+    config.trim_percentile percentile of the vertex values are removed. The trimmed mesh is written next to mesh_file
+    and replaces it only once it could be read, so a failed SurfaceTrimmer leaves the mesh untouched.
+    :param settings: Settings containing the main directory and the operation system.
+    :param config: ReconstructionConfig with trim_percentile, trim_smooth and trim_island_ratio
+    :param mesh_file: path of the PLY file with the density values
+    :return: TrimStatistics or None if the mesh has no density values
+    '''
+    start = time.time()
+    vertices = read_ply_vertices(mesh_file)
+    if vertices is None or "value" not in vertices.names:
+        print("[WARNING] No density values in", mesh_file, ", the surface is not trimmed")
+        return None
+    triangles = read_ply_triangles(vertices)
+    if triangles is None:
+        print("[WARNING] Unexpected faces in", mesh_file, ", the surface is not trimmed")
+        return None
+    values = smooth_values(np.asarray(vertices.memmap()["value"]), triangles, config.trim_smooth)
+    threshold = float(np.percentile(values, config.trim_percentile)) if len(values) else 0.0
+
+    executable = get_trimmer_executable(settings)
+    if executable is not None:
+        trimmed_file = os.path.splitext(mesh_file)[0] + ".tmp.ply"
+        command = [executable, "--in", mesh_file, "--out", trimmed_file, "--trim", str(threshold),
+                   "--smooth", str(config.trim_smooth), "--aRatio", str(config.trim_island_ratio)]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        trimmed = read_ply_vertices(trimmed_file) if result.returncode == 0 else None
+        trimmed_triangles = read_ply_triangles(trimmed) if trimmed is not None else None
+        if trimmed_triangles is not None:
+            os.replace(trimmed_file, mesh_file)
+            return TrimStatistics(len(triangles), len(trimmed_triangles), threshold, time.time() - start)
+        if os.path.exists(trimmed_file):
+            os.remove(trimmed_file)
+        print("[WARNING] SurfaceTrimmer failed:", result.stdout.strip())
+    else:
+        print("[WARNING] SurfaceTrimmer not found (make release in ext/PoissonRecon), triangles are removed uncut")
+    count = _trim_triangles(mesh_file, values, threshold)
+    return TrimStatistics(len(triangles), count, threshold, time.time() - start, trimmer=False)
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+from numba import njit, prange
+
+from src.DiskCache import content_hash
+
+'''
+Texel buffer of a texture: for every pixel the face of the mesh covering it and the barycentric coordinates of the
+pixel center in that face, as computed by the rasterization. The buffer is saved next to the maps (<image>_texels.npy,
+memory-mapped when it is read, and <image>_texels.npz with the faces and the key of the mesh). As long as the vertex
+positions, faces, texture size and xatlas options do not change, every per-vertex value, e.g. corrected colors, ambient
+occlusion or curvature, is baked into a map by one parallel gather instead of unwrapping and rasterizing again.
+'''
+
+# dtype of one texel: face index (-1 for pixels not covered) and the weights of the first two vertices of the face
+TEXEL_DTYPE = np.dtype([("face", "<i4"), ("weights", "<f4", 2)])
+
+
+def texel_key(vertices, triangles, texture_width: int, chart_options: dict = None, pack_options: dict = None):
+    '''
+    :return: key of the texel buffer of a mesh, it changes with the vertex positions, faces, texture size and options
+    '''
+    return content_hash(vertices, triangles, texture_width=int(texture_width),
+                        chart_options=sorted((chart_options or {}).items()),
+                        pack_options=sorted((pack_options or {}).items()))
+
+
+class TexelBuffer:
+    '''
+    Class TexelBuffer contains face_index (width x width, -1 for pixels not covered), barycentrics (width x width x 2,
+    the weight of the third vertex is 1 minus their sum), the faces (m x 3) in the vertex indices of the mesh, the key
+    of the mesh (see texel_key) and the statistics of the xatlas unwrap, an array as cached by parametrize.
+    '''
+    def __init__(self, face_index, barycentrics, faces, key, statistics):
+        self.face_index = face_index
+        self.barycentrics = barycentrics
+        self.faces = faces
+        self.key = key
+        self.statistics = statistics
+
+    @property
+    def width(self):
+        return self.face_index.shape[0]
+
+    @property
+    def coverage(self):
+        return self.face_index >= 0
+
+    def gather(self, values, dtype=np.float64):
+        '''
+        Interpolate per-vertex values at every covered pixel.
+        :param values: array (n) or (n, c) of values of the vertices of the mesh
+        :param dtype: dtype of the result. For an integer dtype the interpolated values are truncated and wrap around
+               outside its range, e.g. np.uint8 for an image.
+        :return: array (width, width) or (width, width, c) of dtype, 0 at pixels which are not covered
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        channels = values.reshape(len(values), -1)
+        result = np.zeros(self.face_index.shape + (channels.shape[1],), dtype=dtype)
+        _gather_pixels(self.face_index, self.barycentrics, self.faces, channels, result,
+                       np.issubdtype(dtype, np.integer))
+        return result.reshape(self.face_index.shape + values.shape[1:])
+
+    def save(self, path: str):
+        '''
+        Write the buffer to path + '.npy' and path + '.npz'. Each file is written under a temporary name and renamed, so
+        a reader never sees a half written file.
+        '''
+        texels = np.empty(self.face_index.shape, dtype=TEXEL_DTYPE)
+        texels["face"] = self.face_index
+        texels["weights"] = self.barycentrics
+        for suffix, write in ((".npy", lambda f: np.save(f, texels)),
+                              (".npz", lambda f: np.savez(f, faces=self.faces, key=np.array(self.key),
+                                                          statistics=self.statistics))):
+            tmp_path = path + ".tmp" + suffix
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path + suffix)
+
+    @classmethod
+    def load(cls, path: str, key: str = None):
+        '''
+        Read the buffer written by save, the texels are memory-mapped.
+        :param key: key of the mesh (see texel_key), None to accept any buffer
+        :return: TexelBuffer or None if there is no buffer at path or it belongs to another mesh
+        '''
+        if not os.path.exists(path + ".npy") or not os.path.exists(path + ".npz"):
+            return None
+        try:
+            with np.load(path + ".npz") as data:
+                stored_key = str(data["key"])
+                faces = data["faces"]
+                statistics = data["statistics"]
+            if key is not None and stored_key != key:
+                return None
+            texels = np.load(path + ".npy", mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        if texels.dtype != TEXEL_DTYPE or texels.ndim != 2:
+            return None
+        # ndarray views of the fields, backed by the memory map
+        return cls(np.asarray(texels["face"]), np.asarray(texels["weights"]), faces, stored_key, statistics)
+
+
+@njit(cache=True, parallel=True)
+def _gather_pixels(face_index, barycentrics, faces, values, result, truncate):
+    '''
+    Interpolate the values (n x c) of the vertices of faces at the pixels of face_index into result (in place).
+    '''
+    for x in prange(face_index.shape[0]):
+        for y in range(face_index.shape[1]):
+            i = face_index[x, y]
+            if i < 0:
+                continue
+            a = barycentrics[x, y, 0]
+            b = barycentrics[x, y, 1]
+            c = 1 - a - b
+            for channel in range(values.shape[1]):
+                value = a * values[faces[i, 0], channel] + b * values[faces[i, 1], channel] + \
+                    c * values[faces[i, 2], channel]
+                if truncate:
+                    result[x, y, channel] = np.int64(value)
+                else:
+                    result[x, y, channel] = value
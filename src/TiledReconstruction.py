@@ -0,0 +1,210 @@
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import open3d as o3d
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from src.AdaptiveDepth import plan_depth, report_plan
+from src.DiskCache import DiskCache
+from src.EngineSelection import run_reconstruction
+from src.GeometryStore import Geometry, read_geometry
+from src.PoissonReconstruction import ReconstructionRun
+from src.Preprocessing import octree_cell_size
+from src.Scheduler import run_jobs, split_cores, with_threads
+
+'''
+Tiled reconstruction for scans too large for one PoissonRecon call at the wanted depth. The bounding box of the point
+cloud is split into a grid of cells. Every cell is reconstructed separately from its points and the points of an
+overlap around it, so the octree of each call covers only one cell and the depth is spent on a smaller region. The cells
+run in a process pool. Each cell mesh is trimmed to its cell (a triangle belongs to the cell containing its centroid)
+and to the surroundings of its points, which removes the surface PoissonRecon closes in the overlap. The trimmed meshes
+are stitched into one mesh by welding the vertices of neighboring cells which lie close together at the cell borders.
+'''
+
+# triangles with a vertex farther than this number of finest octree cells of its tile from all points are removed
+SURFACE_DISTANCE = 2.0
+# vertices of neighboring tiles closer than this number of finest octree cells at a cell border are welded
+WELD_DISTANCE = 0.5
+
+
+class Tile:
+    '''
+    Class Tile describes one cell of the grid: its index, the box of the cell (core_min, core_max, the outer sides of
+    the border cells are unbounded) and the box of the points reconstructed with it (cell plus overlap).
+    '''
+    def __init__(self, index, core_min, core_max, box_min, box_max):
+        self.index = index
+        self.core_min = core_min
+        self.core_max = core_max
+        self.box_min = box_min
+        self.box_max = box_max
+
+    @property
+    def name(self):
+        return "tile_{}_{}_{}".format(*self.index)
+
+
+def make_tiles(minimum, maximum, grid, overlap: float):
+    '''
+    Split the bounding box into grid[0] x grid[1] x grid[2] cells.
+    :param overlap: overlap of neighboring cells as fraction of the cell size
+    :return: list of Tile
+    '''
+    grid = np.maximum(np.asarray(grid, dtype=int), 1)
+    size = (maximum - minimum) / grid
+    tiles = []
+    for index in itertools.product(*(range(n) for n in grid)):
+        index = np.array(index)
+        low = minimum + index * size
+        high = low + size
+        core_min = np.where(index == 0, -np.inf, low)
+        core_max = np.where(index == grid - 1, np.inf, high)
+        tiles.append(Tile(tuple(int(i) for i in index), core_min, core_max, low - overlap * size,
+                          high + overlap * size))
+    return tiles
+
+
+def reconstruct_tile(settings, config, tile, input_file: str, output_file: str):
+    '''
+    Reconstruct one tile and trim its mesh. Runs in a worker process.
+    :return: tuple (vertices, triangles, colors, finest octree cell size of the tile, ReconstructionRun)
+    '''
+    cloud = o3d.io.read_point_cloud(input_file)
+    plan = None
+    metrics = None
+    if config.depth_auto:
+        # a tile covers a smaller box than the whole scan and gets a lower depth for the same spacing
+        plan = plan_depth(np.asarray(cloud.points), config)
+        config = plan.apply(config)
+        metrics = {"depth_plan": plan.to_dict()}
+    mesh_cache = DiskCache(settings.cache_dir + "mesh", config.mesh_cache_size) if config.mesh_cache_size > 0 else None
+    run = run_reconstruction(settings, config, input_file, output_file, on_output=lambda line: None,
+                             mesh_cache=mesh_cache, metrics=metrics, points_count=len(cloud.points))
+    if run is None or not run.succeeded:
+        raise RuntimeError("PoissonRecon failed for {}".format(tile.name))
+    if plan is not None:
+        report_plan(plan, run)
+    mesh = read_geometry(output_file + ".ply")
+    depth = config.depth_value if config.depth_selected else 8
+    scale = config.scale_value if config.scale_selected else 1.1
+    cell = octree_cell_size(cloud, depth, scale)
+    if mesh is None or not mesh.is_mesh:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int32), np.empty((0, 3)), cell, run
+    vertices, triangles, colors = mesh.vertices, mesh.triangles, mesh.colors
+
+    centroids = vertices[triangles].mean(axis=1)
+    keep = np.all((centroids >= tile.core_min) & (centroids < tile.core_max), axis=1)
+    distances, _ = cKDTree(np.asarray(cloud.points)).query(vertices, distance_upper_bound=SURFACE_DISTANCE * cell)
+    keep &= np.all(np.isfinite(distances)[triangles], axis=1)
+    triangles = triangles[keep]
+
+    used = np.unique(triangles)
+    remap = np.full(len(vertices), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    colors = colors[used] if len(colors) else np.full((len(used), 3), 0.4)
+    return vertices[used], remap[triangles].astype(np.int32), colors, cell, run
+
+
+def weld_seams(vertices, triangles, tile_ids, borders, distance):
+    '''
+    Weld vertices of different tiles which are closer than distance and lie near a cell border.
+    :param tile_ids: tile index of every vertex
+    :param borders: list of (axis, coordinate) of the inner cell borders
+    :param distance: array of the weld distance of every vertex
+    :return: tuple (vertices, labels, triangles) of the welded mesh: labels maps every input vertex to its welded
+             vertex, degenerate triangles are removed
+    '''
+    near = np.zeros(len(vertices), dtype=bool)
+    for axis, coordinate in borders:
+        near |= np.abs(vertices[:, axis] - coordinate) <= 2 * distance
+    candidates = np.flatnonzero(near)
+    n = len(vertices)
+    if len(candidates) > 1:
+        pairs = cKDTree(vertices[candidates]).query_pairs(float(distance[candidates].max()), output_type="ndarray")
+        a, b = candidates[pairs[:, 0]], candidates[pairs[:, 1]]
+        valid = (tile_ids[a] != tile_ids[b]) & (np.linalg.norm(vertices[a] - vertices[b], axis=1)
+                                                 <= np.minimum(distance[a], distance[b]))
+        a, b = a[valid], b[valid]
+        _, labels = connected_components(coo_matrix((np.ones(len(a)), (a, b)), shape=(n, n)), directed=False)
+    else:
+        labels = np.arange(n)
+    # every group of welded vertices becomes one vertex at their mean position
+    counts = np.bincount(labels)
+    welded = np.stack([np.bincount(labels, weights=vertices[:, c]) for c in range(3)], axis=1) / counts[:, None]
+    triangles = labels[triangles]
+    keep = (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & \
+           (triangles[:, 0] != triangles[:, 2])
+    return welded, labels, triangles[keep]
+
+
+def run_tiled_reconstruction(settings, config, cloud, output_file: str, workers: int = None):
+    '''
+    Reconstruct the point cloud tile by tile (see config.tile_grid and config.tile_overlap) and stitch the tiles into
+    one mesh, which is written to output_file + '.ply'.
+    :param cloud: open3d point cloud with normals and colors
+    :param workers: number of tiles reconstructed at the same time, default: config.tile_workers or one per core.
+    :return: tuple (Geometry of the stitched mesh, ReconstructionRun summarizing the tiles)
+    '''
+    start = time.time()
+    points = np.asarray(cloud.points)
+    minimum, maximum = points.min(axis=0), points.max(axis=0)
+    tiles = make_tiles(minimum, maximum, config.tile_grid, config.tile_overlap)
+    tmp_dir = tempfile.mkdtemp(prefix="tiles_", dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        jobs = []
+        for tile in tiles:
+            inside = np.flatnonzero(np.all((points >= tile.box_min) & (points <= tile.box_max), axis=1))
+            if len(inside) < 3:
+                continue
+            input_file = os.path.join(tmp_dir, tile.name + "_input.ply")
+            o3d.io.write_point_cloud(input_file, cloud.select_by_index(inside), compressed=False)
+            jobs.append((tile, input_file, os.path.join(tmp_dir, tile.name)))
+        if not jobs:
+            raise RuntimeError("No tile contained enough points, use a coarser tile_grid")
+        workers, threads = split_cores(len(jobs), workers or config.tile_workers or None)
+        tile_config = with_threads(config, threads)
+        print("[Info] {} tiles, {} at a time with {} threads each".format(len(jobs), workers, threads))
+
+        parts = []
+        runs = []
+        arguments = [(settings, tile_config, tile, input_file, tile_output) for tile, input_file, tile_output in jobs]
+        for (_, _, tile, _, _), result, error in run_jobs(reconstruct_tile, arguments, workers, threads):
+            if error is not None:
+                raise RuntimeError("Failed to reconstruct {}: {}".format(tile.name, error))
+            vertices, triangles, colors, cell, run = result
+            print("[Info] {}: {} triangles, {}".format(tile.name, len(triangles), run))
+            parts.append((vertices, triangles, colors, cell))
+            runs.append(run)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    offsets = np.cumsum([0] + [len(part[0]) for part in parts])
+    vertices = np.concatenate([part[0] for part in parts])
+    colors = np.concatenate([part[2] for part in parts])
+    triangles = np.concatenate([part[1] + offset for part, offset in zip(parts, offsets)])
+    tile_ids = np.repeat(np.arange(len(parts)), [len(part[0]) for part in parts])
+    distance = np.repeat([WELD_DISTANCE * part[3] for part in parts], [len(part[0]) for part in parts])
+    grid = np.maximum(np.asarray(config.tile_grid, dtype=int), 1)
+    borders = [(axis, minimum[axis] + i * (maximum[axis] - minimum[axis]) / grid[axis])
+               for axis in range(3) for i in range(1, grid[axis])]
+    welded, labels, triangles = weld_seams(vertices, triangles, tile_ids, borders, distance)
+    counts = np.bincount(labels)
+    welded_colors = np.stack([np.bincount(labels, weights=colors[:, c]) for c in range(3)], axis=1) / counts[:, None]
+
+    mesh = o3d.geometry.TriangleMesh(o3d.utility.Vector3dVector(welded), o3d.utility.Vector3iVector(triangles))
+    mesh.vertex_colors = o3d.utility.Vector3dVector(welded_colors)
+    mesh.remove_unreferenced_vertices()
+    o3d.io.write_triangle_mesh(output_file + ".ply", mesh)
+    print("[Info] Stitched {} tiles: {} vertices welded, {} triangles".format(
+        len(parts), len(vertices) - len(welded), len(triangles)))
+
+    memory = [run.peak_memory for run in runs if run.peak_memory is not None]
+    run = ReconstructionRun([run.command for run in runs], 0, time.time() - start, max(memory) if memory else None,
+                            cached=bool(runs) and all(run.cached for run in runs))
+    return Geometry(output_file + ".ply", mesh), run
@@ -0,0 +1,34 @@
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+'''
+Configuration of the tests. The modules are imported as src.<Module> from the main directory. The pure numpy and numba
+functions are tested without open3d and xatlas: if they cannot be imported, they are replaced by stubs, and the tests
+marked with open3d are skipped.
+'''
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUBBED = []
+for _name in ("open3d", "xatlas"):
+    try:
+        __import__(_name)
+    except (ImportError, OSError):
+        sys.modules[_name] = mock.MagicMock(name=_name)
+        STUBBED.append(_name)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "open3d: the test needs the real open3d")
+
+
+def pytest_collection_modifyitems(config, items):
+    if "open3d" not in STUBBED:
+        return
+    skip = pytest.mark.skip(reason="open3d could not be imported")
+    for item in items:
+        if "open3d" in item.keywords:
+            item.add_marker(skip)
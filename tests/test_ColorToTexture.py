@@ -0,0 +1,89 @@
+import numpy as np
+
+from src.ColorToTexture import bin_faces, rasterize, rasterize_tiles
+
+
+def reference_rasterize(faces, uv_coordinates, width):
+    '''
+    Sequential pass over all faces and all pixels with the same rule as rasterize_tiles: a pixel belongs to the last
+    face whose barycentric coordinates at the pixel center are all >= -1e-6.
+    '''
+    face_index = np.full((width, width), -1, dtype=np.int32)
+    barycentrics = np.zeros((width, width, 2))
+    centers = (np.stack(np.meshgrid(np.arange(width), np.arange(width), indexing="ij"), axis=-1) + 0.5)
+    for i, face in enumerate(faces):
+        (u1, v1), (u2, v2), (u3, v3) = uv_coordinates[face] * width
+        area = (u2 - u1) * (v3 - v1) - (v2 - v1) * (u3 - u1)
+        if area == 0:
+            continue
+        x, y = centers[..., 0], centers[..., 1]
+        w1 = ((v2 - v3) * x + (u3 - u2) * y + u2 * v3 - u3 * v2) / area
+        w2 = ((v3 - v1) * x + (u1 - u3) * y + u3 * v1 - u1 * v3) / area
+        inside = (w1 >= -1e-6) & (w2 >= -1e-6) & (1 - w1 - w2 >= -1e-6)
+        face_index[inside] = i
+        barycentrics[inside, 0] = w1[inside]
+        barycentrics[inside, 1] = w2[inside]
+    return face_index, barycentrics
+
+
+def random_mesh(faces_count, seed=0):
+    rng = np.random.default_rng(seed)
+    uv_coordinates = rng.random((3 * faces_count, 2))
+    # small and large faces, many of them overlapping
+    centers = np.repeat(rng.random((faces_count, 2)), 3, axis=0)
+    scale = np.repeat(rng.choice([0.02, 0.1, 0.4], faces_count), 3)[:, None]
+    uv_coordinates = np.clip(centers + (uv_coordinates - 0.5) * scale, 0, 1)
+    return np.arange(3 * faces_count).reshape(-1, 3), uv_coordinates
+
+
+def test_rasterize_matches_reference():
+    faces, uv_coordinates = random_mesh(200)
+    face_index, barycentrics = rasterize(faces, uv_coordinates, 96)
+    expected_index, expected_barycentrics = reference_rasterize(faces, uv_coordinates, 96)
+    assert np.array_equal(face_index, expected_index)
+    covered = expected_index >= 0
+    assert covered.any()
+    assert np.allclose(barycentrics[covered], expected_barycentrics[covered], atol=1e-5)
+    assert np.all(barycentrics[~covered] == 0)
+
+
+def test_overlapping_faces_resolve_to_higher_index():
+    uv_coordinates = np.array([[0.1, 0.1], [0.9, 0.1], [0.1, 0.9]])
+    # the same triangle three times, the last one is written as face 2
+    faces = np.array([[0, 1, 2], [1, 2, 0], [2, 0, 1]])
+    face_index, _ = rasterize(faces, uv_coordinates, 64)
+    covered = face_index >= 0
+    assert covered.sum() > 1000
+    assert np.all(face_index[covered] == 2)
+
+
+def test_tile_size_does_not_change_the_result():
+    faces, uv_coordinates = random_mesh(300, seed=1)
+    results = []
+    for tile_size in (8, 17, 64, 128):
+        tile_start, tile_faces = bin_faces(faces, uv_coordinates, 128, tile_size)
+        results.append(rasterize_tiles(faces, uv_coordinates, 128, tile_size, tile_start, tile_faces))
+    for face_index, barycentrics in results[1:]:
+        assert np.array_equal(face_index, results[0][0])
+        assert np.array_equal(barycentrics, results[0][1])
+
+
+def test_bin_faces_sorts_faces_into_touched_tiles():
+    faces, uv_coordinates = random_mesh(100, seed=2)
+    tile_start, tile_faces = bin_faces(faces, uv_coordinates, 64, 16)
+    assert len(tile_start) == 4 * 4 + 1
+    face_index, _ = rasterize(faces, uv_coordinates, 64)
+    for tile in range(16):
+        binned = tile_faces[tile_start[tile]:tile_start[tile + 1]]
+        assert np.all(np.diff(binned) > 0)
+        x0, y0 = (tile % 4) * 16, (tile // 4) * 16
+        # every face visible in the tile was binned into it
+        visible = np.unique(face_index[x0:x0 + 16, y0:y0 + 16])
+        assert set(visible[visible >= 0]) <= set(binned)
+
+
+def test_degenerate_and_outside_faces_cover_nothing():
+    uv_coordinates = np.array([[0.2, 0.2], [0.5, 0.5], [0.8, 0.8], [1.5, 1.5], [1.8, 1.5], [1.5, 1.8]])
+    faces = np.array([[0, 1, 2], [3, 4, 5]])
+    face_index, _ = rasterize(faces, uv_coordinates, 32)
+    assert np.all(face_index == -1)
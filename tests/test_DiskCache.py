@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from src.DiskCache import DiskCache, content_hash
+
+
+def set_last_use(cache, name, timestamp):
+    os.utime(cache.path(name), (timestamp, timestamp))
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    values = np.zeros(1000)
+    cache.store_arrays("a", values=values)
+    entry_size = os.path.getsize(cache.path("a.npz"))
+    cache.max_size = 2.5 * entry_size / (1 << 20)
+    set_last_use(cache, "a.npz", 1000)
+    cache.store_arrays("b", values=values)
+    set_last_use(cache, "b.npz", 2000)
+    # a hit makes a the most recently used file
+    assert cache.load_arrays("a") is not None
+    cache.store_arrays("c", values=values)
+    assert cache.lookup("b.npz") is None
+    assert cache.lookup("a.npz") is not None
+    assert cache.lookup("c.npz") is not None
+    assert cache.size() <= cache.max_size
+
+
+def test_the_added_file_is_kept(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=0)
+    cache.store_arrays("a", values=np.zeros(1000))
+    cache.store_arrays("b", values=np.zeros(1000))
+    assert cache.lookup("a.npz") is None
+    assert cache.load_arrays("b")["values"].shape == (1000,)
+
+
+def test_hits_and_misses(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    assert cache.load_arrays("a") is None
+    cache.store_arrays("a", values=np.arange(3))
+    assert np.array_equal(cache.load_arrays("a")["values"], np.arange(3))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_content_hash_depends_on_content_and_options():
+    a = np.arange(6, dtype=np.float64)
+    assert content_hash(a, depth=8) == content_hash(a.copy(), depth=8)
+    assert content_hash(a, depth=8) != content_hash(a, depth=9)
+    assert content_hash(a) != content_hash(a.reshape(2, 3))
+    assert content_hash(a) != content_hash(a.astype(np.float32))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from src.ImplicitGrid import ImplicitGrid, extract_isosurface
+
+pytestmark = pytest.mark.open3d
+
+
+def sphere_grid(resolution=33, radius_squared=100.0):
+    '''
+    Primal grid of radius_squared - |x|^2 with integer coordinates centered in the grid, so many samples lie exactly on
+    the iso-surface 0.
+    '''
+    x = np.arange(resolution) - (resolution - 1) / 2
+    values = radius_squared - (x[:, None, None] ** 2 + x[None, :, None] ** 2 + x[None, None, :] ** 2)
+    return ImplicitGrid(None, values.astype(np.float32), True, np.zeros(3), 1.0)
+
+
+def mesh_arrays(geometry):
+    return np.asarray(geometry.geometry.vertices), np.asarray(geometry.geometry.triangles)
+
+
+def signed_volume(vertices, triangles):
+    corners = vertices[triangles]
+    return np.einsum("ij,ij->i", corners[:, 0], np.cross(corners[:, 1], corners[:, 2])).sum() / 6
+
+
+@pytest.mark.parametrize("iso_value", [0.0, 0.5, -3.0])
+def test_sphere_is_closed_and_oriented_outside(iso_value):
+    geometry, _ = extract_isosurface(sphere_grid(), iso_value)
+    vertices, triangles = mesh_arrays(geometry)
+    mesh = geometry.geometry
+    assert mesh.is_watertight() and mesh.is_orientable()
+    # the grid spans the unit cube with 32 cells, the sphere has the radius sqrt(100 - iso_value) cells
+    radius = np.sqrt(100.0 - iso_value) / 32
+    center = np.full(3, 0.5)
+    assert signed_volume(vertices - center, triangles) == pytest.approx(4 / 3 * np.pi * radius ** 3, rel=0.05)
+    assert np.allclose(np.linalg.norm(vertices - center, axis=1), radius, atol=1 / 32)
+
+
+def test_samples_on_the_surface_give_no_degenerate_triangles():
+    geometry, _ = extract_isosurface(sphere_grid(), 0.0)
+    vertices, triangles = mesh_arrays(geometry)
+    corners = vertices[triangles]
+    areas = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    assert np.all(areas > 1e-12)
+    assert len(np.unique(vertices, axis=0)) == len(vertices)
+    assert np.array_equal(np.unique(triangles), np.arange(len(vertices)))
+
+
+def test_step_and_region():
+    grid = sphere_grid()
+    coarse, _ = extract_isosurface(grid, 0.0, step=2)
+    full, _ = extract_isosurface(grid, 0.0)
+    assert 0 < len(mesh_arrays(coarse)[1]) < len(mesh_arrays(full)[1])
+    part, _ = extract_isosurface(grid, 0.0, minimum=np.zeros(3), maximum=np.full(3, 0.5))
+    vertices, _ = mesh_arrays(part)
+    assert len(vertices) > 0 and np.all(vertices <= 0.5 + 1e-9)
+
+
+def test_no_surface():
+    grid = ImplicitGrid(None, np.ones((4, 4, 4), dtype=np.float32), True, np.zeros(3), 1.0)
+    geometry, _ = extract_isosurface(grid, 0.0)
+    assert len(mesh_arrays(geometry)[1]) == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src.NormalEstimation import NormalParameters
+from src.PointCloudStream import (PlyWriter, cut_slabs, estimate_normals_streaming, gather_points, positions,
+                                  read_ply_vertices, split_slabs)
+
+
+def write_cloud(path, points, normals=None, colors=None):
+    writer = PlyWriter(path)
+    writer.write(points, np.zeros_like(points) if normals is None else normals,
+                 np.zeros((len(points), 3), dtype=np.uint8) if colors is None else colors)
+    writer.close()
+    return read_ply_vertices(path)
+
+
+def sphere_points(count, seed=0):
+    points = np.random.default_rng(seed).normal(size=(count, 3))
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def test_written_cloud_is_read_back(tmp_path):
+    points = np.random.default_rng(0).random((100, 3))
+    colors = np.random.default_rng(1).integers(0, 256, (100, 3)).astype(np.uint8)
+    vertices = write_cloud(str(tmp_path / "cloud.ply"), points, sphere_points(100), colors)
+    assert vertices.count == 100 and vertices.has_normals and vertices.has_colors
+    data = vertices.memmap()
+    assert np.array_equal(positions(data), points)
+    assert np.array_equal(np.stack((data["red"], data["green"], data["blue"]), axis=1), colors)
+
+
+@pytest.mark.parametrize("last", [False, True])
+def test_gather_points_over_chunks(tmp_path, last):
+    points = np.random.default_rng(0).random((1000, 3))
+    points[:10, 1] = 0.75
+    vertices = write_cloud(str(tmp_path / "cloud.ply"), points)
+    gathered = positions(gather_points(vertices, 64, 1, 0.25, 0.75, last))
+    expected = points[(points[:, 1] >= 0.25) & ((points[:, 1] <= 0.75) if last else (points[:, 1] < 0.75))]
+    # the chunks are read in order, so the order of the points is kept
+    assert np.array_equal(gathered, expected)
+    assert len(gather_points(vertices, 64, 1, 2.0, 3.0, True)) == 0
+
+
+def test_split_slabs_puts_every_point_into_one_slab(tmp_path):
+    points = np.random.default_rng(0).random((5000, 3)) * [1.0, 1.0, 3.0]
+    vertices = write_cloud(str(tmp_path / "cloud.ply"), points)
+    borders = cut_slabs(vertices, 700, 2, points[:, 2].min(), points[:, 2].max(), 1000)
+    assert len(borders) > 4
+    # a point exactly on an inner border belongs to the upper slab
+    points[0, 2] = borders[1]
+    vertices = write_cloud(str(tmp_path / "cloud.ply"), points)
+    slabs = split_slabs(vertices, 700, 2, borders, str(tmp_path))
+    assert sum(slab.count for slab in slabs) == len(points)
+    for i, slab in enumerate(slabs):
+        last = i == len(slabs) - 1
+        expected = gather_points(vertices, 700, 2, borders[i], borders[i + 1], last)
+        assert np.array_equal(np.sort(np.array(slab.memmap()), order=("z", "x")), np.sort(expected, order=("z", "x")))
+    assert slabs[1].memmap()["z"].min() == borders[1]
+
+
+def test_streaming_normals_match_the_estimation_in_one_slab(tmp_path):
+    points = sphere_points(20000) * [1.0, 1.0, 4.0]
+    vertices = write_cloud(str(tmp_path / "cloud.ply"), points)
+    parameters = NormalParameters()
+    results = []
+    for memory_budget in (1.0, 1000.0):
+        writer = PlyWriter(str(tmp_path / "out_{}.ply".format(memory_budget)))
+        estimate_normals_streaming(vertices, writer, parameters, memory_budget)
+        writer.close()
+        data = read_ply_vertices(writer.path).memmap()
+        order = np.lexsort((data["x"], data["y"], data["z"]))
+        results.append((positions(data)[order], np.stack((data["nx"], data["ny"], data["nz"]), axis=1)[order]))
+        # no temporary slab files are left behind
+        assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("slabs_")) == []
+    (sliced_points, sliced_normals), (whole_points, whole_normals) = results
+    assert np.array_equal(sliced_points, whole_points)
+    assert np.allclose(sliced_normals, whole_normals, atol=1e-5)
+    # the ellipsoid is closed, so the consistent orientation points outwards
+    assert np.all(np.einsum("ij,ij->i", sliced_normals, whole_points / [1.0, 1.0, 16.0]) > 0)
@@ -0,0 +1,133 @@
+import os
+import stat
+
+import numpy as np
+import pytest
+
+from src.PointCloudStream import read_ply_vertices
+from src.ReconstructionConfig import ReconstructionConfig
+from src.Settings import Settings
+from src.SurfaceTrimming import _trim_triangles, read_ply_triangles, smooth_values, trim_surface
+
+
+def grid_mesh(n=6):
+    '''
+    :return: tuple (vertices, triangles) of a flat n x n grid of vertices
+    '''
+    x, y = np.meshgrid(np.arange(n, dtype=np.float64), np.arange(n, dtype=np.float64), indexing="ij")
+    vertices = np.stack((x.ravel(), y.ravel(), np.zeros(n * n)), axis=1)
+    index = np.arange(n * n).reshape(n, n)
+    a, b, c, d = index[:-1, :-1].ravel(), index[1:, :-1].ravel(), index[:-1, 1:].ravel(), index[1:, 1:].ravel()
+    triangles = np.concatenate((np.stack((a, b, c), axis=1), np.stack((b, d, c), axis=1)))
+    return vertices, triangles
+
+
+def write_density_mesh(path, vertices, triangles, values):
+    '''
+    Write a binary PLY mesh with a density value per vertex, as PoissonRecon does with --density.
+    '''
+    vertex_data = np.empty(len(vertices), dtype=[("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("value", "<f4")])
+    vertex_data["x"], vertex_data["y"], vertex_data["z"] = vertices.T
+    vertex_data["value"] = values
+    face_data = np.empty(len(triangles), dtype=[("n", "u1"), ("i", "<i4", 3)])
+    face_data["n"] = 3
+    face_data["i"] = triangles
+    header = ("ply\nformat binary_little_endian 1.0\nelement vertex {}\nproperty float x\nproperty float y\n"
+              "property float z\nproperty float value\nelement face {}\nproperty list uchar int vertex_indices\n"
+              "end_header\n").format(len(vertices), len(triangles))
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        vertex_data.tofile(f)
+        face_data.tofile(f)
+
+
+def fake_trimmer(main_dir, script):
+    '''
+    Install a shell script as SurfaceTrimmer of main_dir.
+    :return: Settings of main_dir
+    '''
+    directory = os.path.join(str(main_dir), "ext", "PoissonRecon", "Bin", "Linux")
+    os.makedirs(directory)
+    path = os.path.join(directory, "SurfaceTrimmer")
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n" + script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return Settings(str(main_dir), "Linux")
+
+
+def test_smooth_values_keeps_constant_values():
+    _, triangles = grid_mesh()
+    assert np.allclose(smooth_values(np.full(36, 7.0), triangles, 5), 7.0)
+
+
+def test_smooth_values_averages_with_the_neighbors():
+    values = np.array([0.0, 0.0, 3.0])
+    assert np.array_equal(smooth_values(values, np.array([[0, 1, 2]]), 0), values)
+    # every vertex of a single triangle has the others as neighbors, both edges to a vertex are counted
+    assert np.allclose(smooth_values(values, np.array([[0, 1, 2]]), 1), 1.0)
+
+
+def test_smooth_values_spreads_a_peak_to_the_neighbors_only():
+    vertices, triangles = grid_mesh()
+    values = np.zeros(36)
+    values[14] = 1.0
+    smoothed = smooth_values(values, triangles, 1)
+    neighbors = np.unique(triangles[np.any(triangles == 14, axis=1)])
+    assert np.all(smoothed[neighbors] > 0)
+    assert np.all(smoothed[np.setdiff1d(np.arange(36), neighbors)] == 0)
+    assert smoothed[14] < 1.0
+
+
+def test_read_ply_triangles(tmp_path):
+    vertices, triangles = grid_mesh()
+    path = str(tmp_path / "mesh.ply")
+    write_density_mesh(path, vertices, triangles, np.arange(36))
+    ply_vertices = read_ply_vertices(path)
+    assert "value" in ply_vertices.names
+    assert np.array_equal(read_ply_triangles(ply_vertices), triangles)
+
+
+@pytest.mark.open3d
+def test_trim_triangles_removes_triangles_touching_low_values(tmp_path):
+    vertices, triangles = grid_mesh()
+    path = str(tmp_path / "mesh.ply")
+    write_density_mesh(path, vertices, triangles, np.ones(36))
+    values = np.ones(36)
+    values[0] = 0.0
+    assert _trim_triangles(path, values, 0.5) == len(triangles) - 1
+    assert not os.path.exists(str(tmp_path / "mesh.tmp.ply"))
+
+
+@pytest.mark.open3d
+@pytest.mark.parametrize("script", ["echo failed\nexit 1\n",
+                                    # a half written output which is reported as success
+                                    "head -c 100 \"$2\" > \"$4\"\nexit 0\n"])
+def test_failed_trimmer_leaves_the_mesh_to_the_fallback(tmp_path, script):
+    settings = fake_trimmer(tmp_path / "main", script)
+    vertices, triangles = grid_mesh()
+    values = np.full(36, 8.0)
+    values[:6] = 1.0
+    path = str(tmp_path / "mesh.ply")
+    write_density_mesh(path, vertices, triangles, values)
+    config = ReconstructionConfig(trim_percentile=10, trim_smooth=0)
+    statistics = trim_surface(settings, config, path)
+    assert not statistics.trimmer
+    # the fallback masked the triangles of the original mesh: the row of triangles along the low values is removed
+    assert statistics.triangles_before == len(triangles)
+    assert statistics.triangles_after == len(triangles) - 10
+    assert not os.path.exists(str(tmp_path / "mesh.tmp.ply"))
+
+
+def test_trimmer_output_replaces_the_mesh(tmp_path):
+    # the fake trimmer keeps the first two triangles
+    vertices, triangles = grid_mesh()
+    trimmed_path = str(tmp_path / "trimmed.ply")
+    write_density_mesh(trimmed_path, vertices, triangles[:2], np.ones(36))
+    settings = fake_trimmer(tmp_path / "main", "cp {} \"$4\"\n".format(trimmed_path))
+    path = str(tmp_path / "mesh.ply")
+    write_density_mesh(path, vertices, triangles, np.arange(36))
+    statistics = trim_surface(settings, ReconstructionConfig(trim_percentile=10), path)
+    assert statistics.trimmer
+    assert (statistics.triangles_before, statistics.triangles_after) == (len(triangles), 2)
+    assert np.array_equal(read_ply_triangles(read_ply_vertices(path)), triangles[:2])
+    assert not os.path.exists(str(tmp_path / "mesh.tmp.ply"))
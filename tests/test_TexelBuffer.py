@@ -0,0 +1,49 @@
+import numpy as np
+
+from src.ColorToTexture import rasterize
+from src.TexelBuffer import TexelBuffer, texel_key
+
+
+def make_buffer(width=32):
+    vertices = np.array([[0.0, 0.0, 1.0], [2.0, 0.0, 3.0], [0.0, 4.0, 5.0], [2.0, 4.0, 7.0]])
+    faces = np.array([[0, 1, 2], [1, 3, 2]])
+    uv_coordinates = vertices[:, :2] / np.array([2.0, 4.0])
+    face_index, barycentrics = rasterize(faces, uv_coordinates, width)
+    key = texel_key(vertices, faces, width)
+    return vertices, TexelBuffer(face_index, barycentrics, faces.astype(np.int32), key, np.zeros(5))
+
+
+def test_gather_interpolates_linear_values():
+    vertices, texels = make_buffer()
+    positions = texels.gather(vertices)
+    covered = texels.coverage
+    assert covered.all()
+    # the pixel centers in UV space are the positions scaled to the unit square
+    x, y = np.meshgrid(np.arange(32) + 0.5, np.arange(32) + 0.5, indexing="ij")
+    assert np.allclose(positions[..., 0], x / 16, atol=1e-5)
+    assert np.allclose(positions[..., 1], y / 8, atol=1e-5)
+    assert texels.gather(vertices[:, 2]).shape == (32, 32)
+
+
+def test_gather_integer_dtype_truncates_and_leaves_uncovered_pixels_zero():
+    vertices, texels = make_buffer()
+    texels.face_index[:4] = -1
+    values = np.full((4, 3), 200.7)
+    values[:, 1] = 99.9
+    result = texels.gather(values, np.uint8)
+    assert result.dtype == np.uint8
+    assert np.all(result[:4] == 0)
+    assert np.all(result[4:, :, 0] == 200)
+    assert np.all(result[4:, :, 1] == 99)
+
+
+def test_save_and_load(tmp_path):
+    _, texels = make_buffer()
+    path = str(tmp_path / "mesh_texels")
+    texels.save(path)
+    loaded = TexelBuffer.load(path, texels.key)
+    assert np.array_equal(loaded.face_index, texels.face_index)
+    assert np.array_equal(loaded.barycentrics, texels.barycentrics)
+    assert np.array_equal(loaded.faces, texels.faces)
+    assert TexelBuffer.load(path, "another mesh") is None
+    assert TexelBuffer.load(str(tmp_path / "missing")) is None
@@ -0,0 +1,60 @@
+import numpy as np
+
+from src.TiledReconstruction import make_tiles, weld_seams
+
+
+def two_tiles(gap):
+    '''
+    Two strips of triangles meeting at the border x = 0, the vertices of the right strip are moved by gap along x.
+    '''
+    left = np.array([[-1.0, 0.0, 0.0], [0.0, 0.0, 0.0], [-1.0, 1.0, 0.0], [0.0, 1.0, 0.0]])
+    right = np.array([[gap, 0.0, 0.0], [1.0, 0.0, 0.0], [gap, 1.0, 0.0], [1.0, 1.0, 0.0]])
+    vertices = np.concatenate((left, right))
+    triangles = np.array([[0, 1, 2], [1, 3, 2], [4, 5, 6], [5, 7, 6]])
+    tile_ids = np.array([0, 0, 0, 0, 1, 1, 1, 1])
+    return vertices, triangles, tile_ids
+
+
+def test_vertices_of_different_tiles_at_the_border_are_welded():
+    vertices, triangles, tile_ids = two_tiles(0.01)
+    welded, labels, welded_triangles = weld_seams(vertices, triangles, tile_ids, [(0, 0.0)], np.full(8, 0.05))
+    assert len(welded) == 6
+    assert labels[1] == labels[4] and labels[3] == labels[6]
+    assert np.allclose(welded[labels[1]], [0.005, 0.0, 0.0])
+    assert len(welded_triangles) == 4
+    # the welded triangles refer to the same positions as before, up to the welding
+    assert np.allclose(welded[welded_triangles], vertices[triangles], atol=0.01)
+
+
+def test_vertices_beyond_the_distance_are_not_welded():
+    vertices, triangles, tile_ids = two_tiles(0.1)
+    welded, labels, welded_triangles = weld_seams(vertices, triangles, tile_ids, [(0, 0.0)], np.full(8, 0.05))
+    assert len(welded) == 8
+    assert np.array_equal(welded[labels], vertices)
+    assert np.array_equal(welded_triangles, triangles)
+
+
+def test_vertices_of_the_same_tile_are_not_welded():
+    vertices, triangles, tile_ids = two_tiles(0.01)
+    welded, _, _ = weld_seams(vertices, triangles, np.zeros(8, dtype=int), [(0, 0.0)], np.full(8, 0.05))
+    assert len(welded) == 8
+
+
+def test_collapsed_triangles_are_removed():
+    vertices = np.array([[0.0, 0.0, 0.0], [0.001, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 0.0, 0.0]])
+    triangles = np.array([[0, 1, 2], [0, 3, 2]])
+    tile_ids = np.array([0, 1, 0, 0])
+    welded, labels, welded_triangles = weld_seams(vertices, triangles, tile_ids, [(0, 0.0)], np.full(4, 0.01))
+    assert labels[0] == labels[1]
+    assert np.array_equal(welded_triangles, labels[triangles[1:]])
+
+
+def test_every_point_lies_in_exactly_one_core():
+    tiles = make_tiles(np.zeros(3), np.array([4.0, 2.0, 1.0]), (2, 2, 1), 0.1)
+    assert len(tiles) == 4
+    points = np.random.default_rng(0).random((1000, 3)) * [4.0, 2.0, 1.0]
+    inside = np.array([np.all((points >= tile.core_min) & (points < tile.core_max), axis=1) for tile in tiles])
+    assert np.all(inside.sum(axis=0) == 1)
+    for tile in tiles:
+        # the reconstructed box is the cell grown by 10% of the cell size
+        assert np.allclose(tile.box_max - tile.box_min, [2.4, 1.2, 1.2])